@@ -7,5 +7,15 @@
 from packaging.version import Version
 from .version import __version__, __doc__, __details__
 
-from .gooogle_generativeai import GoogleGenerativeAI
-from .openai import OpenAIModel
\ No newline at end of file
+from ._lazy import lazy_module
+
+# Heavy SDKs (openai, google.generativeai...) are imported only when a name is accessed
+_lazy_imports = {
+    'GoogleGenerativeAI': '.gooogle_generativeai',
+    'AsyncGoogleGenerativeAI': '.gooogle_generativeai',
+    'OpenAIModel': '.openai',
+    'AsyncOpenAIModel': '.openai',
+}
+
+__all__ = list(_lazy_imports)
+__getattr__, __dir__ = lazy_module(__name__, _lazy_imports)
@@ -0,0 +1,96 @@
+## \file ../src/ai/_experiments/import_time.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Import-time benchmark of the `src.ai` entry points.
+
+Every entry point is imported in a fresh interpreter with `python -X importtime`.
+The script fails (exit code 1) if
+- the cumulative import time exceeds the recorded budget by more than `--tolerance`, or
+- a heavy SDK from `FORBIDDEN` is pulled in by a package import.
+
+@code
+python import_time.py --update      # record the budget on a reference machine
+python import_time.py               # check against the budget
+@endcode
+"""
+
+import header
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from statistics import median
+
+ENTRY_POINTS: list = [
+    'src.ai',
+    'src.ai.openai',
+    'src.ai.openai.model',
+    'src.ai.gooogle_generativeai',
+    'src.ai.openai.bots',
+]
+
+# Modules that must not be loaded by importing the package
+FORBIDDEN: list = ['openai._client', 'google.generativeai', 'pandas', 'discord', 'speech_recognition', 'pydub', 'gtts']
+
+BUDGET_PATH: Path = Path(__file__).parent / 'import_time_budget.json'
+
+
+def measure(module: str, runs: int = 5) -> tuple[int, set]:
+    """Import `module` `runs` times in a fresh interpreter.
+
+    Returns:
+        tuple[int, set]: Median cumulative import time in microseconds and the set of imported modules.
+    """
+    times = []
+    imported = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=header.__root__, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line.split('|')
+            name = name.strip()
+            imported.add(name)
+            if name == module:
+                times.append(int(cumulative))
+    return int(median(times)), imported
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--update', action='store_true', help='record the current times as the budget')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown over the budget (0.25 = 25%%)')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    budget = json.loads(BUDGET_PATH.read_text()) if BUDGET_PATH.exists() else {}
+    failed = False
+    results = {}
+    for module in ENTRY_POINTS:
+        us, imported = measure(module, args.runs)
+        results[module] = us
+        heavy = [m for m in FORBIDDEN if m in imported]
+        limit = budget.get(module)
+        status = 'ok'
+        if heavy:
+            status = f'FAIL: imports {heavy}'
+            failed = True
+        elif limit and not args.update and us > limit * (1 + args.tolerance):
+            status = f'FAIL: budget {limit} us'
+            failed = True
+        print(f"{module:32} {us / 1000:8.1f} ms  {status}")
+
+    if args.update:
+        BUDGET_PATH.write_text(json.dumps(results, indent=2))
+        print(f"Budget saved to {BUDGET_PATH}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+## \file ../src/ai/_experiments/router_hedging.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Benchmark: latency of `ProviderRouter` with and without hedging.
+
+Two local fake providers stand in for OpenAI and Gemini: mostly fast, with a slow tail
+and a share of errors. The script needs no network and no API keys.
+"""
+
+import header
+import random
+import time
+from statistics import quantiles
+
+from src.ai.router import ProviderRouter
+
+
+class FakeProvider:
+    """`ask()` with a latency of `fast` seconds, `slow` seconds with probability `tail`, and `errors` share of failures."""
+
+    def __init__(self, model_name: str, fast: float, slow: float, tail: float, errors: float = 0.0, seed: int = 0):
+        self.model_name = model_name
+        self.fast, self.slow, self.tail, self.errors = fast, slow, tail, errors
+        self.random = random.Random(seed)
+
+    def ask(self, prompt: str, **kwargs) -> str | None:
+        time.sleep(self.slow if self.random.random() < self.tail else self.fast)
+        if self.random.random() < self.errors:
+            return None
+        return f'{{"{self.model_name}": "{prompt}"}}'
+
+
+def run(hedge: bool, asks: int = 200) -> None:
+    router = ProviderRouter(
+        [
+            FakeProvider('gpt-4o', fast=0.02, slow=0.3, tail=0.05, errors=0.02, seed=1),
+            FakeProvider('gemini-1.5-flash', fast=0.03, slow=0.3, tail=0.05, errors=0.02, seed=2),
+        ],
+        hedge=hedge, hedge_percentile=0.9,
+    )
+    latencies = []
+    failed = 0
+    for i in range(asks):
+        started = time.perf_counter()
+        failed += router.ask(f'prompt {i}') is None
+        latencies.append(time.perf_counter() - started)
+    router.close()
+    cut = quantiles(latencies, n=100)
+    print(f"hedge={hedge!s:5}: p50 {cut[49] * 1000:6.1f} ms, p99 {cut[98] * 1000:6.1f} ms, failed {failed}")
+    for name, stats in router.stats().items():
+        print(f"    {name:18} calls {stats['calls']:4} wins {stats['wins']:4} hedges {stats['hedges']:3} "
+              f"error rate {stats['error_rate']:.2f}")
+
+
+if __name__ == '__main__':
+    run(hedge=False)
+    run(hedge=True)
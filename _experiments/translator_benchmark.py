@@ -0,0 +1,70 @@
+## \file ../src/ai/_experiments/translator_benchmark.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Benchmark: `TranslationEngine` against one request per string.
+
+A local fake model translates a JSON object of strings with a fixed latency per request
+plus a small cost per string, and sometimes drops a string from its reply. The catalog has
+repeated titles, as real product lists do. The script needs no network and no API keys.
+"""
+
+import header
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from src.ai.openai.translator import TranslationEngine
+
+
+class FakeTranslator:
+    """`ask()` answering a JSON object of strings after `latency` + `per_string` seconds."""
+
+    def __init__(self, latency: float = 0.3, per_string: float = 0.005, drop: float = 0.01, seed: int = 0):
+        self.latency, self.per_string, self.drop = latency, per_string, drop
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def ask(self, prompt: str, system_instruction: str = None, **kwargs) -> str:
+        strings = json.loads(prompt)
+        with self.lock:
+            self.requests += 1
+            kept = {key: value.upper() for key, value in strings.items() if self.random.random() >= self.drop}
+        time.sleep(self.latency + self.per_string * len(strings))
+        return json.dumps(kept, ensure_ascii=False)
+
+
+def catalog(size: int, unique: int, seed: int = 1) -> list:
+    rnd = random.Random(seed)
+    titles = [f'товар {i}: {" ".join(rnd.choice("abcdefghij") * 3 for _ in range(6))}' for i in range(unique)]
+    # Popular titles repeat more often
+    return [titles[min(int(rnd.paretovariate(1.2)) - 1, unique - 1)] if rnd.random() < 0.5 else rnd.choice(titles)
+            for _ in range(size)]
+
+
+def run(name: str, engine: TranslationEngine, texts: list, model: FakeTranslator) -> None:
+    requests = model.requests
+    translations = engine.translate_many(texts, 'Russian', 'English')
+    stats = engine.stats()
+    missing = sum(t is None for t in translations)
+    print(f"{name:<28} {stats['strings_per_second']:8.1f} strings/s, hit rate {stats['hit_rate']:.2f}, "
+          f"requests {model.requests - requests}, untranslated {missing}")
+
+
+if __name__ == '__main__':
+    texts = catalog(size=2000, unique=1200)
+    with tempfile.TemporaryDirectory() as tmp:
+        model = FakeTranslator()
+        # The old path: one sequential request per string, no translation memory (first 100 strings)
+        started = time.perf_counter()
+        for text in texts[:100]:
+            model.ask(json.dumps({'0': text}, ensure_ascii=False))
+        print(f"{'one request per string':<28} {100 / (time.perf_counter() - started):8.1f} strings/s, requests 100")
+
+        engine = TranslationEngine(model.ask, Path(tmp) / 'memory.sqlite', batch_size=40, concurrency=8)
+        run('engine, cold memory', engine, texts, model)
+        engine = TranslationEngine(model.ask, Path(tmp) / 'memory.sqlite', batch_size=40, concurrency=8)
+        run('engine, warm memory', engine, texts + catalog(size=500, unique=1500, seed=2), model)
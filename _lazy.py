@@ -0,0 +1,44 @@
+## \file ../src/ai/_lazy.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Lazy re-exports of the `src.ai` packages.
+
+A package lists the names it re-exports and the submodule of each; the submodule (and the
+heavy SDK behind it) is imported only when the name is first accessed.
+
+@code
+_lazy_imports = {'OpenAIModel': '.training'}
+__all__ = list(_lazy_imports)
+__getattr__, __dir__ = lazy_module(__name__, _lazy_imports)
+@endcode
+"""
+
+import sys
+from importlib import import_module
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def lazy_module(name: str, imports: Dict[str, str]) -> Tuple[Callable[[str], Any], Callable[[], List[str]]]:
+    """Build the module-level `__getattr__` and `__dir__` of package `name`.
+
+    Args:
+        name (str): `__name__` of the package.
+        imports (Dict[str, str]): Exported name -> submodule, relative to the package (`'.training'`).
+
+    Returns:
+        Tuple[Callable[[str], Any], Callable[[], List[str]]]: `__getattr__` and `__dir__` for the package.
+    """
+    def __getattr__(attr: str) -> Any:
+        module = imports.get(attr)
+        if module is None:
+            raise AttributeError(f"module {name!r} has no attribute {attr!r}")
+        value = getattr(import_module(module, name), attr)
+        # Following accesses find the name directly, without `__getattr__`
+        setattr(sys.modules[name], attr, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(vars(sys.modules[name])) | set(imports))
+
+    return __getattr__, __dir__
@@ -0,0 +1,130 @@
+## \file ../src/ai/batch.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Concurrent batch execution of `ask()` calls.
+
+The helpers run an `ask` callable over many prompts with bounded parallelism.
+Each prompt produces a `BatchResult`; an exception in one item is stored in the
+result and does not abort the batch.
+
+@code
+for result in model.ask_many(prompts, concurrency=8, stream=True):
+    if result.ok:
+        save(result.index, result.response)
+    else:
+        logger.error(f"Prompt {result.index} failed", result.error)
+@endcode
+"""
+
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+class BatchResult:
+    """Result of one prompt of a batch."""
+
+    __slots__ = ('index', 'prompt', 'response', 'error')
+
+    def __init__(self, index: int, prompt: Any, response: Any = None, error: Optional[BaseException] = None):
+        self.index = index
+        self.prompt = prompt
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """`True` if the call did not raise and returned a non-empty response."""
+        return self.error is None and bool(self.response)
+
+    def __repr__(self) -> str:
+        return f"BatchResult(index={self.index}, ok={self.ok}, error={self.error!r})"
+
+
+def iter_ask_many(ask: Callable[..., Any], prompts: Iterable[Any], concurrency: int = 4, **kwargs) -> Iterator[BatchResult]:
+    """Run `ask(prompt, **kwargs)` for every prompt in a thread pool and yield results as they complete.
+
+    Prompts are consumed lazily: at most `concurrency` calls are in flight, so a generator
+    reading thousands of files never loads them all at once.
+
+    Args:
+        ask (Callable[..., Any]): The function sending one prompt.
+        prompts (Iterable[Any]): Prompts to send.
+        concurrency (int, optional): Max number of parallel calls. Defaults to 4.
+        **kwargs: Extra keyword arguments for `ask`.
+
+    Yields:
+        BatchResult: Results in completion order.
+    """
+    concurrency = max(1, concurrency)
+    prompts = enumerate(prompts)
+    pending: Dict[Future, tuple] = {}
+
+    def submit(executor: ThreadPoolExecutor) -> bool:
+        try:
+            index, prompt = next(prompts)
+        except StopIteration:
+            return False
+        pending[executor.submit(ask, prompt, **kwargs)] = (index, prompt)
+        return True
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ask_many') as executor:
+        while len(pending) < concurrency and submit(executor):
+            pass
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, prompt = pending.pop(future)
+                error = future.exception()
+                yield BatchResult(index, prompt, None if error else future.result(), error)
+                submit(executor)
+
+
+def ask_many(ask: Callable[..., Any], prompts: Iterable[Any], concurrency: int = 4, **kwargs) -> List[BatchResult]:
+    """Run `ask` over the prompts in parallel and return the results in input order.
+
+    See `iter_ask_many` for the arguments.
+    """
+    return sorted(iter_ask_many(ask, prompts, concurrency, **kwargs), key=lambda r: r.index)
+
+
+async def aiter_ask_many(ask: Callable[..., Awaitable[Any]], prompts: Iterable[Any], concurrency: int = 4, **kwargs) -> AsyncIterator[BatchResult]:
+    """Asyncio variant of `iter_ask_many`: run the coroutine `ask` with at most `concurrency` tasks in flight.
+
+    Cancelling the consumer cancels every running call.
+
+    Yields:
+        BatchResult: Results in completion order.
+    """
+    concurrency = max(1, concurrency)
+    prompts = enumerate(prompts)
+    pending: Dict[asyncio.Task, tuple] = {}
+
+    def submit() -> bool:
+        try:
+            index, prompt = next(prompts)
+        except StopIteration:
+            return False
+        pending[asyncio.ensure_future(ask(prompt, **kwargs))] = (index, prompt)
+        return True
+
+    try:
+        while len(pending) < concurrency and submit():
+            pass
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, prompt = pending.pop(task)
+                error = asyncio.CancelledError() if task.cancelled() else task.exception()
+                yield BatchResult(index, prompt, None if error else task.result(), error)
+                submit()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def aask_many(ask: Callable[..., Awaitable[Any]], prompts: Iterable[Any], concurrency: int = 4, **kwargs) -> List[BatchResult]:
+    """Asyncio variant of `ask_many`: results in input order."""
+    results = [result async for result in aiter_ask_many(ask, prompts, concurrency, **kwargs)]
+    return sorted(results, key=lambda r: r.index)
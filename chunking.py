@@ -0,0 +1,179 @@
+## \file ../src/ai/chunking.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Token-bounded chunking of large line lists with parallel fan-out and JSON merge.
+
+A text (e.g. `product_titles.txt`) is split by lines into chunks of at most `max_tokens`,
+the chunks of every text are sent together through the `ask_many()` of a model, and the
+JSON replies of one text are merged in chunk order into one result. Chunks that fail or
+return invalid JSON are re-sent on their own, bypassing the model's response cache, so one
+bad chunk never forces the whole text to be processed again.
+
+@code
+results = ask_chunked_many(model.ask_many, texts, max_tokens=2000, count=model.token_counter.count)
+for result in results:
+    if result.ok:
+        save(result.response)       # merged dict
+    else:
+        logger.error(f"Chunks {result.failed} failed")
+@endcode
+"""
+
+import json
+import re
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence
+
+from src.logger import logger
+from src.ai.batch import BatchResult
+from src.ai.dialogue_memory import estimate_tokens
+
+# The model reply may be wrapped in ```json ... ```
+_FENCE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.S)
+
+
+def iter_chunks(lines: Iterable[str], max_tokens: int, count: Callable[[str], int] = estimate_tokens) -> Iterator[List[str]]:
+    """Lazily group lines into chunks of at most `max_tokens` tokens, keeping their order.
+
+    Only the current chunk is held in memory, so `lines` may be a stream of any size.
+    Empty lines are skipped. A line longer than `max_tokens` makes a chunk of its own.
+
+    Args:
+        lines (Iterable[str]): Lines to group.
+        max_tokens (int): Token budget of one chunk.
+        count (Callable[[str], int], optional): Token counter. Defaults to `estimate_tokens`.
+
+    Yields:
+        List[str]: Chunks of lines.
+    """
+    chunk: List[str] = []
+    tokens = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        line_tokens = count(line) + 1  # + line break
+        if chunk and tokens + line_tokens > max_tokens:
+            yield chunk
+            chunk, tokens = [], 0
+        chunk.append(line)
+        tokens += line_tokens
+    if chunk:
+        yield chunk
+
+
+def chunk_lines(lines: Iterable[str], max_tokens: int, count: Callable[[str], int] = estimate_tokens) -> List[List[str]]:
+    """Group lines into chunks of at most `max_tokens` tokens. See `iter_chunks`.
+
+    Returns:
+        List[List[str]]: Chunks of lines.
+    """
+    return list(iter_chunks(lines, max_tokens, count))
+
+
+def parse_json(text: Optional[str]) -> Any:
+    """Parse a JSON reply, stripping a Markdown code fence. Returns `None` if the reply is not JSON."""
+    if not text:
+        return None
+    match = _FENCE.match(text)
+    try:
+        return json.loads(match.group(1) if match else text)
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_json(parts: Sequence[Any]) -> Any:
+    """Merge JSON values deterministically in the given order.
+
+    - dicts are merged key by key (recursively), keys keep the order of their first appearance;
+    - lists are concatenated;
+    - for other values the first non-empty one wins.
+    """
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return None
+    if all(isinstance(p, dict) for p in parts):
+        keys: dict = {}
+        for part in parts:
+            for key, value in part.items():
+                keys.setdefault(key, []).append(value)
+        return {key: merge_json(values) for key, values in keys.items()}
+    if all(isinstance(p, list) for p in parts):
+        return [item for part in parts for item in part]
+    return next((p for p in parts if p not in ('', [], {})), parts[0])
+
+
+class ChunkedResult:
+    """Merged result of one chunked text."""
+
+    __slots__ = ('index', 'chunks', 'responses', 'failed', 'errors', 'response')
+
+    def __init__(self, index: int, chunks: List[str]):
+        self.index = index
+        self.chunks = chunks  # prompts of the chunks
+        self.responses: List[Any] = [None] * len(chunks)  # parsed JSON of every chunk
+        self.failed: List[int] = []  # chunks without a valid reply after every attempt
+        self.errors: dict = {}  # chunk -> last error
+        self.response: Any = None  # merged JSON
+
+    @property
+    def ok(self) -> bool:
+        """`True` if every chunk returned valid JSON."""
+        return not self.failed and self.response is not None
+
+    def __repr__(self) -> str:
+        return f"ChunkedResult(index={self.index}, chunks={len(self.chunks)}, failed={self.failed})"
+
+
+def ask_chunked_many(ask_many: Callable[[List[str]], List[BatchResult]], texts: Iterable[str], max_tokens: int,
+                     count: Callable[[str], int] = estimate_tokens, attempts: int = 2,
+                     make_prompt: Callable[[List[str]], str] = '\n'.join,
+                     merge: Callable[[Sequence[Any]], Any] = merge_json) -> List[ChunkedResult]:
+    """Split every text into chunks, send all chunks in parallel and merge the replies per text.
+
+    Args:
+        ask_many (Callable[[List[str]], List[BatchResult]]): `ask_many` of a model - results in input order.
+            Retry rounds call it with `use_cache=False`, which `ask_many` passes to the model's `ask()`.
+        texts (Iterable[str]): Texts to process, one line per item.
+        max_tokens (int): Token budget of the lines of one chunk.
+        count (Callable[[str], int], optional): Token counter of the model. Defaults to `estimate_tokens`.
+        attempts (int, optional): Rounds of sending a chunk without a valid reply. Defaults to 2.
+        make_prompt (Callable[[List[str]], str], optional): Builds the prompt of a chunk. Defaults to joining the lines.
+        merge (Callable[[Sequence[Any]], Any], optional): Merges the parsed replies of one text. Defaults to `merge_json`.
+
+    Returns:
+        List[ChunkedResult]: One result per text, in input order.
+    """
+    results = [
+        ChunkedResult(index, [make_prompt(chunk) for chunk in chunk_lines(text.splitlines(), max_tokens, count)])
+        for index, text in enumerate(texts)
+    ]
+    pending = [(result, i) for result in results for i in range(len(result.chunks))]
+
+    for attempt in range(max(1, attempts)):
+        if not pending:
+            break
+        if attempt:
+            logger.info(f"Retrying {len(pending)} chunks, attempt {attempt + 1}")
+        # Retry rounds bypass the response cache: otherwise the same invalid reply would come back from it
+        replies = ask_many([result.chunks[i] for result, i in pending], **({'use_cache': False} if attempt else {}))
+        retry = []
+        for (result, i), reply in zip(pending, replies):
+            parsed = parse_json(reply.response) if reply.error is None else None
+            if parsed is None:
+                result.errors[i] = reply.error or ValueError(f"Invalid JSON reply: {str(reply.response)[:200]!r}")
+                retry.append((result, i))
+            else:
+                result.responses[i] = parsed
+                result.errors.pop(i, None)
+        pending = retry
+
+    for result in results:
+        result.failed = sorted(result.errors)
+        result.response = merge([r for r in result.responses if r is not None])
+    return results
+
+
+def ask_chunked(ask_many: Callable[[List[str]], List[BatchResult]], text: str, max_tokens: int, **kwargs) -> ChunkedResult:
+    """Chunk one text. See `ask_chunked_many` for the arguments."""
+    return ask_chunked_many(ask_many, [text], max_tokens, **kwargs)[0]
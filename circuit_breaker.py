@@ -0,0 +1,199 @@
+## \file ../src/ai/circuit_breaker.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Circuit breaker of a provider.
+
+- closed: calls go through; the outcomes of the last `window` calls are recorded.
+  When at least `min_calls` were made and the failure rate reaches `failure_rate`, the breaker opens.
+- open: calls fail at once with `CircuitOpenError`, without touching the API.
+  After `open_timeout` seconds the breaker becomes half-open.
+- half-open: up to `half_open_probes` calls go through as probes. A successful probe closes
+  the breaker, a failed one opens it again.
+
+Only provider health errors (those `is_retryable` accepts: rate limits, timeouts, 5xx) count
+as failures; a bad request says nothing about the provider.
+
+@code
+breaker = get_circuit_breaker('openai')
+try:
+    reply = breaker.call(send_request, messages)
+except CircuitOpenError:
+    reply = fallback(messages)
+get_circuit_status()   # {'openai': {'state': 'open', 'failure_rate': 0.8, 'retry_in': 12.5, ...}}
+@endcode
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+
+from src.logger import logger
+from src.ai.retry import is_retryable
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open. `RetryPolicy` treats it as fatal."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit of {name} is open, retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of call outcomes."""
+
+    name: str
+    state: str
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 open_timeout: float = 30.0, half_open_probes: int = 1,
+                 classify: Callable[[BaseException], bool] = is_retryable):
+        """
+        Args:
+            name (str): Provider name in logs and in `get_circuit_status()`.
+            window (int, optional): Number of recent calls the failure rate is computed over. Defaults to 20.
+            min_calls (int, optional): Calls in the window before the breaker may open. Defaults to 5.
+            failure_rate (float, optional): Failure rate that opens the breaker. Defaults to 0.5.
+            open_timeout (float, optional): Seconds the breaker stays open before probing. Defaults to 30.
+            half_open_probes (int, optional): Concurrent probe calls in the half-open state. Defaults to 1.
+            classify (Callable[[BaseException], bool], optional): Returns `True` for errors that count as failures.
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_timeout = open_timeout
+        self.half_open_probes = half_open_probes
+        self.classify = classify
+        self.state = CLOSED
+        self._outcomes: deque = deque(maxlen=window)
+        self._opened = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.rejected = 0  # calls rejected without reaching the API
+        self.opened_count = 0
+
+    def _retry_in(self) -> float:
+        return max(0.0, self._opened + self.open_timeout - time.monotonic())
+
+    @property
+    def available(self) -> bool:
+        """`True` if a call would not be rejected now. Does not take a probe slot."""
+        with self._lock:
+            if self.state == OPEN:
+                return self._retry_in() == 0
+            if self.state == HALF_OPEN:
+                return self._probes < self.half_open_probes
+            return True
+
+    def before_call(self) -> None:
+        """Admit a call or raise `CircuitOpenError`. Must be followed by `success()` or `failure()`."""
+        with self._lock:
+            if self.state == OPEN:
+                if self._retry_in() > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self._retry_in())
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit {self.name}: half-open")
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probes += 1
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.info(f"Circuit {self.name}: closed")
+            self._outcomes.append(True)
+
+    def failure(self, ex: BaseException) -> None:
+        if not self.classify(ex):
+            # An error of the request, not of the provider: the half-open probe is released
+            with self._lock:
+                if self.state == HALF_OPEN:
+                    self._probes = max(0, self._probes - 1)
+            return
+        with self._lock:
+            self._outcomes.append(False)
+            if self.state == HALF_OPEN or (
+                len(self._outcomes) >= self.min_calls and self._rate() >= self.failure_rate
+            ):
+                self._open(ex)
+
+    def _rate(self) -> float:
+        return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def _open(self, ex: BaseException) -> None:
+        self.state = OPEN
+        self._opened = time.monotonic()
+        self.opened_count += 1
+        logger.warning(f"Circuit {self.name}: open for {self.open_timeout}s after {type(ex).__name__}: {ex}")
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call `fn(*args, **kwargs)` through the breaker.
+
+        Raises:
+            CircuitOpenError: The breaker is open.
+        """
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as ex:
+            self.failure(ex)
+            raise
+        self.success()
+        return result
+
+    async def call_async(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Coroutine variant of `call()`. A cancelled call is not counted."""
+        self.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as ex:
+            self.failure(ex)
+            raise
+        except BaseException:
+            with self._lock:
+                if self.state == HALF_OPEN:
+                    self._probes = max(0, self._probes - 1)
+            raise
+        self.success()
+        return result
+
+    def status(self) -> dict:
+        """Current state, failure rate of the window, seconds until the next probe and counters."""
+        with self._lock:
+            return {
+                'state': self.state,
+                'failure_rate': self._rate(),
+                'calls_in_window': len(self._outcomes),
+                'retry_in': self._retry_in() if self.state == OPEN else 0.0,
+                'opened': self.opened_count,
+                'rejected': self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Return the process-wide breaker `name`, creating it with `kwargs` on the first call."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if not breaker:
+            breaker = _breakers[name] = CircuitBreaker(name, **kwargs)
+        return breaker
+
+
+def get_circuit_status() -> Dict[str, dict]:
+    """Return the status of every breaker by name."""
+    return {name: breaker.status() for name, breaker in _breakers.items()}
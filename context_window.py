@@ -0,0 +1,170 @@
+## \file ../src/ai/context_window.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Token counting and context window management.
+
+- `TokenCounter` counts the tokens of a text once and caches the result. It uses `tiktoken`
+  when it is installed and falls back to a ~4 characters per token estimate.
+- `ContextWindow` fits the system instruction, the conversation history and the new message
+  into the token budget of a model, dropping (or summarizing) the oldest turns. History turns
+  carry their token count (`Turn.tokens`), so fitting never re-tokenizes the history.
+- `TokenUsage` accumulates prompt/completion tokens reported by the provider.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+from src.logger import logger
+from src.ai.dialogue_memory import Turn, estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Service tokens the API adds to every chat message
+MESSAGE_OVERHEAD: int = 4
+
+
+class TokenCounter:
+    """Cached token counter of one model."""
+
+    def __init__(self, model: Optional[str] = None, cache_size: int = 4096):
+        """
+        Args:
+            model (Optional[str], optional): Model name used to pick the `tiktoken` encoding.
+            cache_size (int, optional): Number of texts whose count is cached. Defaults to 4096.
+        """
+        self.cache_size = cache_size
+        self._encoding = None
+        if tiktoken and model:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding('o200k_base')
+        self._cache: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: Optional[str]) -> int:
+        """Return the number of tokens of `text`."""
+        if not text:
+            return 0
+        with self._lock:
+            tokens = self._cache.get(text)
+            if tokens is not None:
+                self._cache.move_to_end(text)
+                return tokens
+        tokens = len(self._encoding.encode(text)) if self._encoding else estimate_tokens(text)
+        with self._lock:
+            self._cache[text] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: Sequence[Dict[str, str]]) -> int:
+        """Return the number of prompt tokens of chat messages."""
+        return sum(self.count(m.get('content')) + MESSAGE_OVERHEAD for m in messages)
+
+
+class TokenUsage:
+    """Prompt and completion tokens of one call or accumulated over many calls."""
+
+    __slots__ = ('prompt_tokens', 'completion_tokens', 'calls', '_lock')
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0, calls: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.calls = calls
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, usage: 'TokenUsage') -> None:
+        with self._lock:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.calls += usage.calls
+
+    def as_dict(self) -> dict:
+        return {
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'calls': self.calls,
+        }
+
+    def __repr__(self) -> str:
+        return f"TokenUsage(prompt={self.prompt_tokens}, completion={self.completion_tokens}, calls={self.calls})"
+
+
+class ContextWindow:
+    """Fits a request into the token budget of a model."""
+
+    budget: Optional[int]
+
+    def __init__(self, budget: Optional[int], counter: TokenCounter,
+                 summarizer: Optional[Callable[[List[Dict[str, str]]], str]] = None):
+        """
+        Args:
+            budget (Optional[int]): Max prompt tokens (context window minus the reserved output). `None` - no limit.
+            counter (TokenCounter): Token counter of the model.
+            summarizer (Optional[Callable[[List[Dict[str, str]]], str]], optional): Turns the dropped messages
+                into a short summary sent instead of them. Without it the dropped messages are just omitted.
+        """
+        self.budget = budget
+        self.counter = counter
+        self.summarizer = summarizer
+        self.trimmed = 0
+
+    def fit(self, head: List[Dict[str, str]], history: Sequence[Turn], tail: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Return `head + history + tail` with the oldest history turns removed until the request fits the budget.
+
+        Args:
+            head (List[Dict[str, str]]): Messages always sent first (system instruction).
+            history (Sequence[Turn]): Conversation turns, oldest first.
+            tail (List[Dict[str, str]]): Messages always sent last (the new user message).
+
+        Returns:
+            List[Dict[str, str]]: Messages to send.
+        """
+        if self.budget is None:
+            return head + [{"role": t.role, "content": t.content} for t in history] + tail
+
+        fixed = self.counter.count_messages(head) + self.counter.count_messages(tail)
+        if fixed > self.budget:
+            logger.warning(f"Request of {fixed} tokens exceeds the context budget of {self.budget} tokens")
+        available = self.budget - fixed
+
+        # Recent turns matter more than old ones - the history is filled from the end
+        kept: List[Turn] = []
+        for turn in reversed(history):
+            cost = turn.tokens + MESSAGE_OVERHEAD
+            if cost > available:
+                break
+            kept.append(turn)
+            available -= cost
+        kept.reverse()
+
+        messages = head[:]
+        dropped = len(history) - len(kept)
+        if dropped:
+            self.trimmed += dropped
+            if self.summarizer:
+                summary = self._summary(history[:dropped], available)
+                if summary:
+                    messages.append(summary)
+        messages.extend({"role": t.role, "content": t.content} for t in kept)
+        return messages + tail
+
+    def _summary(self, dropped: Sequence[Turn], available: int) -> Optional[Dict[str, str]]:
+        try:
+            text = self.summarizer([{"role": t.role, "content": t.content} for t in dropped])
+        except Exception as ex:
+            logger.error("Error summarizing the conversation history", ex)
+            return None
+        message = {"role": "system", "content": f"Summary of the earlier conversation: {text}"}
+        return message if self.counter.count_messages([message]) <= available else None
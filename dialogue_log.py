@@ -0,0 +1,245 @@
+## \file ../src/ai/dialogue_log.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Append-only dialogue log in JSON Lines format.
+
+Every call to `ask()` appends a single record (one turn) to the log instead of
+rewriting the whole dialogue. Records are written by a background thread and the
+file is rotated when it grows over `max_bytes`.
+
+@code
+log = get_dialogue_log(gs.path.data / 'AI' / 'gemini.jsonl')
+log.append([{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}])
+...
+# Convert back to the legacy JSON list format
+convert_dialogue_log(gs.path.data / 'AI' / 'gemini.jsonl', gs.path.data / 'AI' / 'gemini.json')
+@endcode
+"""
+
+import atexit
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from src.logger import logger
+from src.utils import j_dumps
+
+
+class DialogueLog:
+    """Append-only JSON Lines log of dialogue turns with background flushing and size rotation."""
+
+    path: Path
+    max_bytes: int
+    backup_count: int
+    flush_interval: float
+
+    def __init__(self, path: str | Path, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, flush_interval: float = 1.0):
+        """Create the log. The file and the writer thread are created on the first append.
+
+        Args:
+            path (str | Path): Path to the `.jsonl` file.
+            max_bytes (int, optional): Rotate the file when it grows over this size. `0` disables rotation. Defaults to 10 MB.
+            backup_count (int, optional): Number of rotated files to keep. Defaults to 5.
+            flush_interval (float, optional): Max seconds a record waits in memory before it is written. Defaults to 1.0.
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def append(self, messages: List[Dict[str, str]], **extra) -> None:
+        """Queue one dialogue turn for writing.
+
+        Args:
+            messages (List[Dict[str, str]]): Messages of the turn (system, user, assistant...).
+            **extra: Additional fields stored with the record (model, sentiment...).
+        """
+        if self._closed:
+            logger.error(f"Dialogue log {self.path} is closed, record dropped")
+            return
+        self._ensure_writer()
+        self._queue.put({"ts": time.time(), **extra, "messages": messages})
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued record is written.
+
+        Args:
+            timeout (Optional[float], optional): Max seconds to wait. Defaults to no limit.
+
+        Returns:
+            bool: `True` if the queue was drained in time.
+        """
+        if not self._thread:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Flush the pending records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+
+    def _ensure_writer(self) -> None:
+        if self._thread:
+            return
+        with self._lock:
+            if not self._thread:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._thread = threading.Thread(target=self._writer, name=f"dialogue-log:{self.path.name}", daemon=True)
+                self._thread.start()
+
+    def _writer(self) -> None:
+        """Background loop: collect queued records and write them in batches."""
+        stop = False
+        while not stop:
+            batch: list = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                if isinstance(item, threading.Event):
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+            records = [r for r in batch if isinstance(r, dict)]
+            if records:
+                try:
+                    self._write(records)
+                except Exception as ex:
+                    logger.error(f"Error writing dialogue log {self.path}", ex, True)
+            for event in batch:
+                if isinstance(event, threading.Event):
+                    event.set()
+
+    def _write(self, records: List[dict]) -> None:
+        lines = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+        if self.max_bytes and self.path.exists() and self.path.stat().st_size + len(lines) > self.max_bytes:
+            self._rotate()
+        with self.path.open('a', encoding='utf-8') as f:
+            f.write(lines)
+
+    def _rotate(self) -> None:
+        """Shift `name.jsonl` -> `name.1.jsonl` -> `name.2.jsonl` ... dropping the oldest file."""
+        if self.backup_count <= 0:
+            self.path.unlink(missing_ok=True)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = rotated_path(self.path, i)
+            if src.exists():
+                src.replace(rotated_path(self.path, i + 1))
+        self.path.replace(rotated_path(self.path, 1))
+
+
+def rotated_path(path: Path, index: int) -> Path:
+    """Return the name of the `index`-th rotated file for `path`."""
+    return path.with_name(f"{path.stem}.{index}{path.suffix}")
+
+
+_logs: Dict[Path, DialogueLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_dialogue_log(path: str | Path, **kwargs) -> DialogueLog:
+    """Return the process-wide `DialogueLog` for `path`, creating it if needed.
+
+    Several model instances may write into the same file; sharing the log keeps
+    one writer thread per file so rotation stays consistent.
+    """
+    path = Path(path)
+    with _logs_lock:
+        log = _logs.get(path)
+        if not log or log._closed:
+            log = _logs[path] = DialogueLog(path, **kwargs)
+        return log
+
+
+@atexit.register
+def _close_logs() -> None:
+    for log in list(_logs.values()):
+        log.close()
+
+
+def iter_dialogue_log(path: str | Path, include_rotated: bool = True) -> Iterator[dict]:
+    """Iterate the turn records of a log, oldest first.
+
+    Args:
+        path (str | Path): Path to the `.jsonl` file.
+        include_rotated (bool, optional): Also read rotated files (`name.N.jsonl`). Defaults to True.
+
+    Yields:
+        dict: Turn record as written by `DialogueLog.append`.
+    """
+    path = Path(path)
+    files = []
+    if include_rotated:
+        i = 1
+        while rotated_path(path, i).exists():
+            files.insert(0, rotated_path(path, i))
+            i += 1
+    files.append(path)
+
+    for file in files:
+        if not file.exists():
+            continue
+        with file.open('r', encoding='utf-8') as f:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as ex:
+                    # The last line may be incomplete after a crash
+                    logger.error(f"Broken record in {file}:{n}", ex)
+
+
+def read_dialogue_log(path: str | Path, include_rotated: bool = True) -> List[Dict[str, str]]:
+    """Read a JSON Lines log and return it as the flat list of messages used by the legacy `.json` dialogue files.
+
+    Args:
+        path (str | Path): Path to the `.jsonl` file.
+        include_rotated (bool, optional): Also read rotated files. Defaults to True.
+
+    Returns:
+        List[Dict[str, str]]: `[{"role": ..., "content": ...}, ...]`
+    """
+    return [message for record in iter_dialogue_log(path, include_rotated) for message in record.get('messages', [])]
+
+
+def convert_dialogue_log(path: str | Path, json_path: str | Path = None, include_rotated: bool = True) -> Path:
+    """Convert a JSON Lines log into the legacy JSON dialogue file.
+
+    Args:
+        path (str | Path): Path to the `.jsonl` file.
+        json_path (str | Path, optional): Output file. Defaults to `path` with `.json` suffix.
+        include_rotated (bool, optional): Also read rotated files. Defaults to True.
+
+    Returns:
+        Path: Path to the written JSON file.
+    """
+    path = Path(path)
+    json_path = Path(json_path) if json_path else path.with_suffix('.json')
+    j_dumps(read_dialogue_log(path, include_rotated), json_path)
+    return json_path
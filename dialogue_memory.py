@@ -0,0 +1,154 @@
+## \file ../src/ai/dialogue_memory.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Bounded per-instance dialogue memory.
+
+A ring buffer of dialogue messages capped by the number of messages and/or by
+an estimated token count. Messages pushed out of the buffer are appended to a
+JSON Lines spill file (see `src.ai.dialogue_log`) if one is configured.
+
+@code
+memory = DialogueMemory(max_turns=50, max_tokens=8000)
+memory.append('user', 'Hello')
+memory.append('assistant', 'Hi!', sentiment='positive')
+memory.messages()       # [{'role': 'user', 'content': 'Hello'}, ...]
+memory.memory_usage()   # bytes held by this instance
+@endcode
+"""
+
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from src.ai.dialogue_log import DialogueLog, get_dialogue_log
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+class Turn:
+    """One dialogue message."""
+
+    __slots__ = ('role', 'content', 'sentiment', 'tokens')
+
+    def __init__(self, role: str, content: str, sentiment: Optional[str] = None, tokens: int = 0):
+        self.role = role
+        self.content = content
+        self.sentiment = sentiment
+        self.tokens = tokens
+
+    def as_dict(self) -> Dict[str, str]:
+        """Return the message in the `{"role": ..., "content": ...}` format used by the providers."""
+        message = {"role": self.role, "content": self.content}
+        if self.sentiment:
+            message["sentiment"] = self.sentiment
+        return message
+
+    def __repr__(self) -> str:
+        return f"Turn({self.role!r}, {self.content[:30]!r}, tokens={self.tokens})"
+
+
+class DialogueMemory:
+    """Ring buffer of `Turn` records with a message and token cap."""
+
+    max_turns: Optional[int]
+    max_tokens: Optional[int]
+    spill_log: Optional[DialogueLog]
+
+    def __init__(self, max_turns: Optional[int] = 100, max_tokens: Optional[int] = None,
+                 spill_path: Optional[str | Path] = None, token_counter: Callable[[str], int] = estimate_tokens):
+        """
+        Args:
+            max_turns (Optional[int], optional): Max number of messages kept in memory. `None` - no limit. Defaults to 100.
+            max_tokens (Optional[int], optional): Max total tokens kept in memory. `None` - no limit.
+            spill_path (Optional[str | Path], optional): `.jsonl` file that receives evicted messages. `None` - evicted messages are dropped.
+            token_counter (Callable[[str], int], optional): Function counting tokens of a message. Defaults to `estimate_tokens`.
+        """
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.spill_log = get_dialogue_log(spill_path) if spill_path else None
+        self.token_counter = token_counter
+        self._turns: deque[Turn] = deque()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def append(self, role: str, content: str, sentiment: Optional[str] = None) -> Turn:
+        """Add a message, evicting the oldest ones if a cap is exceeded.
+
+        Returns:
+            Turn: The stored record.
+        """
+        content = content or ''
+        turn = Turn(role, content, sentiment, self.token_counter(content))
+        with self._lock:
+            self._turns.append(turn)
+            self._tokens += turn.tokens
+            self._evict()
+        return turn
+
+    def extend(self, messages: Iterable[Dict[str, str]]) -> None:
+        """Add messages given as `{"role": ..., "content": ...[, "sentiment": ...]}` dicts."""
+        for message in messages:
+            self.append(message.get('role'), message.get('content'), message.get('sentiment'))
+
+    def _evict(self) -> None:
+        evicted: List[Turn] = []
+        while self._turns and (
+            (self.max_turns is not None and len(self._turns) > self.max_turns)
+            or (self.max_tokens is not None and self._tokens > self.max_tokens and len(self._turns) > 1)
+        ):
+            turn = self._turns.popleft()
+            self._tokens -= turn.tokens
+            evicted.append(turn)
+        if evicted and self.spill_log:
+            self.spill_log.append([t.as_dict() for t in evicted], evicted=True)
+
+    def messages(self, last: Optional[int] = None) -> List[Dict[str, str]]:
+        """Return the stored messages as dicts, oldest first.
+
+        Args:
+            last (Optional[int], optional): Return only the last `last` messages.
+        """
+        with self._lock:
+            turns = list(self._turns)
+        if last is not None:
+            turns = turns[-last:] if last > 0 else []
+        return [t.as_dict() for t in turns]
+
+    @property
+    def tokens(self) -> int:
+        """Total estimated tokens held in memory."""
+        return self._tokens
+
+    def clear(self) -> None:
+        """Drop every message kept in memory."""
+        with self._lock:
+            self._turns.clear()
+            self._tokens = 0
+
+    def memory_usage(self) -> int:
+        """Return the approximate number of bytes held by this instance (records and their strings)."""
+        with self._lock:
+            turns = list(self._turns)
+        size = sys.getsizeof(self) + sys.getsizeof(self._turns)
+        seen = set()
+        for turn in turns:
+            size += sys.getsizeof(turn)
+            for value in (turn.role, turn.content, turn.sentiment):
+                # The same system instruction is referenced by every turn - it is counted once
+                if value is not None and id(value) not in seen:
+                    seen.add(id(value))
+                    size += sys.getsizeof(value)
+        return size
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def __iter__(self) -> Iterator[Turn]:
+        with self._lock:
+            return iter(list(self._turns))
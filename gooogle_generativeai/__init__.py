@@ -7,4 +7,13 @@
 from packaging.version import Version
 from .version import __version__, __doc__, __details__ 
 
-from .generative_ai import GoogleGenerativeAI
\ No newline at end of file
+from src.ai._lazy import lazy_module
+
+# google.generativeai is imported only when a class is accessed
+_lazy_imports = {
+    'GoogleGenerativeAI': '.generative_ai',
+    'AsyncGoogleGenerativeAI': '.async_generative_ai',
+}
+
+__all__ = list(_lazy_imports)
+__getattr__, __dir__ = lazy_module(__name__, _lazy_imports)
@@ -0,0 +1,121 @@
+"""! Asyncio variant of `GoogleGenerativeAI` """
+## \file ../src/ai/gooogle_generativeai/async_generative_ai.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+import header
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from src.logger import logger
+from src.utils import pprint
+from src.ai.batch import BatchResult, aask_many, aiter_ask_many
+from .generative_ai import GoogleGenerativeAI
+
+
+class AsyncGoogleGenerativeAI(GoogleGenerativeAI):
+    """GoogleGenerativeAI with a coroutine `ask()` built on `generate_content_async`.
+
+    The async gRPC transport of `google.generativeai` is configured once per process,
+    so every instance shares its channel. Requests are paced by the shared rate limiter,
+    retries wait with `asyncio.sleep` and cancelling the calling task aborts the request.
+    """
+
+    async def _generate_async(self, prompt: str) -> str:
+        """Send one request to the model (no retries) and return the reply."""
+        estimated_tokens = self._prompt_tokens(prompt)
+        await self.rate_limiter.acquire_async(estimated_tokens)
+        response = await self.model.generate_content_async(prompt)
+        self.rate_limiter.adjust(estimated_tokens, getattr(response.usage_metadata, 'total_token_count', None))
+        self._record_usage(response)
+        return response.text
+
+    async def ask(self, prompt: str, attempts: int = 3, use_cache: bool = True) -> Optional[str]:
+        """Send a prompt to the model and return the response.
+
+        Args:
+            prompt (str): The prompt to send to the model.
+            attempts (int, optional): Number of retry attempts in case of failure. Defaults to 3.
+            use_cache (bool, optional): Look the reply up in `response_cache`. `False` - always call the API
+                (the new reply replaces the cached one, e.g. when the cached reply was rejected). Defaults to True.
+
+        Returns:
+            Optional[str]: The model's response or None if an error occurs.
+        """
+        cache_key = self._cache_key(prompt)
+        reply = self.response_cache.get(cache_key) if cache_key and use_cache else None
+
+        if reply is None:
+            try:
+                # `asyncio.CancelledError` is not caught: cancelling the task aborts the request
+                reply = await self.retry_policy.call_async(self.circuit_breaker.call_async, self._generate_async, prompt, attempts=attempts + 1)
+            except Exception as ex:
+                logger.error(f"Generative AI prompt {pprint(prompt)}\n{attempts=}", ex, True)
+                return
+            if cache_key:
+                self.response_cache.set(cache_key, reply)
+
+        self._record_turn(prompt, reply)
+        return reply
+
+    async def _open_stream_async(self, prompt: str) -> Tuple[object, int]:
+        """Start a streamed request (no retries). Returns the async response and the estimated prompt tokens."""
+        estimated_tokens = self._prompt_tokens(prompt)
+        await self.rate_limiter.acquire_async(estimated_tokens)
+        return await self.model.generate_content_async(prompt, stream=True), estimated_tokens
+
+    async def ask_stream(self, prompt: str, sink: Optional[Callable[[str], None]] = None, attempts: int = 3) -> AsyncIterator[str]:
+        """Send a prompt to the model and yield the response as it is generated.
+
+        `async for text in model.ask_stream(prompt)`. See `GoogleGenerativeAI.ask_stream` for the arguments.
+        """
+        cache_key = self._cache_key(prompt)
+        cached = self.response_cache.get(cache_key) if cache_key else None
+        parts = []
+        if cached is not None:
+            parts.append(cached)
+            if sink:
+                sink(cached)
+            yield cached
+        else:
+            response = None
+            try:
+                response, estimated_tokens = await self.retry_policy.call_async(self.circuit_breaker.call_async, self._open_stream_async, prompt, attempts=attempts + 1)
+                async for chunk in response:
+                    if not chunk.parts:
+                        continue
+                    parts.append(chunk.text)
+                    if sink:
+                        sink(chunk.text)
+                    yield chunk.text
+            except Exception as ex:
+                if response is not None:
+                    # A stream broken after it opened is a provider failure too
+                    self.circuit_breaker.failure(ex)
+                logger.error(f"Generative AI prompt {pprint(prompt)}\n{attempts=}", ex, True)
+                return
+            self.rate_limiter.adjust(estimated_tokens, getattr(response.usage_metadata, 'total_token_count', None))
+            self._record_usage(response)
+
+        reply = "".join(parts)
+        if cache_key and cached is None and reply:
+            self.response_cache.set(cache_key, reply)
+        if reply:
+            self._record_turn(prompt, reply)
+
+    def ask_many(self, prompts: Iterable[str], concurrency: Optional[int] = None, stream: bool = False, **kwargs) -> Awaitable[List[BatchResult]] | AsyncIterator[BatchResult]:
+        """Send many prompts concurrently.
+
+        `await model.ask_many(prompts)` returns the results in input order,
+        `async for result in model.ask_many(prompts, stream=True)` yields them as they complete.
+
+        Args:
+            prompts (Iterable[str]): Prompts to send.
+            concurrency (Optional[int], optional): Number of concurrent requests, capped by `max_concurrency`. Defaults to `max_concurrency`.
+            stream (bool, optional): Yield results as they complete. Defaults to False.
+            **kwargs: Extra arguments for `ask()`.
+        """
+        concurrency = min(concurrency or self.max_concurrency, self.max_concurrency)
+        if stream:
+            return aiter_ask_many(self.ask, prompts, concurrency, **kwargs)
+        return aask_many(self.ask, prompts, concurrency, **kwargs)
@@ -5,7 +5,7 @@
 
 import header  
 import time
-from typing import Optional, List, Dict
+from typing import Callable, Optional, Iterable, Iterator, List, Dict, Tuple
 from pathlib import Path
 import os
 import pathlib
@@ -17,62 +17,218 @@ from src.settings import gs
 from src.utils import pprint
 from src.utils.file.csv import save_csv_file
 from src.utils.jjson import j_dumps  
+from src.ai.dialogue_log import DialogueLog, get_dialogue_log
+from src.ai.dialogue_memory import DialogueMemory
+from src.ai.response_cache import ResponseCache, make_cache_key
+from src.ai.batch import BatchResult, ask_many, iter_ask_many
+from src.ai.rate_limiter import RateLimiter, get_rate_limiter
+from src.ai.retry import RetryPolicy
+from src.ai.circuit_breaker import CircuitBreaker, get_circuit_breaker
+from src.ai.registry import get_model_registry
+from src.ai.context_window import TokenCounter, TokenUsage
 
 
 class GoogleGenerativeAI:
     """GoogleGenerativeAI class for interacting with Google's Generative AI models."""
 
     model: genai.GenerativeModel
-    dialogue_log_path: str | Path = gs.path.data / 'AI' / f"gemini_{gs.now}.json"
-    dialogue: List[Dict[str, str]] = []  # Список для хранения диалога
+    model_name: str = 'gemini-1.5-flash'
+    models_path: Path = gs.path.src / 'ai' / 'gooogle_generativeai' / 'models.json'
+    rate_limiter: RateLimiter
+    retry_policy: RetryPolicy = RetryPolicy('gemini')
+    # Fails fast while Gemini is degraded instead of waiting for every retry
+    circuit_breaker: CircuitBreaker = get_circuit_breaker('gemini')
+    dialogue_log_path: str | Path = gs.path.data / 'AI' / f"gemini_{gs.now}.jsonl"
+    dialogue_log: DialogueLog
+    dialogue: DialogueMemory  # Bounded dialogue memory of the instance
     system_instruction:str
+    generation_config: dict = {"response_mime_type": "application/json"}
+    max_concurrency: int = 4  # Max parallel requests of `ask_many()`
+    response_cache: Optional[ResponseCache]
+    token_counter: TokenCounter
+    usage: TokenUsage  # Tokens of all requests of the instance
+    last_usage: TokenUsage | None  # Tokens of the last request
 
-    def __init__(self, system_instruction: Optional[str] = None):
+    def __init__(self, system_instruction: Optional[str] = None,
+                 dialogue_max_turns: int = 100, dialogue_max_tokens: Optional[int] = None,
+                 response_cache: Optional[ResponseCache] = None):
         """Initialize GoogleGenerativeAI with the model and API key.
 
         Args:
             system_instruction (Optional[str], optional): Optional system instruction for the model.
+            dialogue_max_turns (int, optional): Max number of messages kept in memory. Defaults to 100.
+            dialogue_max_tokens (Optional[int], optional): Max estimated tokens kept in memory. Defaults to no limit.
+            response_cache (Optional[ResponseCache], optional): Cache of responses to identical requests. Defaults to no caching.
         """
         genai.configure(api_key=gs.credentials.googleai.api_key)
         self.system_instruction = system_instruction
+        self.dialogue_log = get_dialogue_log(self.dialogue_log_path)
+        # Gemini has no local tokenizer: the counter estimates and caches the counts of repeated texts
+        self.token_counter = TokenCounter()
+        # Every turn is already persisted by `dialogue_log`, so evicted messages are not spilled again
+        self.dialogue = DialogueMemory(max_turns=dialogue_max_turns, max_tokens=dialogue_max_tokens,
+                                       token_counter=self.token_counter.count)
+        self.usage = TokenUsage()
+        self.last_usage = None
+        info = get_model_registry('gemini', self.models_path).get_model(self.model_name)
+        # Context window minus the reserved output, from `models.json`
+        self.context_budget = info.prompt_budget if info else None
+        self.response_cache = response_cache
+        # RPM/TPM limits from the registry (`models.json`), shared by every instance in the process
+        self.rate_limiter = get_rate_limiter('gemini', self.model_name, info)
         # Using `response_mime_type` requires either a Gemini 1.5 Pro or 1.5 Flash model
         self.model = genai.GenerativeModel(
-            'gemini-1.5-flash',
-            generation_config={"response_mime_type": "application/json"},
+            self.model_name,
+            generation_config=self.generation_config,
             system_instruction=system_instruction if system_instruction else None
         )
 
-    def _save_dialogue(self):
-        """Save the entire dialogue to a CSV file."""
-        j_dumps(self.dialogue, self.dialogue_log_path)
+    def _save_dialogue(self, messages: List[Dict[str, str]]):
+        """Append the messages of the last turn to the dialogue log.
 
-    def ask(self, prompt: str, attempts: int = 3) -> Optional[str]:
+        Args:
+            messages (List[Dict[str, str]]): Messages of the turn.
+        """
+        self.dialogue_log.append(messages, model=self.model_name)
+
+    def _cache_key(self, prompt: str) -> Optional[str]:
+        """Return the response cache key for `prompt` or `None` if caching is off."""
+        if not self.response_cache:
+            return None
+        return make_cache_key('gemini', self.model_name, self.system_instruction, prompt, self.generation_config)
+
+    def _record_turn(self, prompt: str, reply: str):
+        """Add the turn to the dialogue memory and the dialogue log."""
+        turn = [
+            {"role": "system", "content": self.system_instruction},
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": reply},
+        ]
+        self.dialogue.extend(turn)
+
+        # Append the turn to the dialogue log
+        self._save_dialogue(turn)
+
+    def _prompt_tokens(self, prompt: str) -> int:
+        """Count the tokens of the system instruction and `prompt`, warning if they exceed the context budget."""
+        tokens = self.token_counter.count(self.system_instruction) + self.token_counter.count(prompt)
+        if self.context_budget and tokens > self.context_budget:
+            logger.warning(f"Prompt of {tokens} tokens exceeds the context budget of {self.context_budget} tokens")
+        return tokens
+
+    def _record_usage(self, response) -> None:
+        """Store the token usage reported by the API in `last_usage` and add it to `usage`."""
+        metadata = getattr(response, 'usage_metadata', None)
+        self.last_usage = TokenUsage(getattr(metadata, 'prompt_token_count', 0) or 0,
+                                     getattr(metadata, 'candidates_token_count', 0) or 0, 1)
+        self.usage.add(self.last_usage)
+
+    def _generate(self, prompt: str) -> str:
+        """Send one request to the model (no retries) and return the reply."""
+        # Send prompt to the model, paced by the RPM/TPM limits
+        estimated_tokens = self._prompt_tokens(prompt)
+        self.rate_limiter.acquire(estimated_tokens)
+        response = self.model.generate_content(prompt)
+        self.rate_limiter.adjust(estimated_tokens, getattr(response.usage_metadata, 'total_token_count', None))
+        self._record_usage(response)
+        return response.text
+
+    def ask(self, prompt: str, attempts: int = 3, use_cache: bool = True) -> Optional[str]:
         """Send a prompt to the model and return the response.
 
         Args:
             prompt (str): The prompt to send to the model.
-            attempts (int, optional): Number of retry attempts in case of failure. Defaults to 5.
+            attempts (int, optional): Number of retry attempts in case of failure. Defaults to 3.
+            use_cache (bool, optional): Look the reply up in `response_cache`. `False` - always call the API
+                (the new reply replaces the cached one, e.g. when the cached reply was rejected). Defaults to True.
 
         Returns:
             Optional[str]: The model's response or None if an error occurs.
         """
-        try:
-            # Send prompt to the model
-            response = self.model.generate_content(prompt)
-            reply = response.text
+        # Identical requests are served from the cache without an API round trip
+        cache_key = self._cache_key(prompt)
+        reply = self.response_cache.get(cache_key) if cache_key and use_cache else None
+
+        if reply is None:
+            try:
+                # Only transient errors are retried, with exponential backoff
+                reply = self.retry_policy.call(self.circuit_breaker.call, self._generate, prompt, attempts=attempts + 1)
+            except Exception as ex:
+                logger.error(f"Generative AI prompt {pprint(prompt)}\n{attempts=}", ex, True)
+                return
+            if cache_key:
+                self.response_cache.set(cache_key, reply)
+
+        # Add user prompt and model reply to the dialogue
+        self._record_turn(prompt, reply)
+        return reply
+
+    def _open_stream(self, prompt: str) -> Tuple[object, int]:
+        """Start a streamed request (no retries). Returns the response iterator and the estimated prompt tokens."""
+        estimated_tokens = self._prompt_tokens(prompt)
+        self.rate_limiter.acquire(estimated_tokens)
+        return self.model.generate_content(prompt, stream=True), estimated_tokens
 
-            # Add user prompt and model reply to the dialogue
-            self.dialogue.append({"role": "system", "content": self.system_instruction})
-            self.dialogue.append({"role": "user", "content": prompt})
-            self.dialogue.append({"role": "assistant", "content": reply})
+    def ask_stream(self, prompt: str, sink: Optional[Callable[[str], None]] = None, attempts: int = 3) -> Iterator[str]:
+        """Send a prompt to the model and yield the response as it is generated.
 
-            # Save the dialogue to a CSV file
-            self._save_dialogue()
+        The complete response is added to the dialogue like a response of `ask()`. On an error
+        the stream ends early and the error is logged.
 
-            return reply
+        Args:
+            prompt (str): The prompt to send to the model.
+            sink (Optional[Callable[[str], None]], optional): Also receives every fragment (e.g. a bot message being edited).
+            attempts (int, optional): Number of retry attempts to open the stream. Defaults to 3.
+
+        Yields:
+            str: Fragments of the response.
+        """
+        cache_key = self._cache_key(prompt)
+        cached = self.response_cache.get(cache_key) if cache_key else None
+        parts = []
+        response = None
+        try:
+            if cached is not None:
+                # A cached reply is yielded as one fragment
+                fragments = iter([cached])
+            else:
+                # Only opening the stream is retried: a retry after the first fragments would duplicate text
+                response, estimated_tokens = self.retry_policy.call(self.circuit_breaker.call, self._open_stream, prompt, attempts=attempts + 1)
+                fragments = (chunk.text for chunk in response if chunk.parts)
+            for text in fragments:
+                parts.append(text)
+                if sink:
+                    sink(text)
+                yield text
         except Exception as ex:
+            if response is not None:
+                # A stream broken after it opened is a provider failure too
+                self.circuit_breaker.failure(ex)
             logger.error(f"Generative AI prompt {pprint(prompt)}\n{attempts=}", ex, True)
-            time.sleep(15)  # <- Generative AI rate limit: up to 3 requests per minute
-            if attempts > 0:
-                return self.ask(prompt, attempts - 1)
-            return 
+            return
+
+        reply = "".join(parts)
+        if cached is None:
+            self.rate_limiter.adjust(estimated_tokens, getattr(response.usage_metadata, 'total_token_count', None))
+            self._record_usage(response)
+            if cache_key and reply:
+                self.response_cache.set(cache_key, reply)
+        if reply:
+            self._record_turn(prompt, reply)
+
+    def ask_many(self, prompts: Iterable[str], concurrency: Optional[int] = None, stream: bool = False, **kwargs) -> List[BatchResult] | Iterator[BatchResult]:
+        """Send many prompts in parallel.
+
+        Args:
+            prompts (Iterable[str]): Prompts to send. May be a lazy generator.
+            concurrency (Optional[int], optional): Number of parallel requests, capped by `max_concurrency`. Defaults to `max_concurrency`.
+            stream (bool, optional): Yield results as they complete instead of returning them in input order. Defaults to False.
+            **kwargs: Extra arguments for `ask()` (`attempts`).
+
+        Returns:
+            List[BatchResult] | Iterator[BatchResult]: One result per prompt; a failed prompt carries its `error`.
+        """
+        concurrency = min(concurrency or self.max_concurrency, self.max_concurrency)
+        if stream:
+            return iter_ask_many(self.ask, prompts, concurrency, **kwargs)
+        return ask_many(self.ask, prompts, concurrency, **kwargs)
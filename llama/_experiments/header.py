@@ -0,0 +1,9 @@
+﻿## \file ../src/ai/llama/_experiments/header.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Absolute path to modules  """
+
+import sys,os
+from pathlib import Path
+__root__ : Path = os.getcwd() [:os.getcwd().rfind(r'hypotez')+7]
+sys.path.append (__root__)  
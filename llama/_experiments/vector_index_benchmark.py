@@ -0,0 +1,92 @@
+## \file ../src/ai/llama/_experiments/vector_index_benchmark.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Benchmark: `VectorIndex` at 1M chunks.
+
+Synthetic embeddings stand in for a real corpus: unit vectors around a few thousand topics
+(the embedder is not measured). Reports the add rate, the time to reopen the index and to
+train the lists, the query latency of the exact scan and of the IVF search (one query and
+batches of queries), the recall@10 of the IVF search against the exact one, and the effect
+of deletes. Needs about 1 GB of disk for 1M x 256 float32.
+
+    python vector_index_benchmark.py [--chunks 1000000] [--dim 256] [--n-probe 16]
+"""
+
+import header
+import argparse
+import tempfile
+import time
+from statistics import quantiles
+
+import numpy as np
+
+from src.ai.llama.model import HashingEmbedder, VectorIndex
+
+
+def embeddings(rng: np.random.Generator, topics: np.ndarray, n: int, noise: float = 0.6) -> np.ndarray:
+    """Unit topic vectors plus noise of norm about `noise`."""
+    dim = topics.shape[1]
+    return topics[rng.integers(0, len(topics), n)] + noise / np.sqrt(dim) * rng.standard_normal((n, dim), dtype=np.float32)
+
+
+def latency(index: VectorIndex, queries: np.ndarray, batch: int, **kwargs) -> str:
+    seconds = []
+    for start in range(0, len(queries), batch):
+        started = time.perf_counter()
+        index.search_vectors(queries[start:start + batch], 10, **kwargs)
+        seconds.append((time.perf_counter() - started) / batch)
+    cut = quantiles(seconds, n=100) if len(seconds) > 1 else seconds * 99
+    return f"p50 {cut[49] * 1000:7.2f} ms, p99 {cut[98] * 1000:7.2f} ms per query"
+
+
+def recall(index: VectorIndex, queries: np.ndarray, **kwargs) -> float:
+    found = index.search_vectors(queries, 10, **kwargs)
+    exact = index.search_vectors(queries, 10, exact=True)
+    return float(np.mean([len({r for r, _ in a} & {r for r, _ in b}) / max(1, len(b)) for a, b in zip(found, exact)]))
+
+
+def run(chunks: int, dim: int, n_probe: int, add_batch: int = 50_000) -> None:
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((4096, dim), dtype=np.float32) / np.sqrt(dim)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(tmp, HashingEmbedder(dim))
+        started = time.perf_counter()
+        for start in range(0, chunks, add_batch):
+            n = min(add_batch, chunks - start)
+            index.add_vectors([f'chunk-{i}' for i in range(start, start + n)], [f'text {i}' for i in range(start, start + n)],
+                              embeddings(rng, topics, n))
+        print(f"add: {chunks / (time.perf_counter() - started):,.0f} chunks/s")
+        index.close()
+
+        started = time.perf_counter()
+        index = VectorIndex(tmp, HashingEmbedder(dim))
+        print(f"reopen: {time.perf_counter() - started:.2f} s, {len(index):,} chunks")
+
+        queries = embeddings(rng, topics, 128)
+        index.search_vectors(queries[:1])  # warm up the page cache
+        print(f"exact, batch  1: {latency(index, queries[:16], 1, exact=True)}")
+        print(f"exact, batch 32: {latency(index, queries[:64], 32, exact=True)}")
+
+        started = time.perf_counter()
+        n_lists = index.train()
+        print(f"train {n_lists} lists: {time.perf_counter() - started:.1f} s")
+        for batch in (1, 8, 32):
+            print(f"ivf,   batch {batch:>2}: {latency(index, queries, batch, n_probe=n_probe)}")
+        print(f"ivf recall@10 (n_probe {n_probe}): {recall(index, queries[:32], n_probe=n_probe):.3f}")
+
+        started = time.perf_counter()
+        index.add_vectors([f'new-{i}' for i in range(10_000)], [''] * 10_000, embeddings(rng, topics, 10_000))
+        deleted = index.delete(f'chunk-{i}' for i in rng.choice(chunks, 10_000, replace=False))
+        print(f"add 10,000 + delete {deleted:,}: {time.perf_counter() - started:.2f} s; "
+              f"ivf, batch  1: {latency(index, queries[:64], 1, n_probe=n_probe)}, "
+              f"recall@10 {recall(index, queries[:32], n_probe=n_probe):.3f}")
+        index.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=1_000_000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--n-probe', type=int, default=16)
+    args = parser.parse_args()
+    run(args.chunks, args.dim, args.n_probe)
@@ -0,0 +1,567 @@
+## \file ../src/ai/llama/model.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Local vector index for the document Q&A workflow (see `docs/model.md`).
+
+Documents of a directory are split into token-bounded chunks, embedded and stored in an
+index directory:
+- `vectors.npy` - float32 matrix of the L2-normalized embeddings, opened memory-mapped, so
+  the index is not loaded into RAM and opens instantly at any size;
+- `lists.npy`, `centroids.npy` - inverted list of every row and the list centroids (after `train()`);
+- `chunks.sqlite` - row number, id, text and metadata of every chunk.
+
+Search is a cosine top-k over the matrix, computed block by block for a batch of queries.
+At a large size `train()` clusters the vectors into inverted lists (IVF, spherical k-means);
+a query then scans only the rows of its `n_probe` nearest lists, which keeps the latency
+in milliseconds at a million chunks. Chunks are added by appending rows (the files grow by
+doubling; new rows are assigned to the nearest list) and deleted by dropping their rows
+from the live set; `compact()` reclaims the space of the deleted rows.
+
+The embedder is pluggable: anything with `dim` and `embed(texts) -> (n, dim) array`.
+`HashingEmbedder` is local and deterministic (tests, offline work), `OpenAIEmbedder` uses
+the OpenAI embeddings API.
+
+@code
+index = VectorIndex(gs.path.data / 'AI' / 'llama' / 'index', HashingEmbedder())
+index.add_directory(Path('./data'))
+index.train()                                   # for large indexes
+for hit in index.query('Как оформить возврат?', k=5):
+    print(f'{hit.score:.3f} {hit.id}: {hit.text[:80]}')
+@endcode
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Protocol, Sequence
+
+import numpy as np
+
+from src.settings import gs
+from src.logger import logger
+from src.ai.chunking import iter_chunks
+from src.ai.dialogue_memory import estimate_tokens
+
+_WORD = re.compile(r'\w+', re.U)
+
+
+class Embedder(Protocol):
+    """Turns texts into vectors of `dim` floats."""
+
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+
+@lru_cache(maxsize=1 << 18)
+def _feature(token: str, dim: int) -> tuple:
+    """Bucket and sign of a token. `blake2b` instead of `hash()`: the same on every run."""
+    value = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+class HashingEmbedder:
+    """Deterministic local embedder: signed feature hashing of words and word pairs."""
+
+    def __init__(self, dim: int = 256):
+        """
+        Args:
+            dim (int, optional): Vector size. Defaults to 256.
+        """
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD.findall(text.lower())
+            for token in words + [f'{a} {b}' for a, b in zip(words, words[1:])]:
+                bucket, sign = _feature(token, self.dim)
+                vectors[row, bucket] += sign
+        return vectors
+
+
+class OpenAIEmbedder:
+    """Embeddings of the OpenAI API."""
+
+    def __init__(self, model: str = 'text-embedding-3-small', dim: int = 1536, batch_size: int = 256):
+        """
+        Args:
+            model (str, optional): Embedding model. Defaults to `text-embedding-3-small`.
+            dim (int, optional): Vector size requested from the API. Defaults to 1536.
+            batch_size (int, optional): Texts per API call. Defaults to 256.
+        """
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=gs.credentials.openai.project_api)
+        return self._client
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(
+                model=self.model, input=list(texts[start:start + self.batch_size]), dimensions=self.dim,
+            )
+            vectors.extend(item.embedding for item in response.data)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows (zero rows stay zero), so that a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class SearchHit:
+    """One search result."""
+
+    __slots__ = ('id', 'text', 'score', 'metadata')
+
+    def __init__(self, id: str, text: str, score: float, metadata: Optional[dict] = None):
+        self.id = id
+        self.text = text
+        self.score = score
+        self.metadata = metadata
+
+    def __repr__(self) -> str:
+        return f"SearchHit(id={self.id!r}, score={self.score:.3f})"
+
+
+class _Rows:
+    """Lazy row selection of an array: `source[rows][start:end]` without copying the whole selection."""
+
+    def __init__(self, array: np.ndarray, rows: np.ndarray):
+        self.array = array
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, item: slice) -> np.ndarray:
+        return self.array[self.rows[item]]
+
+
+class VectorIndex:
+    """Cosine top-k index over a memory-mapped matrix of embeddings."""
+
+    path: Path
+    block_rows: int = 1 << 16  # Matrix rows per search step
+    n_probe: int = 16  # IVF lists scanned per query
+
+    def __init__(self, path: str | Path, embedder: Embedder = None, capacity: int = 1024):
+        """
+        Args:
+            path (str | Path): Index directory. Created if it does not exist.
+            embedder (Embedder, optional): Embedder of the texts and the queries. Defaults to `HashingEmbedder()`.
+            capacity (int, optional): Initial rows of a new vectors file. Defaults to 1024.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path / 'chunks.sqlite', check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, text TEXT NOT NULL, metadata TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._db.commit()
+        self._recover()
+
+        self._vectors = self._open('vectors.npy', np.float32, (capacity, self.dim))
+        if self._vectors.shape[1] != self.dim:
+            raise ValueError(f"Index {self.path} has vectors of {self._vectors.shape[1]} dimensions, the embedder makes {self.dim}")
+        # IVF list of every row, -1 - not assigned
+        self._assign = self._open('lists.npy', np.int32, (len(self._vectors),), fill=-1)
+        centroids_path = self.path / 'centroids.npy'
+        self.centroids: Optional[np.ndarray] = np.load(centroids_path) if centroids_path.exists() else None
+        self._lists: Optional[tuple] = None  # rows sorted by list and the list bounds
+        self._indexed = 0  # rows below this bound are in `_lists`, the rest are scanned exhaustively
+
+        # Rows written after the last commit (a failed add) are not counted in `size`
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'size'").fetchone()
+        self.size = int(row[0]) if row else 0
+        self._live = np.zeros(len(self._vectors), dtype=bool)
+        self._live[[r for (r,) in self._db.execute('SELECT row FROM chunks')]] = True
+
+    def __len__(self) -> int:
+        """Number of live chunks."""
+        with self._lock:
+            return int(self._live[:self.size].sum())
+
+    def _open(self, name: str, dtype, shape: tuple, fill: Any = 0) -> np.ndarray:
+        """Open a `.npy` file of the index memory-mapped, creating it if needed."""
+        path = self.path / name
+        if path.exists():
+            return np.load(path, mmap_mode='r+')
+        array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+        if fill:
+            array[:] = fill
+        return array
+
+    def _write(self, attr: str, name: str, rows: int, fill: Any = 0, source: Optional[np.ndarray] = None) -> None:
+        """Write the file `name.tmp`: the memory-mapped array `attr` resized to `rows` rows.
+
+        The new file starts with the rows of `source` (a row selection) or, by default, of the old array.
+        """
+        old = getattr(self, attr)
+        source = old if source is None else source
+        new = np.lib.format.open_memmap(self.path / f'{name}.tmp', mode='w+', dtype=old.dtype, shape=(rows, *old.shape[1:]))
+        for start in range(0, len(source), self.block_rows):
+            block = source[start:start + self.block_rows]
+            new[start:start + len(block)] = block
+        if fill:
+            new[len(source):] = fill
+        new.flush()
+
+    def _swap(self, attr: str, name: str) -> None:
+        """Replace the file of the memory-mapped array `attr` with `name.tmp` written by `_write`."""
+        # The map of the old file is closed before the replace (otherwise `os.replace` fails on Windows)
+        setattr(self, attr, None)
+        os.replace(self.path / f'{name}.tmp', self.path / name)
+        setattr(self, attr, np.load(self.path / name, mmap_mode='r+'))
+
+    def _replace(self, attr: str, name: str, rows: int, fill: Any = 0, source: Optional[np.ndarray] = None) -> None:
+        """Replace the memory-mapped array `attr` with a new file of `rows` rows. See `_write`."""
+        self._write(attr, name, rows, fill, source)
+        self._swap(attr, name)
+
+    def _recover(self) -> None:
+        """Finish a `compact()` interrupted after its commit; drop the `.tmp` files of any other interrupted rewrite.
+
+        `compact()` commits the renumbered rows together with the `swap` marker and only then
+        replaces the files, so with the marker set every `.tmp` file left is the new version.
+        """
+        pending = self._db.execute("SELECT 1 FROM meta WHERE key = 'swap'").fetchone()
+        for name in ('vectors.npy', 'lists.npy'):
+            tmp_path = self.path / f'{name}.tmp'
+            if not tmp_path.exists():
+                continue
+            if pending:
+                os.replace(tmp_path, self.path / name)
+            else:
+                tmp_path.unlink()
+        if pending:
+            logger.warning(f"Finished an interrupted compaction of {self.path}")
+            self._db.execute("DELETE FROM meta WHERE key = 'swap'")
+            self._db.commit()
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the index files (doubling) to hold `rows` rows."""
+        capacity = len(self._vectors)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        self._replace('_vectors', 'vectors.npy', capacity)
+        self._replace('_assign', 'lists.npy', capacity, fill=-1)
+        self._live = np.concatenate([self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+
+    def _nearest(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Number of the nearest centroid of every vector."""
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), self.block_rows):
+            labels[start:start + self.block_rows] = np.argmax(vectors[start:start + self.block_rows] @ centroids.T, axis=1)
+        return labels
+
+    def add_vectors(self, ids: Sequence[str], texts: Sequence[str], vectors: np.ndarray,
+                    metadata: Optional[Sequence[Optional[dict]]] = None) -> None:
+        """Add chunks with precomputed embeddings. A chunk with an existing id replaces it.
+
+        Args:
+            ids (Sequence[str]): Chunk ids. Of an id repeated in `ids` only the last chunk is added.
+            texts (Sequence[str]): Chunk texts.
+            vectors (np.ndarray): `(len(ids), dim)` embeddings; normalized here.
+            metadata (Optional[Sequence[Optional[dict]]], optional): JSON-serializable metadata per chunk.
+        """
+        vectors = normalize(vectors)
+        if vectors.shape != (len(ids), self.dim) or len(texts) != len(ids):
+            raise ValueError(f"Expected {len(ids)} texts and vectors of shape ({len(ids)}, {self.dim}), got {len(texts)} and {vectors.shape}")
+        metadata = metadata or [None] * len(ids)
+        keep = sorted({id: i for i, id in enumerate(ids)}.values())
+        if len(keep) < len(ids):
+            ids, texts, metadata = ([items[i] for i in keep] for items in (ids, texts, metadata))
+            vectors = vectors[keep]
+        with self._lock:
+            start = self.size
+            end = start + len(ids)
+            # The replaced chunks are deleted in the transaction of the insert: a failed add keeps them
+            with self._db:
+                replaced = self._delete_rows(ids)
+                self._reserve(end)
+                # Vectors go to disk first, rows to SQLite second: an interrupted write leaves no rows pointing at missing vectors
+                self._vectors[start:end] = vectors
+                self._vectors.flush()
+                if self.centroids is not None:
+                    self._assign[start:end] = self._nearest(vectors, self.centroids)
+                    self._assign.flush()
+                self._db.executemany(
+                    'INSERT INTO chunks (row, id, text, metadata) VALUES (?, ?, ?, ?)',
+                    [(start + i, id, text, json.dumps(meta, ensure_ascii=False) if meta is not None else None)
+                     for i, (id, text, meta) in enumerate(zip(ids, texts, metadata))],
+                )
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('size', ?)", (str(end),))
+            self.size = end
+            self._live[replaced] = False
+            self._live[start:end] = True
+
+    def add(self, texts: Sequence[str], ids: Optional[Sequence[str]] = None,
+            metadata: Optional[Sequence[Optional[dict]]] = None, batch_size: int = 256) -> List[str]:
+        """Embed and add chunks. Returns their ids (content hashes by default).
+
+        Chunks with the same id (identical texts, with the default ids) are embedded and added
+        once, the last of them wins.
+        """
+        ids = list(ids) if ids is not None else [hashlib.sha256(text.encode('utf-8')).hexdigest()[:32] for text in texts]
+        metadata = list(metadata) if metadata is not None else [None] * len(texts)
+        keep = sorted({id: i for i, id in enumerate(ids)}.values())
+        unique_ids, texts, metadata = ([items[i] for i in keep] for items in (ids, texts, metadata))
+        for start in range(0, len(texts), batch_size):
+            end = start + batch_size
+            self.add_vectors(unique_ids[start:end], texts[start:end], self.embedder.embed(texts[start:end]), metadata[start:end])
+        return ids
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Delete chunks by id. Returns the number of deleted chunks."""
+        with self._lock:
+            with self._db:
+                rows = self._delete_rows(ids)
+            self._live[rows] = False
+            return len(rows)
+
+    def _delete_rows(self, ids: Iterable[str]) -> List[int]:
+        """Delete the rows of `ids` from SQLite without committing. Returns the deleted row numbers."""
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            rows += [r for (r,) in self._db.execute(f'SELECT row FROM chunks WHERE id IN ({",".join("?" * len(part))})', part)]
+        if rows:
+            self._db.executemany('DELETE FROM chunks WHERE row = ?', [(r,) for r in rows])
+        return rows
+
+    def train(self, n_lists: Optional[int] = None, sample: int = 100_000, iterations: int = 10, seed: int = 0) -> int:
+        """Cluster the vectors into inverted lists (IVF) so that a query scans only the lists nearest to it.
+
+        Spherical k-means runs on a sample of the live vectors, then every row is assigned to its list.
+        Rows added later are assigned on `add`; train again only when the data has changed a lot.
+
+        Args:
+            n_lists (Optional[int], optional): Number of lists. Defaults to the square root of the number of chunks.
+            sample (int, optional): Max vectors used for clustering. Defaults to 100000.
+            iterations (int, optional): k-means iterations. Defaults to 10.
+            seed (int, optional): Random seed. Defaults to 0.
+
+        Returns:
+            int: Number of lists.
+        """
+        with self._lock:
+            rows = np.flatnonzero(self._live[:self.size])
+            if not len(rows):
+                raise ValueError(f"Index {self.path} is empty")
+            n_lists = min(n_lists or max(1, int(np.sqrt(len(rows)))), len(rows))
+            rng = np.random.default_rng(seed)
+            data = np.asarray(self._vectors[np.sort(rng.choice(rows, min(len(rows), max(sample, n_lists)), replace=False))])
+            centroids = data[rng.choice(len(data), n_lists, replace=False)]
+            for _ in range(iterations):
+                labels = self._nearest(data, centroids)
+                order = np.argsort(labels, kind='stable')
+                counts = np.bincount(labels, minlength=n_lists)
+                sums = np.zeros_like(centroids)
+                filled = counts > 0
+                sums[filled] = np.add.reduceat(data[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled])
+                # Empty lists get a random sample vector
+                sums[~filled] = data[rng.choice(len(data), int((~filled).sum()))]
+                centroids = normalize(sums)
+
+            np.save(self.path / 'centroids.npy', centroids)
+            self.centroids = centroids
+            self._assign[:self.size] = self._nearest(self._vectors[:self.size], centroids)
+            self._assign.flush()
+            self._lists = None
+            self._inverted_lists()
+            logger.info(f"Trained {n_lists} lists over {len(rows)} chunks of {self.path}")
+            return n_lists
+
+    def _inverted_lists(self) -> tuple:
+        """Rows sorted by list and the list boundaries; rebuilt (without retraining) when many rows were added since."""
+        if self._lists is None or self.size - self._indexed > max(self.block_rows, self.size // 20):
+            assign = np.asarray(self._assign[:self.size])
+            order = np.argsort(assign, kind='stable')
+            unassigned = int((assign < 0).sum())  # -1 sorts first
+            counts = np.bincount(assign[assign >= 0], minlength=len(self.centroids))
+            self._lists = (order, unassigned + np.concatenate([[0], np.cumsum(counts)]))
+            self._indexed = self.size
+        return self._lists
+
+    def _candidates(self, queries: np.ndarray, n_probe: int) -> np.ndarray:
+        """Rows of the `n_probe` lists nearest to any of the queries, plus the rows not in the lists."""
+        order, offsets = self._inverted_lists()
+        scores = queries @ self.centroids.T
+        n_probe = min(n_probe, scores.shape[1])
+        probed = np.unique(np.argpartition(-scores, n_probe - 1, axis=1)[:, :n_probe])
+        parts = [order[:offsets[0]], *(order[offsets[l]:offsets[l + 1]] for l in probed), np.arange(self._indexed, self.size)]
+        return np.sort(np.concatenate(parts))  # read the file in row order
+
+    def _top_k(self, queries: np.ndarray, blocks: Iterable[np.ndarray], k: int) -> List[List[tuple]]:
+        """Top-k live rows of the given row blocks for every query (normalized)."""
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for rows in blocks:
+            if not len(rows):
+                continue
+            # A contiguous range of rows is read as a slice, without a fancy-index copy
+            vectors = self._vectors[rows[0]:rows[-1] + 1] if rows[-1] - rows[0] + 1 == len(rows) else self._vectors[rows]
+            scores = queries @ vectors.T  # (queries, rows)
+            scores[:, ~self._live[rows]] = -np.inf
+            if scores.shape[1] > k:
+                top = np.argpartition(scores, -k, axis=1)[:, -k:]
+                scores = np.take_along_axis(scores, top, axis=1)
+                top_rows = rows[top]
+            else:
+                top_rows = np.broadcast_to(rows, scores.shape)
+            best_rows = np.concatenate([best_rows, top_rows], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_rows.shape[1] > k:
+                keep = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        results = []
+        for rows, scores in zip(best_rows, best_scores):
+            order = np.argsort(-scores)
+            results.append([(int(rows[i]), float(scores[i])) for i in order if np.isfinite(scores[i])])
+        return results
+
+    def search_vectors(self, queries: np.ndarray, k: int = 5, n_probe: Optional[int] = None,
+                       exact: bool = False) -> List[List[tuple]]:
+        """Cosine top-k of a batch of query vectors.
+
+        Without lists (before `train()`) or with `exact=True` every row is scanned, block by block for the
+        whole batch of queries. With lists every query scans only its `n_probe` nearest lists (approximate).
+
+        Returns:
+            List[List[tuple]]: For every query, up to `k` `(row, score)` pairs by descending score.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        with self._lock:
+            if self.centroids is None or exact:
+                blocks = (np.arange(start, min(start + self.block_rows, self.size)) for start in range(0, self.size, self.block_rows))
+                return self._top_k(queries, blocks, k)
+            # The union of the lists of several queries grows faster than batching saves: each query on its own
+            return [self._top_k(query[None], [self._candidates(query[None], n_probe or self.n_probe)], k)[0]
+                    for query in queries]
+
+    def search(self, queries: Sequence[str], k: int = 5, **kwargs) -> List[List[SearchHit]]:
+        """Cosine top-k chunks for every query. See `search_vectors` for `n_probe` and `exact`."""
+        found = self.search_vectors(self.embedder.embed(list(queries)), k, **kwargs)
+        rows = {row for hits in found for row, _ in hits}
+        records: Dict[int, tuple] = {}
+        with self._lock:
+            for row in rows:
+                record = self._db.execute('SELECT id, text, metadata FROM chunks WHERE row = ?', (row,)).fetchone()
+                if record:
+                    records[row] = record
+        return [
+            [SearchHit(records[row][0], records[row][1], score, json.loads(records[row][2]) if records[row][2] else None)
+             for row, score in hits if row in records]
+            for hits in found
+        ]
+
+    def query(self, question: str, k: int = 5, **kwargs) -> List[SearchHit]:
+        """Top-k chunks for one question."""
+        return self.search([question], k, **kwargs)[0]
+
+    def compact(self) -> int:
+        """Rewrite the index files without the deleted rows. Returns the number of reclaimed rows."""
+        with self._lock:
+            rows = np.flatnonzero(self._live[:self.size])
+            reclaimed = self.size - len(rows)
+            if not reclaimed:
+                return 0
+            capacity = max(len(rows), 1024)
+            # New files first, then the renumbered rows and the `swap` marker in one commit, then the
+            # files are swapped: after a crash at any step `_recover()` leaves rows and files consistent
+            self._write('_vectors', 'vectors.npy', capacity, source=_Rows(self._vectors, rows))
+            self._write('_assign', 'lists.npy', capacity, fill=-1, source=_Rows(self._assign, rows))
+            with self._db:
+                # DDL runs outside the transaction: a table left by a failed compaction is dropped first
+                self._db.execute('DROP TABLE IF EXISTS temp.renumber')
+                self._db.execute('CREATE TEMP TABLE renumber (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)')
+                self._db.executemany('INSERT INTO renumber VALUES (?, ?)', [(int(old), new) for new, old in enumerate(rows)])
+                self._db.execute('UPDATE chunks SET row = -1 - (SELECT new FROM renumber WHERE old = chunks.row)')
+                self._db.execute('UPDATE chunks SET row = -1 - row')
+                self._db.execute('DROP TABLE renumber')
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('size', ?)", (str(len(rows)),))
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('swap', '1')")
+            self._swap('_vectors', 'vectors.npy')
+            self._swap('_assign', 'lists.npy')
+            self._db.execute("DELETE FROM meta WHERE key = 'swap'")
+            self._db.commit()
+            self.size = len(rows)
+            self._live = np.zeros(capacity, dtype=bool)
+            self._live[:self.size] = True
+            self._lists = None
+            logger.info(f"Compacted {self.path}: {reclaimed} deleted rows reclaimed")
+            return reclaimed
+
+    def add_directory(self, data_dir: str | Path, pattern: str = '*.txt', chunk_tokens: int = 500,
+                      count: Callable[[str], int] = estimate_tokens) -> int:
+        """Chunk and add the text files of a directory. Re-adding a file replaces its chunks.
+
+        Returns:
+            int: Number of chunks added.
+        """
+        added = 0
+        for file_path in sorted(Path(data_dir).rglob(pattern)):
+            source = str(file_path)
+            with self._lock:
+                old = [id for (id,) in self._db.execute("SELECT id FROM chunks WHERE json_extract(metadata, '$.source') = ?", (source,))]
+            self.delete(old)
+            lines = file_path.read_text(encoding='utf-8', errors='replace').splitlines()
+            texts = ['\n'.join(chunk) for chunk in iter_chunks(lines, chunk_tokens, count)]
+            self.add(texts, [f'{source}#{i}' for i in range(len(texts))], [{'source': source, 'chunk': i} for i in range(len(texts))])
+            added += len(texts)
+        return added
+
+    def close(self) -> None:
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._db.close()
+
+
+def answer(index: VectorIndex, question: str, ask: Callable[[str], Optional[str]], k: int = 5) -> Optional[str]:
+    """Answer a question with a model, giving it the `k` most similar chunks as context."""
+    context = '\n\n'.join(hit.text for hit in index.query(question, k))
+    return ask(f"Ответь на вопрос, используя только этот контекст:\n{context}\n\nВопрос: {question}")
+
+
+def main(data_dir: str | Path = './data', index_dir: str | Path = gs.path.data / 'AI' / 'llama' / 'index') -> None:
+    """Index `data_dir` and answer questions in the console (the workflow of `docs/model.md`)."""
+    index = VectorIndex(index_dir)
+    logger.info(f"Indexed {index.add_directory(data_dir)} chunks of {data_dir}")
+    while True:
+        query = input("Ask a question: ")
+        if not query:
+            print("Goodbye")
+            break
+        for hit in index.query(query):
+            print(f"{hit.score:.3f} {hit.id}: {hit.text[:200]}")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
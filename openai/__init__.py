@@ -8,6 +8,17 @@
 from packaging.version import Version
 from .version import __version__,  __doc__, __details__
 
-from .translator import translate
-from .model import OpenAIModel
+from src.ai._lazy import lazy_module
+
+# The translator and the model (openai SDK) are imported only when accessed
+_lazy_imports = {
+    'translate': '.translator',
+    'TranslationEngine': '.translator',
+    'TranslationMemory': '.translator',
+    'OpenAIModel': '.model',
+    'AsyncOpenAIModel': '.model',
+}
+
+__all__ = list(_lazy_imports)
+__getattr__, __dir__ = lazy_module(__name__, _lazy_imports)
 
@@ -16,7 +16,18 @@
 from packaging.version import Version
 from .version import __version__, __doc__, __details__ 
 
-from .discord_bot_trainger import *
-from .chatterbox import recognizer, text_to_speech
+from src.ai._lazy import lazy_module
+
+# speech_recognition, pydub, gTTS and discord are imported only when a name is accessed
+_lazy_imports = {
+    'recognizer': '.chatterbox',
+    'text_to_speech': '.chatterbox',
+    'KeyedWorkQueue': '.work_queue',
+    'QueueFull': '.work_queue',
+    'AudioWorkers': '.audio_workers',
+}
+
+__all__ = list(_lazy_imports)
+__getattr__, __dir__ = lazy_module(__name__, _lazy_imports)
 
 
@@ -0,0 +1,46 @@
+## \file ../src/ai/openai/bots/_experiments/audio_workers_benchmark.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Throughput of `AudioWorkers` by number of worker processes.
+
+Every job transcodes the sample voice message to PCM (`_decode_job`, no network); with
+`--recognize` the jobs run the full recognition through Google Speech instead. The pool is
+warmed before the clock starts, so process start-up is not measured. Needs ffmpeg.
+
+    python audio_workers_benchmark.py [--jobs 32] [--workers 1 2 4 8] [--recognize]
+"""
+
+import header
+import argparse
+import time
+from pathlib import Path
+
+from src.ai.openai.bots.audio_workers import AudioWorkers, _decode_job
+
+SAMPLE = Path(__file__).parent.parent / 'chatgpt-telegram' / 'voices' / '697897105.mp3'
+
+
+def run(workers: int, jobs: int, recognize: bool) -> float:
+    """Messages per second with `workers` processes."""
+    audio_workers = AudioWorkers(workers=workers, timeout=120)
+    audio_workers.warm()
+    started = time.perf_counter()
+    if recognize:
+        futures = [audio_workers.submit_recognize(audio_file_path=SAMPLE, format='mp3') for _ in range(jobs)]
+    else:
+        futures = [audio_workers.submit(_decode_job, str(SAMPLE), 'mp3') for _ in range(jobs)]
+    for future in futures:
+        audio_workers.result(future)
+    elapsed = time.perf_counter() - started
+    audio_workers.shutdown()
+    return jobs / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--recognize', action='store_true')
+    args = parser.parse_args()
+    for workers in args.workers:
+        print(f"{workers} workers: {run(workers, args.jobs, args.recognize):.1f} messages/s")
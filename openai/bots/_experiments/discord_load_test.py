@@ -0,0 +1,110 @@
+## \file ../src/ai/openai/bots/_experiments/discord_load_test.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Load test of the Discord bot message path with a fake gateway.
+
+Fake channels and users deliver messages straight to `on_message()`; the model is a local
+fake with a fixed latency (one channel gets a very slow model), so no token or network is
+needed. The script reports:
+- event loop lag (a heartbeat task) - must stay low while completions are running;
+- answer latency per channel - the slow channel must not delay the others;
+- answers per user in the flooded channel - users are served round-robin;
+- messages rejected by the per-channel queue (backpressure).
+"""
+
+import header
+import asyncio
+import random
+import time
+from collections import defaultdict
+from statistics import quantiles
+from types import SimpleNamespace
+
+from src.ai.openai.bots import discord_bot_trainger as bot_module
+
+
+class FakeModel:
+    """`AsyncOpenAIModel.ask` with a latency per channel."""
+
+    def __init__(self, latency: float, slow_channel: int, slow_latency: float):
+        self.latency = latency
+        self.slow_channel = slow_channel
+        self.slow_latency = slow_latency
+
+    async def ask(self, text: str) -> str:
+        channel = int(text.split(':')[0])
+        await asyncio.sleep(self.slow_latency if channel == self.slow_channel else self.latency)
+        return f'answer to {text}'
+
+
+class FakeChannel:
+    def __init__(self, id: int, answers: list):
+        self.id = id
+        self.answers = answers
+
+    async def send(self, text: str):
+        self.answers.append((time.perf_counter(), self.id, text))
+
+
+def fake_message(channel: FakeChannel, user: int, n: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        author=SimpleNamespace(id=user, voice=None),
+        channel=channel,
+        content=f'{channel.id}:{user}:{n}:{time.perf_counter()}',
+        attachments=[],
+    )
+
+
+async def heartbeat(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(channels: int = 20, users: int = 4, messages: int = 3, flood_user_messages: int = 30,
+              latency: float = 0.2, slow_latency: float = 2.0):
+    bot_module.model = FakeModel(latency, slow_channel=0, slow_latency=slow_latency)
+    answers: list = []
+    fake_channels = [FakeChannel(i, answers) for i in range(channels)]
+    stop = asyncio.Event()
+    lags: list = []
+    beat = asyncio.create_task(heartbeat(lags, stop))
+
+    started = time.perf_counter()
+    # Channel 1: user 0 floods the channel, the others write as usual
+    for n in range(flood_user_messages):
+        await bot_module.on_message(fake_message(fake_channels[1], 0, n))
+    for n in range(messages):
+        for channel in fake_channels:
+            for user in range(1, users + 1):
+                await bot_module.on_message(fake_message(channel, user, n))
+                await asyncio.sleep(random.uniform(0, 0.001))
+    await bot_module.work_queue.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+
+    latency_by_channel = defaultdict(list)
+    order_channel_1 = []
+    rejected = 0
+    for at, channel, text in answers:
+        if text.startswith('Too many requests'):
+            rejected += 1
+            continue
+        _, user, _, sent = text.removeprefix('answer to ').split(':')
+        latency_by_channel[channel].append(at - float(sent))
+        if channel == 1:
+            order_channel_1.append(int(user))
+
+    fast = [l for channel, ls in latency_by_channel.items() if channel != 0 for l in ls]
+    cut = quantiles(fast, n=100)
+    print(f"{len(answers)} answers in {elapsed:.1f}s, rejected {rejected}, queue {bot_module.work_queue.stats()}")
+    print(f"event loop lag: max {max(lags) * 1000:.1f} ms")
+    print(f"answer latency (fast channels): p50 {cut[49]:.2f}s, p99 {cut[98]:.2f}s; "
+          f"slow channel: max {max(latency_by_channel[0]):.2f}s")
+    print(f"channel 1, first 12 answers by user: {order_channel_1[:12]}")
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,10 @@
+﻿"""! Модуль управления моделью OpenAI 
+"""
+## \file ../src/ai/openai/bots/_experiments/header.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+import sys,os
+from pathlib import Path
+__root__ : Path = os.getcwd() [:os.getcwd().rfind(r'hypotez')+7]
+sys.path.append (__root__)     
\ No newline at end of file
@@ -0,0 +1,192 @@
+## \file ../src/ai/openai/bots/audio_workers.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Process pool for speech recognition and synthesis.
+
+Transcoding and recognition are CPU and subprocess heavy. `AudioWorkers` runs them in a
+pool of worker processes, each initialized once (ffmpeg path, `sr.Recognizer`), so the
+bots' event loops and threads only wait on futures. Jobs have timeouts and can be
+cancelled, but only a job that has not started yet is removed from the queue: a running
+job cannot be stopped and keeps its worker until it ends. Every blocking step of a job
+has its own timeout (the download, ffmpeg in `decode_audio`, the requests to Google
+Speech Recognition and gTTS), so a running job ends within a bounded time.
+
+@code
+audio_workers = AudioWorkers(workers=4)
+audio_workers.warm()                                  # start the processes in advance
+text = await audio_workers.recognize(voice_url, timeout=30)
+clip = await audio_workers.synthesize(text, lang='ru')
+@endcode
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError, wait
+from pathlib import Path
+from typing import Optional
+
+from src.logger import logger
+from src.ai.openai.bots import chatterbox
+
+# State of a worker process, created in `_init_worker`
+_speech_recognizer = None
+_speech_timeout: float = chatterbox.SPEECH_TIMEOUT
+
+
+def _init_worker(converter: str, speech_timeout: float) -> None:
+    """Initialize a worker process: ffmpeg path of the parent and a reusable recognizer.
+
+    Args:
+        converter (str): ffmpeg path.
+        speech_timeout (float): Timeout of every request to Google Speech Recognition and gTTS in seconds.
+    """
+    global _speech_recognizer, _speech_timeout
+    chatterbox.AudioSegment.converter = converter
+    _speech_timeout = speech_timeout
+    _speech_recognizer = chatterbox.make_recognizer(speech_timeout)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _recognize_job(audio_url: Optional[str], audio_file_path: Optional[str], language: str, format: Optional[str]) -> str:
+    return chatterbox.recognizer(audio_url, Path(audio_file_path) if audio_file_path else None,
+                                 language, format, speech_recognizer=_speech_recognizer)
+
+
+def _decode_job(audio_file_path: str, format: Optional[str]) -> int:
+    """Transcode a local file to PCM only (no network). Returns the number of PCM bytes."""
+    return len(chatterbox.decode_audio(Path(audio_file_path).read_bytes(), format))
+
+
+def _synthesize_job(text: str, lang: str, voice: Optional[str]) -> bytes:
+    return chatterbox.synthesize(text, lang, voice, _speech_timeout)
+
+
+class AudioWorkers:
+    """Warm process pool running `recognizer` and `synthesize` jobs."""
+
+    workers: int
+    timeout: Optional[float]
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = 60):
+        """
+        Args:
+            workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+            timeout (Optional[float], optional): Default job timeout in seconds. `None` - no timeout.
+                The requests to the speech services of a job time out after
+                `min(timeout, chatterbox.SPEECH_TIMEOUT)` seconds each.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        """The process pool, created on first use."""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_init_worker,
+                        initargs=(chatterbox.AudioSegment.converter, min(self.timeout or chatterbox.SPEECH_TIMEOUT, chatterbox.SPEECH_TIMEOUT)),
+                    )
+        return self._pool
+
+    def warm(self, timeout: Optional[float] = 60) -> int:
+        """Start and initialize every worker process. Returns the number of distinct workers that answered."""
+        futures = [self.pool.submit(_ping) for _ in range(self.workers)]
+        done, _ = wait(futures, timeout=timeout)
+        return len({f.result() for f in done if not f.exception()})
+
+    def submit(self, fn, *args) -> Future:
+        """Submit a job function of this module. Returns its future."""
+        future = self.pool.submit(fn, *args)
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(self._count)
+        return future
+
+    def _count(self, future: Future) -> None:
+        with self._lock:
+            if future.cancelled():
+                self.cancelled += 1
+            elif future.exception():
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def submit_recognize(self, audio_url: str = None, audio_file_path: str | Path = None,
+                         language: str = 'ru-RU', format: Optional[str] = 'ogg') -> Future:
+        """Queue a recognition job. See `chatterbox.recognizer` for the arguments."""
+        return self.submit(_recognize_job, audio_url, str(audio_file_path) if audio_file_path else None, language, format)
+
+    def submit_synthesize(self, text: str, lang: str = 'ru', voice: Optional[str] = None) -> Future:
+        """Queue a synthesis job. See `chatterbox.synthesize` for the arguments."""
+        return self.submit(_synthesize_job, text, lang, voice)
+
+    def result(self, future: Future, timeout: Optional[float] = None):
+        """Wait for a job. On timeout `TimeoutError` is raised and the job is cancelled if it has not started yet."""
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except TimeoutError:
+            self._timed_out(future)
+            raise
+
+    async def wait(self, future: Future, timeout: Optional[float] = None):
+        """Await a job from the event loop. On timeout or cancellation of the caller the job is cancelled if it has not started yet."""
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(future)
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def _timed_out(self, future: Future) -> None:
+        future.cancel()
+        with self._lock:
+            self.timeouts += 1
+        logger.warning(f"Audio job timed out (cancelled: {future.cancelled()})")
+
+    async def recognize(self, audio_url: str = None, audio_file_path: str | Path = None, language: str = 'ru-RU',
+                        format: Optional[str] = 'ogg', timeout: Optional[float] = None) -> str:
+        """Recognize speech in a worker process."""
+        return await self.wait(self.submit_recognize(audio_url, audio_file_path, language, format), timeout)
+
+    async def synthesize(self, text: str, lang: str = 'ru', voice: Optional[str] = None,
+                         timeout: Optional[float] = None) -> bytes:
+        """Synthesize speech in a worker process. Cached clips are returned without a job."""
+        clip = chatterbox.tts_cache.get(text, lang, voice)
+        if clip is None:
+            clip = await self.wait(self.submit_synthesize(text, lang, voice), timeout)
+            chatterbox.tts_cache.set(text, lang, voice, clip)
+        return clip
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'cancelled': self.cancelled,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers, dropping the queued jobs."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
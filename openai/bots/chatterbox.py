@@ -2,6 +2,9 @@
 from pathlib import Path
 import tempfile
 import asyncio
+import subprocess
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import header
 from src.utils import j_loads, j_loads_ns, j_dumps
 from src.logger import logger
@@ -9,41 +12,177 @@ import speech_recognition as sr  # Библиотека для распозна
 import requests  # Для скачивания файлов
 from pydub import AudioSegment  # Библиотека для конвертации аудио
 from gtts import gTTS  # Библиотека для текстового воспроизведения
+from src.ai.openai.bots.tts_cache import TTSCache
 
-def recognizer(audio_url: str = None, audio_file_path:Path = None, language: str = 'ru-RU') -> str:
-    """Download an audio file and recognize speech in it."""
-    if audio_url:  
-    # Download audio file
-        response = requests.get(audio_url)
-        audio_file_path = Path(tempfile.gettempdir()) / "recognized_audio.ogg"
+# Параметры PCM, который получает распознаватель
+SAMPLE_RATE: int = 16000
+SAMPLE_WIDTH: int = 2  # 16 bit
 
-        with open(audio_file_path, 'wb') as f:
-            f.write(response.content)
+# Предел ожидания ответа сервисов Google (распознавание, gTTS) на один запрос, секунды
+SPEECH_TIMEOUT: float = 30
 
-    # Convert OGG to WAV
-    wav_file_path = audio_file_path.with_suffix('.wav')
-    audio = AudioSegment.from_ogg(audio_file_path)  # Load OGG file
-    audio.export(wav_file_path, format='wav')  # Export as WAV
+# Общий пул соединений для загрузки голосовых сообщений (безопасен для параллельных GET)
+_session = requests.Session()
 
-    # Initialize recognizer
+
+def download_audio(audio_url: str, timeout: float = SPEECH_TIMEOUT) -> bytes:
+    """Stream an audio file into memory.
+
+    Args:
+        audio_url (str): URL of the file.
+        timeout (float, optional): Connect/read timeout in seconds. Defaults to `SPEECH_TIMEOUT`.
+
+    Returns:
+        bytes: Content of the file.
+    """
+    buffer = BytesIO()
+    with _session.get(audio_url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for block in response.iter_content(64 * 1024):
+            buffer.write(block)
+    return buffer.getvalue()
+
+
+def decode_audio(data: bytes, format: str = None, timeout: float = 60) -> bytes:
+    """Transcode an audio file (OGG/Opus, mp3, m4a...) to mono 16 kHz 16 bit PCM in memory.
+
+    ffmpeg (`AudioSegment.converter`) reads from stdin and writes to stdout: no temp files,
+    every call has its own pipes, so concurrent calls never share state.
+
+    Args:
+        data (bytes): Encoded audio.
+        format (str, optional): Input format for ffmpeg (`ogg`, `mp3`...). `None` - detected by ffmpeg.
+        timeout (float, optional): Max seconds for the transcoding. Defaults to 60.
+
+    Returns:
+        bytes: Raw PCM samples.
+    """
+    command = [AudioSegment.converter, '-hide_banner', '-loglevel', 'error', '-nostdin']
+    if format:
+        command += ['-f', format]
+    command += ['-i', 'pipe:0', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', 'pipe:1']
+    result = subprocess.run(command, input=data, capture_output=True, timeout=timeout, check=False)
+    if result.returncode:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace')[-500:]}")
+    return result.stdout
+
+
+def make_recognizer(timeout: float = SPEECH_TIMEOUT) -> sr.Recognizer:
+    """Return a recognizer whose requests to Google Speech Recognition time out after `timeout` seconds."""
     recognizer = sr.Recognizer()
-    with sr.AudioFile(str(wav_file_path)) as source:
-        audio_data = recognizer.record(source)
+    recognizer.operation_timeout = timeout
+    return recognizer
+
+
+def recognizer(audio_url: str = None, audio_file_path:Path = None, language: str = 'ru-RU', format: str = 'ogg',
+               speech_recognizer: sr.Recognizer = None) -> str:
+    """Download an audio file and recognize speech in it.
+
+    The file is downloaded, transcoded and recognized in memory, without temp files.
+    Safe to call from several threads at once.
+
+    Args:
+        audio_url (str, optional): URL of the audio file.
+        audio_file_path (Path, optional): Local audio file, used when `audio_url` is not given.
+        language (str, optional): Recognition language. Defaults to 'ru-RU'.
+        format (str, optional): Format of the audio (`ogg` for Telegram/Discord voice messages). `None` - detect.
+        speech_recognizer (sr.Recognizer, optional): Recognizer to reuse (see `audio_workers`). Defaults to `make_recognizer()`.
+
+    Returns:
+        str: Recognized text or a message for the user.
+    """
+    try:
+        data = download_audio(audio_url) if audio_url else Path(audio_file_path).read_bytes()
+        pcm = decode_audio(data, format)
+    except Exception as ex:
+        logger.error(f"Error loading audio {audio_url or audio_file_path}", ex, False)
+        return "Sorry, I could not read the audio."
+
+    # The PCM goes to the recognizer directly, without a WAV file and `sr.AudioFile`
+    audio_data = sr.AudioData(pcm, SAMPLE_RATE, SAMPLE_WIDTH)
+    recognizer = speech_recognizer or make_recognizer()
+    try:
+        # Recognize speech using Google Speech Recognition
+        text = recognizer.recognize_google(audio_data, language=language)
+        logger.info(f'Recognized text: {text}')
+        return text
+    except sr.UnknownValueError:
+        logger.error("Google Speech Recognition could not understand audio")
+        return "Sorry, I could not understand the audio."
+    except sr.RequestError as e:
+        logger.error(f"Could not request results from Google Speech Recognition service; {e}")
+        return "Could not request results from the speech recognition service."
+
+# Ответ бота, когда модель не ответила
+NO_ANSWER: str = "Sorry, I could not get an answer. Please try again later."
+
+# Фразы бота, которые синтезируются заранее (`prewarm`)
+COMMON_PHRASES: list = [
+    NO_ANSWER,
+    "Sorry, I could not understand the audio.",
+    "Sorry, I could not read the audio.",
+    "Could not request results from the speech recognition service.",
+]
+
+# Озвученные ответы, общие для всех ботов процесса
+tts_cache = TTSCache()
+
+
+def synthesize(text: str, lang: str = 'ru', voice: str = None, timeout: float = SPEECH_TIMEOUT) -> bytes:
+    """!Synthesize `text` to mp3 bytes in memory, using the clip cache. Blocking (network call to gTTS).
+
+    Args:
+        text (str): Text to speak.
+        lang (str, optional): Language of the text. Defaults to 'ru'.
+        voice (str, optional): Accent, the Google domain of gTTS (`com`, `co.uk`, `com.au`...). Defaults to `com`.
+        timeout (float, optional): Timeout of every request to gTTS in seconds. Defaults to `SPEECH_TIMEOUT`.
+
+    Returns:
+        bytes: mp3 clip.
+    """
+    clip = tts_cache.get(text, lang, voice)
+    if clip is None:
+        buffer = BytesIO()
+        gTTS(text=text, lang=lang, tld=voice or 'com', timeout=timeout).write_to_fp(buffer)
+        clip = buffer.getvalue()
+        tts_cache.set(text, lang, voice, clip)
+    return clip
+
+
+def prewarm(phrases: list = None, lang: str = 'ru', voice: str = None, workers: int = 4) -> int:
+    """!Synthesize the common bot phrases in advance, in parallel.
+
+    Returns:
+        int: Number of phrases in the cache.
+    """
+    phrases = phrases or COMMON_PHRASES
+
+    def warm(phrase: str) -> bool:
         try:
-            # Recognize speech using Google Speech Recognition
-            text = recognizer.recognize_google(audio_data, language=language)
-            logger.info(f'Recognized text: {text}')
-            return text
-        except sr.UnknownValueError:
-            logger.error("Google Speech Recognition could not understand audio")
-            return "Sorry, I could not understand the audio."
-        except sr.RequestError as e:
-            logger.error(f"Could not request results from Google Speech Recognition service; {e}")
-            return "Could not request results from the speech recognition service."
-        
-async def text_to_speech(text:str, lang:str='ru'):
-    """!Convert text to speech and play it in a voice channel."""
-    tts = gTTS(text=text, lang='ru')  # Замените 'ru' на нужный язык
-    audio_file_path = f"{tempfile.gettempdir()}/response.mp3"  # Путь к временно созданному файлу
-    tts.save(audio_file_path)  # Сохраняем аудиофайл
-    return audio_file_path
\ No newline at end of file
+            synthesize(phrase, lang, voice)
+            return True
+        except Exception as ex:
+            logger.error(f"Error synthesizing {phrase!r}", ex, False)
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts') as executor:
+        return sum(executor.map(warm, phrases))
+
+
+def save_speech(text: str, lang: str = 'ru', voice: str = None) -> str:
+    """!Synthesize `text` into a new temporary mp3 file. Blocking (network call to gTTS).
+
+    Returns:
+        str: Path of the file. Every call creates its own file, so concurrent calls never overwrite each other.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as file:
+        file.write(synthesize(text, lang, voice))  # Сохраняем аудиофайл
+    return file.name
+
+async def text_to_speech(text:str, lang:str='ru', voice: str = None) -> bytes:
+    """!Convert text to speech in memory. The synthesis runs in a worker thread, so the event loop is not blocked.
+
+    Returns:
+        bytes: mp3 clip.
+    """
+    return await asyncio.to_thread(synthesize, text, lang, voice)
@@ -4,9 +4,12 @@ from discord.ext import commands
 from pathlib import Path
 import tempfile
 import asyncio
+from io import BytesIO
+import threading
+from collections import defaultdict
 import header
 from src.settings import gs
-from src.ai.openai.model.training import Model
+from src.ai.openai.model.async_model import AsyncOpenAIModel
 from src.utils import j_loads, j_loads_ns, j_dumps
 from src.logger import logger
 import speech_recognition as sr  # Библиотека для распознавания речи
@@ -14,6 +17,8 @@ import requests  # Для скачивания файлов
 from pydub import AudioSegment  # Библиотека для конвертации аудио
 from gtts import gTTS  # Библиотека для текстового воспроизведения
 from .chatterbox import *
+from .work_queue import KeyedWorkQueue, QueueFull
+from .audio_workers import AudioWorkers
 
 # Указываем путь к ffmpeg
 path_to_ffmpeg = str(fr"{gs.path.bin}\ffmpeg\bin\ffmpeg.exe")
@@ -28,13 +33,43 @@ intents.message_content = True
 intents.voice_states = True
 bot = commands.Bot(command_prefix=PREFIX, intents=intents)
 
-# Create model object
-model = Model()
+# Create model object. `ask()` is a coroutine on the async client: a slow completion never blocks the event loop
+model = AsyncOpenAIModel()
+
+# One worker per channel: messages of a channel are answered in turn, users round-robin,
+# a full queue rejects a new message at once
+work_queue = KeyedWorkQueue(max_pending=20, max_per_user=3, concurrency=16)
+
+# Speech recognition and synthesis run in a pool of warm processes
+audio_workers = AudioWorkers(workers=4, timeout=60)
+
+# A guild has one voice client: the lanes of its text channels take turns to connect, play and disconnect
+voice_locks = defaultdict(asyncio.Lock)
+
+# The event loop keeps only weak references to tasks: background tasks are held here until they finish
+background_tasks: set = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """!Start `coro` as a task that is kept alive until it finishes and whose error is logged."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _background_done(task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error('Background task failed', task.exception(), False)
 
 @bot.event
 async def on_ready():
     """!Called when the bot is ready."""
     logger.info(f'Logged in as {bot.user}')
+    # Frequent phrases are synthesized ahead of time in the background
+    run_in_background(asyncio.to_thread(audio_workers.warm))
+    run_in_background(asyncio.to_thread(prewarm))
 
 @bot.command(name='hi')
 async def hi(ctx):
@@ -73,10 +108,11 @@ async def train(ctx, data: str = None, data_dir: str = None, positive: bool = Tr
         await attachment.save(file_path)
         data = file_path
 
-    job_id = model.train(data, data_dir, positive)
+    # Blocking SDK and file calls run in a worker thread
+    job_id = await asyncio.to_thread(model.train, data, data_dir, positive)
     if job_id:
         await ctx.send(f'Model training started. Job ID: {job_id}')
-        model.save_job_id(job_id, "Training task started")
+        await asyncio.to_thread(model.save_job_id, job_id, "Training task started")
     else:
         await ctx.send('Failed to start training.')
 
@@ -139,25 +175,30 @@ async def correct(ctx, message_id: int, *, correction: str):
         if message:
             # Log or store the correction
             logger.info(f"Correction for message ID {message_id}: {correction}")
-            store_correction(message.content, correction)
+            await asyncio.to_thread(store_correction, message.content, correction)
             await ctx.send(f"Correction received: {correction}")
         else:
             await ctx.send("Message not found.")
     except Exception as ex:
         await ctx.send(f'An error occurred: {ex}')
 
+_corrections_lock = threading.Lock()
+
 def store_correction(original_text: str, correction: str):
-    """!Store the correction for future reference or retraining."""
+    """!Store the correction for future reference or retraining.
+
+    Blocking: call it with `asyncio.to_thread` from the event loop.
+    """
     logger.info('store_correction()')
     correction_file = Path("corrections_log.txt")
-    with correction_file.open("a") as file:
+    with _corrections_lock, correction_file.open("a", encoding="utf-8") as file:
         file.write(f"Original: {original_text}\nCorrection: {correction}\n\n")
 
 @bot.command(name='feedback')
 async def feedback(ctx, *, feedback_text: str):
     """!Submit feedback about the model's response."""
     logger.info(f'feedback({ctx})')
-    store_correction("Feedback", feedback_text)
+    await asyncio.to_thread(store_correction, "Feedback", feedback_text)
     await ctx.send('Thank you for your feedback. We will use it to improve the model.')
 
 @bot.command(name='getfile')
@@ -203,20 +244,49 @@ async def getfile(ctx, file_path: str):
         
 async def text_to_speech_and_play(text, channel):
     """!Convert text to speech and play it in a voice channel."""
-    tts = gTTS(text=text, lang='ru')  # Замените 'ru' на нужный язык
-    audio_file_path = f"{tempfile.gettempdir()}/response.mp3"  # Путь к временно созданному файлу
-    tts.save(audio_file_path)  # Сохраняем аудиофайл
+    clip = await audio_workers.synthesize(text, 'ru')  # Замените 'ru' на нужный язык; повторные фразы берутся из кэша
+
+    async with voice_locks[channel.guild.id]:
+        voice_channel = channel.guild.voice_client
+        if not voice_channel:
+            voice_channel = await channel.connect()  # Подключаемся к голосовому каналу
+
+        # `after` вызывается из потока плеера по окончании воспроизведения - ждём события вместо опроса `is_playing()`
+        loop = asyncio.get_running_loop()
+        finished = asyncio.Event()
 
-    voice_channel = channel.guild.voice_client
-    if not voice_channel:
-        voice_channel = await channel.connect()  # Подключаемся к голосовому каналу
+        def after(ex):
+            if ex:
+                logger.error('Error playing the response', ex, False)
+            loop.call_soon_threadsafe(finished.set)
 
-    voice_channel.play(discord.FFmpegPCMAudio(audio_file_path), after=lambda ex: logger.info(f'Finished playing: {ex}'))
+        # Клип передаётся ffmpeg через stdin, без временного файла
+        voice_channel.play(discord.FFmpegPCMAudio(BytesIO(clip), pipe=True), after=after)
+        await finished.wait()
+
+        await voice_channel.disconnect()  # Отключаемся
+
+async def answer(message):
+    """!Get the model response to a text or voice message and deliver it to the text or voice channel."""
+    if message.attachments:
+        # Check if it's an audio attachment
+        attachment = message.attachments[0]
+        if not (attachment.content_type or '').startswith('audio/'):
+            return
+        # Загрузка и распознавание выполняются в процессе-исполнителе
+        text = await audio_workers.recognize(attachment.url, format='ogg' if 'ogg' in attachment.content_type else None)
+    else:
+        text = message.content
 
-    while voice_channel.is_playing():  # Ждем пока играет звук
-        await asyncio.sleep(1)
+    response = await model.ask(text)
+    if not response:
+        response = NO_ANSWER
 
-    await voice_channel.disconnect()  # Отключаемся
+    if message.author.voice:
+        # Если пользователь находится в голосовом канале, подключаемся и воспроизводим ответ
+        await text_to_speech_and_play(response, message.author.voice.channel)
+    else:
+        await message.channel.send(response)  # Отправляем ответ в текстовый канал
 
 @bot.event
 async def on_message(message):
@@ -229,20 +299,11 @@ async def on_message(message):
         await bot.process_commands(message)
         return  # Обрабатываем команды
 
-    if message.attachments:
-        # Check if it's an audio attachment
-        if message.attachments[0].content_type.startswith('audio/'):
-            recognized_text = recognizer(message.attachments[0].url)
-            #await message.channel.send(recognized_text)
-            response = model.send_message(recognized_text)
-
-    else:
-        response = model.send_message(message.content)
-    if message.author.voice:
-        # Если пользователь находится в голосовом канале, подключаемся и воспроизводим ответ
-        await text_to_speech_and_play(response, message.author.voice.channel)
-    else:
-        await message.channel.send(response)  # Отправляем ответ в текстовый канал
+    # Ответ готовится в очереди канала, `on_message` сразу возвращает управление циклу событий
+    try:
+        work_queue.submit(message.channel.id, message.author.id, lambda: answer(message))
+    except QueueFull:
+        await message.channel.send('Too many requests in this channel, please wait for the previous answers.')
 
 if __name__ == "__main__":
     bot.run(gs.credentials.discord.bot_token)
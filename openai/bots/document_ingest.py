@@ -0,0 +1,220 @@
+## \file ../src/ai/openai/bots/document_ingest.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Streaming ingestion of uploaded text documents.
+
+A document is read from disk in blocks, decoded incrementally (the encoding is detected on
+the first block), split into token-bounded chunks and the chunks are summarized by the
+model concurrently; the chunk summaries are then merged into one summary, level by level,
+so no prompt exceeds the chunk budget. Only the chunks in flight and the (short) chunk
+summaries are held in memory, whatever the size of the file.
+
+@code
+summary = await summarize_document(model.ask, tmp_file_path, chunk_tokens=3000,
+                                   count=model.token_counter.count, concurrency=4,
+                                   progress=report_progress)
+await update.message.reply_text(summary.text)
+@endcode
+"""
+
+import codecs
+import inspect
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from src.logger import logger
+from src.ai.batch import aiter_ask_many
+from src.ai.chunking import iter_chunks
+from src.ai.dialogue_memory import estimate_tokens
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+BLOCK_SIZE: int = 64 * 1024  # Bytes read from the file at a time
+MAX_LINE_CHARS: int = 4096  # Longer lines are split into pieces
+FALLBACK_ENCODING: str = 'cp1251'  # If the file is not UTF-8 and `charset_normalizer` is not installed
+
+CHUNK_PROMPT: str = "Часть {index} документа «{name}». Кратко изложи её содержание, сохранив факты, имена и числа:\n{text}"
+MERGE_PROMPT: str = "Объедини краткие изложения частей документа «{name}» в одно связное изложение:\n{text}"
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Detect the encoding of a text from its first bytes.
+
+    Order: BOM, valid UTF-8, `charset_normalizer` (if installed), `FALLBACK_ENCODING`.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # `final=False`: a multibyte character may be cut at the block boundary
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if from_bytes is not None:
+        match = from_bytes(sample).best()
+        if match is not None:
+            return match.encoding
+    return FALLBACK_ENCODING
+
+
+def iter_lines(stream: BinaryIO, encoding: Optional[str] = None, block_size: int = BLOCK_SIZE,
+               max_line_chars: int = MAX_LINE_CHARS) -> Iterator[str]:
+    """Decode a binary stream incrementally and yield its lines.
+
+    Undecodable bytes are replaced, so a broken byte in the middle of a file does not stop the
+    ingestion. Lines longer than `max_line_chars` are yielded in pieces, so a file without line
+    breaks is never held in memory as a whole.
+
+    Args:
+        stream (BinaryIO): File opened in binary mode.
+        encoding (Optional[str], optional): Encoding of the text. Detected on the first block by default.
+        block_size (int, optional): Bytes read at a time. Defaults to `BLOCK_SIZE`.
+        max_line_chars (int, optional): Max characters of one yielded line. Defaults to `MAX_LINE_CHARS`.
+    """
+    block = stream.read(block_size)
+    decoder = codecs.getincrementaldecoder(encoding or detect_encoding(block))(errors='replace')
+    tail = ''
+    while block:
+        tail += decoder.decode(block)
+        *lines, tail = tail.split('\n')
+        for line in lines:
+            yield from _split_long(line, max_line_chars)
+        if len(tail) > max_line_chars:
+            yield tail[:max_line_chars]
+            tail = tail[max_line_chars:]
+        block = stream.read(block_size)
+    tail += decoder.decode(b'', final=True)
+    for line in tail.split('\n'):
+        yield from _split_long(line, max_line_chars)
+
+
+def _split_long(line: str, max_chars: int) -> Iterator[str]:
+    for start in range(0, len(line), max_chars):
+        yield line[start:start + max_chars]
+
+
+class DocumentSummary:
+    """Result of `summarize_document`."""
+
+    __slots__ = ('name', 'chunks', 'failed', 'bytes', 'encoding', 'text')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.chunks = 0  # number of chunks sent to the model
+        self.failed: List[int] = []  # numbers (from 1, as in the prompts) of the chunks without a reply
+        self.bytes = 0  # size of the document
+        self.encoding: Optional[str] = None
+        self.text: Optional[str] = None  # merged summary
+
+    @property
+    def ok(self) -> bool:
+        """`True` if every chunk was summarized and the summaries were merged."""
+        return not self.failed and bool(self.text)
+
+    def __repr__(self) -> str:
+        return f"DocumentSummary(name={self.name!r}, chunks={self.chunks}, failed={self.failed})"
+
+
+Progress = Callable[[int, int, int], Optional[Awaitable[None]]]
+
+
+async def _report(progress: Optional[Progress], *args) -> None:
+    if progress is None:
+        return
+    try:
+        result = progress(*args)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as ex:
+        logger.warning(f"Progress callback failed: {ex}")
+
+
+async def _summarize_all(ask: Callable[..., Awaitable[Any]], prompts: Iterator[str], concurrency: int,
+                         on_result: Callable[[int, bool], Awaitable[None]]) -> Dict[int, str]:
+    """Summarize the prompts concurrently. Returns the non-empty summaries by prompt index."""
+    summaries: Dict[int, str] = {}
+    async for result in aiter_ask_many(ask, prompts, concurrency):
+        ok = result.error is None and bool(result.response)
+        if ok:
+            summaries[result.index] = result.response
+        else:
+            logger.warning(f"Chunk {result.index + 1} of the document failed: {result.error or 'empty reply'}")
+        await on_result(result.index, ok)
+    return summaries
+
+
+async def summarize_document(ask: Callable[..., Awaitable[Any]], path: str | Path, chunk_tokens: int = 3000,
+                             count: Callable[[str], int] = estimate_tokens, concurrency: int = 4,
+                             progress: Optional[Progress] = None, name: Optional[str] = None) -> DocumentSummary:
+    """Summarize a text document of any size with bounded memory.
+
+    Args:
+        ask (Callable[..., Awaitable[Any]]): Coroutine `ask(prompt)` of a model (`AsyncOpenAIModel.ask`).
+        path (str | Path): The document on disk.
+        chunk_tokens (int, optional): Token budget of the text of one prompt. Defaults to 3000.
+        count (Callable[[str], int], optional): Token counter of the model. Defaults to `estimate_tokens`.
+        concurrency (int, optional): Chunks sent to the model at once. Defaults to 4.
+        progress (Optional[Progress], optional): Called as `progress(chunks_done, bytes_read, bytes_total)`
+            after every chunk reply; may be a coroutine function.
+        name (Optional[str], optional): Name of the document in the prompts. Defaults to the file name.
+
+    Returns:
+        DocumentSummary: Merged summary, counters and the numbers of the failed chunks.
+    """
+    path = Path(path)
+    summary = DocumentSummary(name or path.name)
+    summary.bytes = path.stat().st_size
+
+    with path.open('rb') as stream:
+        summary.encoding = detect_encoding(stream.read(BLOCK_SIZE))
+        stream.seek(0)
+
+        def prompts() -> Iterator[str]:
+            # The file is read lazily: only the chunks currently at the model are in memory
+            chunks = iter_chunks(iter_lines(stream, summary.encoding), chunk_tokens, count)
+            for index, chunk in enumerate(chunks, 1):
+                summary.chunks = index
+                yield CHUNK_PROMPT.format(index=index, name=summary.name, text='\n'.join(chunk))
+
+        done = 0
+
+        async def on_chunk(index: int, ok: bool) -> None:
+            nonlocal done
+            done += 1
+            if not ok:
+                summary.failed.append(index + 1)
+            await _report(progress, done, stream.tell(), summary.bytes)
+
+        summaries = await _summarize_all(ask, prompts(), concurrency, on_chunk)
+    summary.failed.sort()
+
+    # Merge level by level: groups of summaries that fit the budget are folded into one
+    texts = [summaries[index] for index in sorted(summaries)]
+    while len(texts) > 1:
+        groups = ['\n\n'.join(group) for group in iter_chunks(texts, chunk_tokens, count)]
+        if len(groups) == len(texts):
+            # No two summaries fit the budget together - they are merged in pairs
+            groups = ['\n\n'.join(texts[i:i + 2]) for i in range(0, len(texts), 2)]
+        merged = await _summarize_all(
+            ask, (MERGE_PROMPT.format(name=summary.name, text=group) for group in groups), concurrency,
+            lambda index, ok: _report(progress, done, summary.bytes, summary.bytes),
+        )
+        if not merged:
+            logger.error(f"Could not merge the summaries of {summary.name}")
+            break
+        texts = [merged.get(index) or groups[index] for index in range(len(groups))]
+    summary.text = texts[0] if texts else None
+    return summary
@@ -1,5 +1,13 @@
 ## \file ../src/ai/openai/bots/telegram_bot_trainger.py
-"""! This script creates a simple Telegram bot using the python-telegram-bot library."""
+"""! This script creates a simple Telegram bot using the python-telegram-bot library.
+
+Updates are dispatched concurrently: every handler puts its work into the lane of its chat
+(`KeyedWorkQueue`) and returns, so chats are answered in parallel while each chat keeps
+its message order. Documents are streamed from disk in token-bounded chunks that are
+summarized concurrently (`document_ingest`). Model calls use the async OpenAI client;
+speech recognition and synthesis run in a pool of warm worker processes (`AudioWorkers`).
+`/stats` shows the queue depth and the audio job counters.
+"""
 from pathlib import Path
 import tempfile
 import asyncio
@@ -8,20 +16,44 @@ from telegram.ext import Application, CommandHandler, MessageHandler, filters, C
 
 import header
 from src.settings import gs
-from src.ai.openai.model.training import Model
+from src.ai.openai.model.async_model import AsyncOpenAIModel
 from src.utils import j_loads, j_loads_ns, j_dumps
 from src.logger import logger
 import speech_recognition as sr  # Библиотека для распознавания речи
 import requests  # Для скачивания файлов
 from pydub import AudioSegment  # Библиотека для конвертации аудио
 from gtts import gTTS  # Библиотека для текстового воспроизведения
-from src.ai.openai.bots.chatterbox import recognizer, text_to_speech
+from io import BytesIO
+from src.ai.openai.bots.chatterbox import NO_ANSWER, prewarm
+from src.ai.openai.bots.audio_workers import AudioWorkers
+from src.ai.openai.bots.work_queue import KeyedWorkQueue, QueueFull
+from src.ai.openai.bots.document_ingest import summarize_document
 
-model = Model()
+model = AsyncOpenAIModel()
 
 # Replace 'YOUR_TOKEN_HERE' with your actual bot token
 TELEGRAM_TOKEN = gs.credentials.telegram.bot_token
 
+MAX_CONCURRENT_UPDATES: int = 32  # Глобальный лимит одновременно обрабатываемых сообщений
+MAX_PENDING_PER_CHAT: int = 20  # Очередь чата, сверх которой сообщения отклоняются
+SPEECH_WORKERS: int = 4  # Процессы для распознавания и синтеза речи
+DOCUMENT_CHUNK_TOKENS: int = 3000  # Размер части документа, отправляемой модели
+DOCUMENT_CONCURRENCY: int = 4  # Части одного документа, обрабатываемые одновременно
+PROGRESS_INTERVAL: float = 3.0  # Не чаще одного обновления прогресса за столько секунд
+
+# Сообщения чата выполняются строго по порядку (один `user` на чат), разные чаты - параллельно
+work_queue = KeyedWorkQueue(max_pending=MAX_PENDING_PER_CHAT, max_per_user=MAX_PENDING_PER_CHAT,
+                            concurrency=MAX_CONCURRENT_UPDATES)
+audio_workers = AudioWorkers(workers=SPEECH_WORKERS, timeout=60)
+
+
+async def dispatch(update: Update, job) -> None:
+    """! Queue `job` (a coroutine function) in the lane of the chat of `update`."""
+    try:
+        work_queue.submit(update.effective_chat.id, None, job)
+    except QueueFull:
+        await update.message.reply_text('Too many messages, please wait for the previous answers.')
+
 async def start(update: Update, context: CallbackContext) -> None:
     """! Handle the /start command."""
     await update.message.reply_text('Hello! I am your simple bot. Type /help to see available commands.')
@@ -31,45 +63,86 @@ async def help_command(update: Update, context: CallbackContext) -> None:
     await update.message.reply_text('Available commands:\n/start - Start the bot\n/help - Show this help message')
     
 async def handle_document(update: Update, context: CallbackContext):
-    # Получаем файл
-    file = await update.message.document.get_file()
-    #tmp_file_path = f"{tempfile.gettempdir()}/received.txt"
-    tmp_file_path = await file.download_to_drive()  # Сохраняем файл локально
-
-    # Читаем содержимое файла
-    with open(tmp_file_path, 'r') as f:
-        file_content = f.read()
-
-    response = model.send_message(f"Обучение модели на следующем содержимом:{file_content}")
-    await update.message.reply_text(response)
-    #tts_file_path = await text_to_speech (response)
-    #await update.message.reply_audio(audio=open(tts_file_path, 'rb'))
-    
+    """! Handle a text document of any size.
+
+    The file is read and decoded incrementally, split into chunks of `DOCUMENT_CHUNK_TOKENS`
+    tokens that are summarized concurrently; the chat gets progress updates and the merged summary.
+    """
+    async def job():
+        document = update.message.document
+        file = await document.get_file()
+        status = await update.message.reply_text(f'Читаю документ {document.file_name}...')
+        last_update = 0.0
+
+        async def report_progress(chunks_done: int, bytes_read: int, bytes_total: int) -> None:
+            nonlocal last_update
+            now = asyncio.get_running_loop().time()
+            if now - last_update < PROGRESS_INTERVAL:
+                return
+            last_update = now
+            percent = 100 * bytes_read // bytes_total if bytes_total else 100
+            await status.edit_text(f'Документ {document.file_name}: прочитано {percent}%, обработано частей: {chunks_done}')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Файл сохраняется на диск, а не в память, и читается потоком; имя от пользователя в путь не попадает
+            tmp_file_path = await file.download_to_drive(Path(tmp_dir) / 'document')
+            summary = await summarize_document(model.ask, tmp_file_path, chunk_tokens=DOCUMENT_CHUNK_TOKENS,
+                                               count=model.token_counter.count, concurrency=DOCUMENT_CONCURRENCY,
+                                               progress=report_progress, name=document.file_name)
+
+        if not summary.text:
+            await status.edit_text(NO_ANSWER)
+            return
+        note = f' (частей без ответа: {len(summary.failed)})' if summary.failed else ''
+        await status.edit_text(f'Документ {document.file_name} обработан: частей {summary.chunks}{note}.')
+        # Сообщение Telegram ограничено 4096 символами
+        for start in range(0, len(summary.text), 4096):
+            await update.message.reply_text(summary.text[start:start + 4096])
+    await dispatch(update, job)
+
 async def handle_message(update: Update, context: CallbackContext) -> None:
     """! Handle any text message."""
     text_received = update.message.text
-    response = model.send_message(text_received)
-    await update.message.reply_text(response)
-    #tts_file_path = await text_to_speech (response)
-    #await update.message.reply_audio(audio=open(tts_file_path, 'rb'))
-   
+
+    async def job():
+        response = await model.ask(text_received)
+        await update.message.reply_text(response or NO_ANSWER)
+    await dispatch(update, job)
 
 async def handle_voice(update: Update, context: CallbackContext) -> None:
     """! Handle voice messages."""
-    voice_file = await update.message.voice.get_file()
-    message = recognizer(audio_url=voice_file.file_path)
-    response = model.send_message(message)
-    await update.message.reply_text(response)
-    tts_file_path = await text_to_speech (response)
-    await update.message.reply_audio(audio=open(tts_file_path, 'rb'))
+    async def job():
+        voice_file = await update.message.voice.get_file()
+        message = await audio_workers.recognize(voice_file.file_path)
+        response = await model.ask(message)
+        if not response:
+            await update.message.reply_text(NO_ANSWER)
+            return
+        await update.message.reply_text(response)
+        # Озвучка в памяти; повторные фразы берутся из кэша
+        clip = await audio_workers.synthesize(response)
+        await update.message.reply_audio(audio=BytesIO(clip), filename='response.mp3')
+    await dispatch(update, job)
+
+async def stats(update: Update, context: CallbackContext) -> None:
+    """! Handle the /stats command: queue depth and counters."""
+    stats = {**work_queue.stats(), **{f'audio_{name}': value for name, value in audio_workers.stats().items()}}
+    await update.message.reply_text('\n'.join(f'{name}: {value}' for name, value in stats.items()))
+
+async def post_init(application: Application) -> None:
+    """! Start the audio worker processes and synthesize the common bot phrases in the background."""
+    # `application.create_task` держит ссылку на задачу до её завершения и передаёт её ошибку обработчикам ошибок
+    application.create_task(asyncio.to_thread(audio_workers.warm))
+    application.create_task(asyncio.to_thread(prewarm))
 
 def main() -> None:
     """! Start the bot."""
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).build()
 
     # Register command handlers
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('help', help_command))
+    application.add_handler(CommandHandler('stats', stats))
 
     # Register message handlers
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
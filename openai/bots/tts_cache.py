@@ -0,0 +1,83 @@
+## \file ../src/ai/openai/bots/tts_cache.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! In-memory cache of synthesized speech clips.
+
+Clips are keyed by the hash of `(text, lang, voice)` and evicted least recently used
+first when their total size exceeds `max_bytes`. Repeated bot phrases (greetings,
+errors) are synthesized once per process.
+
+@code
+cache = TTSCache(max_bytes=32 * 1024 * 1024)
+clip = cache.get('Привет!', 'ru')
+if clip is None:
+    clip = synthesize(...)
+    cache.set('Привет!', 'ru', None, clip)
+@endcode
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def clip_key(text: str, lang: str, voice: Optional[str] = None) -> str:
+    """Content hash of a clip."""
+    return hashlib.sha256('\x00'.join((text, lang, voice or '')).encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """Thread-safe LRU of audio clips bounded by total bytes."""
+
+    max_bytes: int
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int, optional): Max total size of the cached clips. Defaults to 32 MB.
+        """
+        self.max_bytes = max_bytes
+        self._clips: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, lang: str, voice: Optional[str] = None) -> Optional[bytes]:
+        """Return the cached clip or `None`."""
+        key = clip_key(text, lang, voice)
+        with self._lock:
+            clip = self._clips.get(key)
+            if clip is None:
+                self.misses += 1
+                return None
+            self._clips.move_to_end(key)
+            self.hits += 1
+            return clip
+
+    def set(self, text: str, lang: str, voice: Optional[str], clip: bytes) -> None:
+        """Store a clip. A clip larger than `max_bytes` is not cached."""
+        if not clip or len(clip) > self.max_bytes:
+            return
+        key = clip_key(text, lang, voice)
+        with self._lock:
+            old = self._clips.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._clips[key] = clip
+            self.bytes += len(clip)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._clips.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clips.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """Number of clips, bytes held, hits and misses."""
+        with self._lock:
+            return {'clips': len(self._clips), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,181 @@
+## \file ../src/ai/openai/bots/work_queue.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Bounded per-key work queue for the bots.
+
+Each key (a Discord channel, a Telegram chat) has its own lane of pending jobs, run in
+submission order by one worker task, so one slow model call delays only its own channel.
+Inside a lane the users are served round-robin: a user flooding a channel cannot push the
+others' messages back. Lanes are bounded per key and per user; a full lane rejects the
+job with `QueueFull` at once (backpressure) instead of queuing without limit. An optional
+global limit caps the jobs running at the same time across every key.
+
+@code
+queue = KeyedWorkQueue(max_pending=20, max_per_user=3)
+try:
+    future = queue.submit(message.channel.id, message.author.id, lambda: answer(message))
+except QueueFull:
+    await message.channel.send('Too many requests, please wait.')
+@endcode
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from src.logger import logger
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class QueueFull(Exception):
+    """The lane of the key or the user's share of it is full."""
+
+
+class _Lane:
+    """Pending jobs of one key, grouped by user."""
+
+    __slots__ = ('users', 'pending', 'worker')
+
+    def __init__(self):
+        self.users: OrderedDict[Hashable, deque] = OrderedDict()
+        self.pending = 0
+        self.worker: Optional[asyncio.Task] = None
+
+    def push(self, user: Hashable, item: tuple) -> None:
+        self.users.setdefault(user, deque()).append(item)
+        self.pending += 1
+
+    def pop(self) -> tuple:
+        """Next job, round-robin over the users."""
+        user, jobs = next(iter(self.users.items()))
+        item = jobs.popleft()
+        del self.users[user]
+        if jobs:
+            self.users[user] = jobs  # to the end of the user rotation
+        self.pending -= 1
+        return item
+
+
+class KeyedWorkQueue:
+    """Per-key serial execution of coroutine jobs with per-user fairness and backpressure."""
+
+    max_pending: int
+    max_per_user: int
+
+    def __init__(self, max_pending: int = 20, max_per_user: int = 3, concurrency: Optional[int] = None):
+        """
+        Args:
+            max_pending (int, optional): Max jobs waiting in one lane. Defaults to 20.
+            max_per_user (int, optional): Max jobs of one user waiting in one lane. Defaults to 3.
+            concurrency (Optional[int], optional): Max jobs running at once over every lane. `None` - one per lane.
+        """
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self._lanes: Dict[Hashable, _Lane] = {}
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_wait = 0.0  # longest wait of a job in the queue, seconds
+
+    def submit(self, key: Hashable, user: Hashable, job: Job) -> asyncio.Future:
+        """Queue `job` in the lane of `key`. Must be called from the event loop.
+
+        Args:
+            key (Hashable): Lane key (channel / chat id).
+            user (Hashable): Author of the job, for fairness and the per-user limit. Pass the same value
+                (e.g. `None`) for every job of a key to run the lane in strict submission order.
+            job (Job): Coroutine factory, called when the job's turn comes.
+
+        Returns:
+            asyncio.Future: Resolves with the result (or the exception) of the job.
+
+        Raises:
+            QueueFull: The lane or the user's share of it is full.
+        """
+        lane = self._lanes.get(key) or self._lanes.setdefault(key, _Lane())
+        user_jobs = lane.users.get(user)
+        if lane.pending >= self.max_pending or (user_jobs and len(user_jobs) >= self.max_per_user):
+            self.rejected += 1
+            raise QueueFull(f"Queue of {key} is full")
+        future = asyncio.get_running_loop().create_future()
+        lane.push(user, (job, future, time.monotonic()))
+        self.submitted += 1
+        if lane.worker is None or lane.worker.done():
+            lane.worker = asyncio.create_task(self._work(key, lane))
+        return future
+
+    async def _work(self, key: Hashable, lane: _Lane) -> None:
+        """Run the jobs of a lane until it is empty, then drop the lane."""
+        try:
+            while lane.pending:
+                job, future, queued = lane.pop()
+                if future.cancelled():
+                    continue
+                self.max_wait = max(self.max_wait, time.monotonic() - queued)
+                if self._semaphore:
+                    await self._semaphore.acquire()
+                self.running += 1
+                try:
+                    result = await job()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as ex:
+                    self.failed += 1
+                    logger.error(f"Job of {key} failed", ex, False)
+                    if not future.done():
+                        future.set_exception(ex)
+                else:
+                    self.completed += 1
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    self.running -= 1
+                    if self._semaphore:
+                        self._semaphore.release()
+        finally:
+            if self._lanes.get(key) is lane and not lane.pending:
+                del self._lanes[key]
+
+    def depth(self, key: Hashable) -> int:
+        """Number of jobs waiting in the lane of `key`."""
+        lane = self._lanes.get(key)
+        return lane.pending if lane else 0
+
+    def stats(self) -> dict:
+        """Queue depth and counters."""
+        return {
+            'lanes': len(self._lanes),
+            'pending': sum(lane.pending for lane in self._lanes.values()),
+            'max_depth': max((lane.pending for lane in self._lanes.values()), default=0),
+            'running': self.running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'max_wait': self.max_wait,
+        }
+
+    async def join(self) -> None:
+        """Wait until every lane is empty."""
+        while True:
+            workers = [lane.worker for lane in self._lanes.values() if lane.worker and not lane.worker.done()]
+            if not workers:
+                return
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Cancel every worker and the jobs waiting for them."""
+        for lane in list(self._lanes.values()):
+            for jobs in lane.users.values():
+                for _, future, _ in jobs:
+                    future.cancel()
+            if lane.worker:
+                lane.worker.cancel()
+        self._lanes.clear()
@@ -16,7 +16,16 @@
 from packaging.version import Version
 from .version import __version__, __doc__, __details__ 
 
-from .training import OpenAIModel
+from src.ai._lazy import lazy_module
+
+# The openai SDK is imported only when a model class is accessed
+_lazy_imports = {
+    'OpenAIModel': '.training',
+    'AsyncOpenAIModel': '.async_model',
+}
+
+__all__ = list(_lazy_imports)
+__getattr__, __dir__ = lazy_module(__name__, _lazy_imports)
 
 
 
@@ -0,0 +1,66 @@
+## \file ../src/ai/openai/model/_experiments/ask_round_trips.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+"""! Benchmark: API round trips and latency of `OpenAIModel.ask()`.
+
+The OpenAI client is replaced by a local fake with a fixed latency, so the script
+needs no network and no API key. Every `ask()` must make exactly one round trip,
+with and without conversation context.
+"""
+
+import header
+import time
+from types import SimpleNamespace
+
+from src.settings import gs
+from src.ai.openai.model.training import OpenAIModel
+from src.ai.rate_limiter import RateLimiter
+
+
+class FakeCompletions:
+    """`client.chat.completions` with a fixed latency and a call counter."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        content = '{"answer": %d}' % self.calls
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(total_tokens=sum(len(m['content']) for m in kwargs['messages']) // 4),
+        )
+
+
+class FakeClient:
+    def __init__(self, latency: float):
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency))
+
+
+def run(asks: int = 20, latency: float = 0.05, history_window: int = 0) -> float:
+    """Send `asks` messages and print round trips and latency per `ask()`.
+
+    Returns:
+        float: Round trips per `ask()`.
+    """
+    client = FakeClient(latency)
+    OpenAIModel._clients[gs.credentials.openai.project_api] = client
+    model = OpenAIModel(system_instruction='Answer in JSON', history_window=history_window)
+    model.rate_limiter = RateLimiter('benchmark')  # unlimited
+
+    started = time.perf_counter()
+    for i in range(asks):
+        model.ask(f'message {i}')
+    elapsed = time.perf_counter() - started
+
+    round_trips = client.chat.completions.calls / asks
+    print(f"history_window={history_window:3}: {round_trips:.2f} round trips per ask, "
+          f"{elapsed / asks * 1000:.1f} ms per ask (API latency {latency * 1000:.0f} ms)")
+    return round_trips
+
+
+if __name__ == '__main__':
+    for window in (0, 10, 50):
+        assert run(history_window=window) == 1.0, "ask() must make exactly one API round trip"
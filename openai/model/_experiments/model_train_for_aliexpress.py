@@ -7,6 +7,9 @@ import header
 
 from src.settings import gs
 from src.ai import OpenAIModel, GoogleGenerativeAI
+from src.ai.response_cache import ResponseCache
+from src.ai.chunking import ask_chunked
+from src.ai.pipeline import CampaignPipeline
 from src.utils.file import recursive_get_filenames, read_text_file
 from src.utils.convertor import csv2json_csv2dict
 from src.utils import pprint
@@ -14,13 +17,26 @@ from src.utils import pprint
 product_titles_files:list = recursive_get_filenames(gs.path.data / 'aliexpress' / 'campaigns','product_titles.txt')
 system_instruction_path = gs.path.src / 'ai' / 'prompts' / 'aliexpress_campaign' / 'system_instruction.txt'
 system_instruction: str = read_text_file(system_instruction_path)
-openai = OpenAIModel(system_instruction = system_instruction)
-gemini = GoogleGenerativeAI(system_instruction = system_instruction)
-for file in product_titles_files:
-    ...
-    product_titles = read_text_file(file)
-    response_openai = openai.ask(product_titles)
-    response_gemini = gemini.ask(product_titles)
-    ...
+# Repeated runs of the same campaigns are served from the cache without calling the API
+response_cache = ResponseCache(gs.path.data / 'AI' / 'cache' / 'responses.sqlite')
+openai = OpenAIModel(system_instruction = system_instruction, response_cache = response_cache)
+gemini = GoogleGenerativeAI(system_instruction = system_instruction, response_cache = response_cache)
+# Large title lists are split into chunks of `max_tokens`, the chunks are sent concurrently,
+# the JSON replies of the chunks are merged into one result per campaign. Only failed chunks are sent again
+max_tokens: int = 2000
 
-...
\ No newline at end of file
+def chunked(model):
+    def process(text: str) -> dict:
+        result = ask_chunked(model.ask_many, text, max_tokens, count=model.token_counter.count)
+        if not result.ok:
+            raise RuntimeError(f"Chunks {result.failed} failed: {result.errors}")
+        return result.response
+    return process
+
+# Progress is kept in SQLite: on restart, finished and unchanged campaigns are skipped
+pipeline = CampaignPipeline(
+    {'openai': chunked(openai), 'gemini': chunked(gemini)},
+    gs.path.data / 'AI' / 'pipeline' / 'aliexpress_campaigns.sqlite',
+    workers=4,
+)
+pprint(pipeline.run(product_titles_files))
@@ -0,0 +1,217 @@
+## \file ../src/ai/openai/model/async_model.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Asyncio variant of `OpenAIModel`.
+
+`AsyncOpenAIModel.ask()` is a coroutine built on `openai.AsyncOpenAI`. Instances share
+one async client (and its connection pool) per API key and event loop, requests are
+paced by the shared rate limiter, retries wait with `asyncio.sleep`, and cancelling the
+calling task aborts the request.
+
+@code
+model = AsyncOpenAIModel(system_instruction=system_instruction)
+reply = await model.ask("Hello")
+@endcode
+"""
+
+import asyncio
+import weakref
+from typing import AsyncIterator, Awaitable, Dict, Iterable, List, Tuple
+
+from openai import AsyncOpenAI
+
+import header
+from src.logger import logger
+from src.settings import gs
+from src.utils import pprint
+from src.ai.batch import BatchResult, aask_many, aiter_ask_many
+from .training import OpenAIModel
+from .event_handler import Sink
+
+
+class AsyncOpenAIModel(OpenAIModel):
+    """OpenAI model with a coroutine `ask()`."""
+
+    # One client (connection pool) per event loop and API key, shared by all instances;
+    # the clients of a loop are dropped with the loop
+    _async_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncOpenAI]]' = weakref.WeakKeyDictionary()
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Shared `AsyncOpenAI` client for the running event loop."""
+        api_key = gs.credentials.openai.project_api
+        clients = self._async_clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(api_key)
+        if not client:
+            client = clients[api_key] = AsyncOpenAI(api_key=api_key)
+        return client
+
+    async def _complete_async(self, messages: List[Dict[str, str]]) -> str:
+        """Send one chat completion request (no retries) and return the reply."""
+        estimated_tokens = self._estimate_tokens(messages)
+        await self.rate_limiter.acquire_async(estimated_tokens)
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0,
+        )
+        self.rate_limiter.adjust(estimated_tokens, getattr(response.usage, 'total_tokens', None))
+        self._record_usage(getattr(response.usage, 'prompt_tokens', None), getattr(response.usage, 'completion_tokens', None))
+        return response.choices[0].message.content.strip()
+
+    async def ask(self, message: str, system_instruction: str = None, attempts: int = 3, use_cache: bool = True) -> str:
+        """Send a message to the model and return the response, along with sentiment analysis.
+
+        Args:
+            message (str): The message to send to the model.
+            system_instruction (str, optional): Optional system instruction.
+            attempts (int, optional): Number of retry attempts. Defaults to 3.
+            use_cache (bool, optional): Look the reply up in `response_cache`. `False` - always call the API
+                (the new reply replaces the cached one, e.g. when the cached reply was rejected). Defaults to True.
+
+        Returns:
+            str: The response from the model.
+        """
+        messages = self._build_messages(message, system_instruction)
+        cache_key = self._cache_key(messages)
+        reply = self.response_cache.get(cache_key) if cache_key and use_cache else None
+
+        if reply is None:
+            try:
+                # `asyncio.CancelledError` is not caught - cancelling the task aborts the request
+                reply = await self.retry_policy.call_async(self.circuit_breaker.call_async, self._complete_async, messages, attempts=attempts + 1)
+            except Exception as ex:
+                logger.debug(f"An error occurred while sending the message: \n-----\n {pprint(messages)} \n-----\n", ex, True)
+                return ""
+            if cache_key:
+                self.response_cache.set(cache_key, reply)
+
+        self._record_turn(messages, reply, system_instruction)
+        return reply
+
+    async def _open_stream_async(self, messages: List[Dict[str, str]]) -> Tuple[object, int]:
+        """Start a streamed chat completion (no retries). Returns the stream and the estimated prompt tokens."""
+        estimated_tokens = self._estimate_tokens(messages)
+        await self.rate_limiter.acquire_async(estimated_tokens)
+        stream = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        return stream, estimated_tokens
+
+    async def _stream_chat_async(self, messages: List[Dict[str, str]], attempts: int) -> AsyncIterator[str]:
+        """Yield the text deltas of a chat completion."""
+        stream, estimated_tokens = await self.retry_policy.call_async(self.circuit_breaker.call_async, self._open_stream_async, messages, attempts=attempts + 1)
+        usage = None
+        async with stream:
+            try:
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as ex:
+                # A broken stream is a provider failure too
+                self.circuit_breaker.failure(ex)
+                raise
+        self.rate_limiter.adjust(estimated_tokens, getattr(usage, 'total_tokens', None))
+        self._record_usage(getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+
+    async def _open_run_stream_async(self, system_instruction: str) -> Tuple[object, object]:
+        """Start a streamed assistant run on the thread (no retries). Returns the entered stream manager and the stream."""
+        manager = self.async_client.beta.threads.runs.stream(
+            thread_id=self._thread.id,
+            assistant_id=self.assistant_id,
+            instructions=system_instruction,
+        )
+        return manager, await manager.__aenter__()
+
+    async def _stream_run_async(self, message: str, system_instruction: str = None, attempts: int = 3) -> AsyncIterator[str]:
+        """Add `message` to the thread, run the assistant and yield the text deltas of the run."""
+        if self._thread is None:
+            self._thread = await self.retry_policy.call_async(
+                self.circuit_breaker.call_async, self.async_client.beta.threads.create, attempts=attempts + 1,
+            )
+        await self.retry_policy.call_async(
+            self.circuit_breaker.call_async, self.async_client.beta.threads.messages.create,
+            self._thread.id, role="user", content=message, attempts=attempts + 1,
+        )
+        await self.rate_limiter.acquire_async(self.token_counter.count(message))
+        manager, stream = await self.retry_policy.call_async(
+            self.circuit_breaker.call_async, self._open_run_stream_async, system_instruction, attempts=attempts + 1,
+        )
+        try:
+            async for delta in stream.text_deltas:
+                yield delta
+            run = stream.current_run
+        except Exception as ex:
+            self.circuit_breaker.failure(ex)
+            raise
+        finally:
+            await manager.__aexit__(None, None, None)
+        usage = getattr(run, 'usage', None)
+        self._record_usage(getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+
+    async def ask_stream(self, message: str, system_instruction: str = None, assistant: bool = False,
+                         sink: Sink = None, attempts: int = 3) -> AsyncIterator[str]:
+        """Send a message to the model and yield the reply as it is generated.
+
+        `async for delta in model.ask_stream("Hello")`. See `OpenAIModel.ask_stream` for the arguments.
+        Cancelling the consumer closes the stream.
+        """
+        if assistant:
+            messages = [{"role": "user", "content": message}]
+            cache_key = cached = None
+            deltas = self._stream_run_async(message, system_instruction, attempts)
+        else:
+            messages = self._build_messages(message, system_instruction)
+            cache_key = self._cache_key(messages)
+            cached = self.response_cache.get(cache_key) if cache_key else None
+            deltas = None if cached is not None else self._stream_chat_async(messages, attempts)
+
+        parts = []
+        if deltas is None:
+            parts.append(cached)
+            if sink:
+                sink(cached)
+            yield cached
+        else:
+            try:
+                async for delta in deltas:
+                    parts.append(delta)
+                    if sink:
+                        sink(delta)
+                    yield delta
+            except Exception as ex:
+                logger.error(f"An error occurred while streaming the reply: \n-----\n {pprint(messages)} \n-----\n", ex, True)
+                return
+            finally:
+                await deltas.aclose()
+
+        reply = "".join(parts).strip()
+        if not reply:
+            return
+        if cache_key and cached is None:
+            self.response_cache.set(cache_key, reply)
+        self._record_turn(messages, reply, system_instruction)
+
+    def ask_many(self, prompts: Iterable[str], concurrency: int = None, stream: bool = False, **kwargs) -> Awaitable[List[BatchResult]] | AsyncIterator[BatchResult]:
+        """Send many prompts concurrently.
+
+        `await model.ask_many(prompts)` returns the results in input order,
+        `async for result in model.ask_many(prompts, stream=True)` yields them as they complete.
+
+        Args:
+            prompts (Iterable[str]): Messages to send.
+            concurrency (int, optional): Number of concurrent requests, capped by `max_concurrency`. Defaults to `max_concurrency`.
+            stream (bool, optional): Yield results as they complete. Defaults to False.
+            **kwargs: Extra arguments for `ask()`.
+        """
+        concurrency = min(concurrency or self.max_concurrency, self.max_concurrency)
+        if stream:
+            return aiter_ask_many(self.ask, prompts, concurrency, **kwargs)
+        return aask_many(self.ask, prompts, concurrency, **kwargs)
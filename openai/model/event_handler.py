@@ -3,43 +3,70 @@
 #! /usr/share/projects/hypotez/venv/scripts python
 """! https://github.com/openai/openai-python/blob/main/helpers.md#assistant-events """
 
+from typing import Callable, Optional
 from typing_extensions import override
 from openai import AssistantEventHandler, OpenAI
 from openai.types.beta.threads import Text, TextDelta
 from openai.types.beta.threads.runs import ToolCall, ToolCallDelta
 
+# Receiver of the stream fragments: the console, an edited bot message, a buffer...
+Sink = Callable[[str], None]
+
+
+def console_sink(text: str) -> None:
+  """Print a stream fragment without a newline."""
+  print(text, end="", flush=True)
 
 
 # First, we create a EventHandler class to define
 # how we want to handle the events in the response stream.
 
 class EventHandler(AssistantEventHandler):
-  """! """
+  """! Sends the events of an assistant run stream to a sink.
+
+  Text deltas always go to the sink; the `assistant >` markers, tool calls and
+  code interpreter output only with `verbose=True` (console output).
+  """
+
+  def __init__(self, sink: Optional[Sink] = None, verbose: bool = True):
+    """
+    Args:
+        sink (Optional[Sink], optional): Receives the stream fragments. Defaults to `console_sink`.
+        verbose (bool, optional): Send the markers and the tool call output too. Defaults to True.
+    """
+    super().__init__()
+    self.sink = sink or console_sink
+    self.verbose = verbose
+
+  def _info(self, text: str) -> None:
+    if self.verbose:
+      self.sink(text)
 
   @override
   def on_text_created(self, text: Text) -> None:
-    print(f"\nassistant > ", end="", flush=True)
+    self._info(f"\nassistant > ")
 
   @override
   def on_text_delta(self, delta: TextDelta, snapshot: Text):
-    print(delta.value, end="", flush=True)
+    if delta.value:
+      self.sink(delta.value)
 
   @override
   def on_tool_call_created(self, tool_call: ToolCall):
-    print(f"\nassistant > {tool_call.type}\n", flush=True)
+    self._info(f"\nassistant > {tool_call.type}\n")
 
   @override
   def on_tool_call_delta(self, delta: ToolCallDelta, snapshot: ToolCall):
     if delta.type == "code_interpreter" and delta.code_interpreter:
       if delta.code_interpreter.input:
-        print(delta.code_interpreter.input, end="", flush=True)
+        self._info(delta.code_interpreter.input)
       if delta.code_interpreter.outputs:
-        print(f"\n\noutput >", flush=True)
+        self._info(f"\n\noutput >\n")
         for output in delta.code_interpreter.outputs:
           if output.type == "logs":
-            print(f"\n{output.logs}", flush=True)
+            self._info(f"\n{output.logs}\n")
 
 # Then, we use the `stream` SDK helper
 # with the `EventHandler` class to create the Run
 # and stream the response.
-
+# `OpenAIModel.ask_stream(message, assistant=True, sink=...)` does it for the model's assistant and thread.
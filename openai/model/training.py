@@ -5,11 +5,14 @@
 """! OpenAI Model Class for handling communication with the OpenAI API and training the model. """
 
 import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from types import SimpleNamespace
-from typing import List, Dict
-import pandas as pd
+from typing import Iterable, Iterator, List, Dict, Tuple
 from openai import OpenAI
+from openai.types.beta import Assistant, Thread
 
 import header
 from src.logger import logger
@@ -18,69 +21,183 @@ from src.utils import j_loads, j_loads_ns, j_dumps
 from src.utils.file.csv import save_csv_file  
 from src.utils.convertor import csv2json_csv2dict
 from src.utils import pprint
+from src.ai.dialogue_log import DialogueLog, get_dialogue_log
+from src.ai.dialogue_memory import DialogueMemory, Turn
+from src.ai.response_cache import ResponseCache, make_cache_key
+from src.ai.batch import BatchResult, ask_many, iter_ask_many
+from src.ai.rate_limiter import RateLimiter, get_rate_limiter
+from src.ai.retry import RetryPolicy
+from src.ai.circuit_breaker import CircuitBreaker, get_circuit_breaker
+from src.ai.registry import AssistantInfo, ModelRegistry, get_model_registry
+from src.ai.context_window import ContextWindow, TokenCounter, TokenUsage
+from .event_handler import EventHandler, Sink
 
 class OpenAIModel:
     """OpenAI Model Class for interacting with the OpenAI API and managing the model."""
 
     model: str = "gpt-4o"
-    client: OpenAI
+    max_concurrency: int = 8  # Максимум параллельных запросов `ask_many()`
     current_job_id: str
     assistant_id: str 
-    assistant = None
-    thread = None
+    assistant_cache_dir: Path = gs.path.data / 'AI' / 'cache' / 'assistants'
+    assistant_cache_ttl: int = 24 * 60 * 60  # Время жизни метаданных ассистента на диске, секунды
     system_instruction: str
-    dialogue_log_path: str | Path = gs.path.data / 'AI' / f"{model}_{gs.now}.json"
-    dialogue: List[Dict[str, str]] = []
-    assistants: List[SimpleNamespace]
+    dialogue_log_path: str | Path = gs.path.data / 'AI' / f"{model}_{gs.now}.jsonl"
+    dialogue_log: DialogueLog
+    dialogue: DialogueMemory
+    conversation_path: Path = gs.path.data / 'AI' / 'conversation' / 'dailogue.json'
+    history_window: int
+    token_counter: TokenCounter
+    usage: TokenUsage  # Токены всех запросов экземпляра
+    last_usage: TokenUsage | None  # Токены последнего запроса
+    response_cache: ResponseCache | None
+    models_path: Path = gs.path.src / 'ai' / 'openai' / 'model' / 'aimodels' / 'models.json'
+    assistants_path: Path = gs.path.src / 'ai' / 'openai' / 'model' / 'assistants' / 'assistants.json'
+    rate_limiter: RateLimiter
+    retry_policy: RetryPolicy = RetryPolicy('openai')
+    # Пока провайдер недоступен, запросы сразу завершаются ошибкой вместо минутного ожидания повторов
+    circuit_breaker: CircuitBreaker = get_circuit_breaker('openai')
+    assistants: List[AssistantInfo]
     models_list: List[str]
 
-    def __init__(self, system_instruction: str = None, assistant_id: str = None):
-        """Initialize the Model object with API key, assistant ID, and load available models and assistants.
+    # Клиенты (пулы соединений) и пул потоков для фоновой загрузки общие для всех экземпляров
+    _clients: Dict[str, OpenAI] = {}
+    _clients_lock = threading.Lock()
+    _executor: ThreadPoolExecutor | None = None
+
+    def __init__(self, system_instruction: str = None, assistant_id: str = None,
+                 dialogue_max_turns: int = 100, dialogue_max_tokens: int = None,
+                 response_cache: ResponseCache = None, history_window: int = 0):
+        """Initialize the Model object. No network request is made: the client, the assistant
+        and the thread are created on first use.
 
         Args:
             system_instruction (str, optional): An optional system instruction for the model.
             assistant_id (str, optional): An optional assistant ID. Defaults to 'asst_dr5AgQnhhhnef5OSMzQ9zdk9'.
+            dialogue_max_turns (int, optional): Max number of messages kept in memory. Defaults to 100.
+            dialogue_max_tokens (int, optional): Max estimated tokens kept in memory. Defaults to no limit.
+            response_cache (ResponseCache, optional): Cache of responses to identical requests. Defaults to no caching.
+            history_window (int, optional): Number of previous user/assistant messages sent with every request
+                (conversation context mode). `0` - every request is independent. Defaults to 0.
         """
-        self.client = OpenAI(api_key=gs.credentials.openai.project_api)
         self.current_job_id = None
         self.assistant_id = assistant_id or gs.credentials.openai.assistant_create_categories_with_description_from_product_titles
         self.system_instruction = system_instruction
+        self.dialogue_log = get_dialogue_log(self.dialogue_log_path)
+        self.token_counter = TokenCounter(self.model)
+        # Every turn is already persisted by `dialogue_log`, so evicted messages are not spilled again
+        self.dialogue = DialogueMemory(max_turns=dialogue_max_turns, max_tokens=dialogue_max_tokens,
+                                       token_counter=self.token_counter.count)
+        self.usage = TokenUsage()
+        self.last_usage = None
+        self._context_window: ContextWindow | None = None
+        self.response_cache = response_cache
+        self.history_window = history_window
+        self._context_loaded = False
+        # Ограничения RPM/TPM из реестра моделей (`models.json`), общие для всех экземпляров процесса
+        self.rate_limiter = get_rate_limiter('openai', self.model, self.registry.get_model(self.model))
+
+        # Assistant and thread are loaded lazily on first access
+        self._assistant: Assistant | None = None
+        self._thread: Thread | None = None
 
-        # Load assistant and thread during initialization
-        self.assistant = self.client.beta.assistants.retrieve(self.assistant_id)
-        self.thread = self.client.beta.threads.create()
+    @property
+    def client(self) -> OpenAI:
+        """OpenAI client shared by every instance using the same API key."""
+        api_key = gs.credentials.openai.project_api
+        client = self._clients.get(api_key)
+        if not client:
+            with self._clients_lock:
+                client = self._clients.get(api_key)
+                if not client:
+                    client = self._clients[api_key] = OpenAI(api_key=api_key)
+        return client
 
     @property
-    def list_models(self) -> List[str]:
-        """Dynamically fetch and return available models from the OpenAI API.
+    def assistant(self) -> Assistant:
+        """The assistant, retrieved on first access and cached on disk for `assistant_cache_ttl` seconds."""
+        if self._assistant is None or self._assistant.id != self.assistant_id:
+            self._assistant = self._load_assistant(self.assistant_id)
+        return self._assistant
 
-        Returns:
-            List[str]: A list of model IDs available via the OpenAI API.
+    @property
+    def thread(self) -> Thread:
+        """The conversation thread, created on first access."""
+        if self._thread is None:
+            self._thread = self.retry_policy.call(self.circuit_breaker.call, self.client.beta.threads.create)
+        return self._thread
+
+    def _load_assistant(self, assistant_id: str) -> Assistant:
+        """Return the assistant metadata from the disk cache or from the API.
+
+        Args:
+            assistant_id (str): The ID of the assistant.
         """
+        cache_path = self.assistant_cache_dir / f"{assistant_id}.json"
         try:
-            models = self.client.models.list()
-            model_list = [model['id'] for model in models['data']]
-            logger.info(f"Loaded models: {model_list}")
-            return model_list
+            if cache_path.exists() and time.time() - cache_path.stat().st_mtime < self.assistant_cache_ttl:
+                return Assistant.model_validate(j_loads(cache_path))
         except Exception as ex:
-            logger.error("An error occurred while loading models:", ex)
-            return []
+            logger.debug(f"Broken assistant cache {cache_path}", ex)
+
+        assistant = self.client.beta.assistants.retrieve(assistant_id)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        j_dumps(assistant.model_dump(mode='json'), cache_path)
+        return assistant
+
+    def prefetch(self) -> Future:
+        """Load the assistant and create the thread in the shared background pool.
+
+        Returns:
+            Future: Completes when both are ready.
+        """
+        if not OpenAIModel._executor:
+            with self._clients_lock:
+                if not OpenAIModel._executor:
+                    OpenAIModel._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='openai_prefetch')
+        return OpenAIModel._executor.submit(lambda: (self.assistant, self.thread))
+
+    @property
+    def registry(self) -> ModelRegistry:
+        """Process-wide registry of OpenAI models and assistants.
+
+        Built from `models.json`, `assistants.json` and the model list cached on disk;
+        the remote list is refreshed in the background.
+        """
+        return get_model_registry(
+            'openai',
+            self.models_path,
+            self.assistants_path,
+            gs.path.data / 'AI' / 'cache' / 'openai_models.json',
+            remote=lambda: [model.id for model in self.client.models.list()],
+        )
+
+    @property
+    def context_window(self) -> ContextWindow:
+        """Token budget of the model: context size minus the reserved output, from `models.json`."""
+        if self._context_window is None:
+            info = self.registry.get_model(self.model)
+            self._context_window = ContextWindow(info.prompt_budget if info else None, self.token_counter)
+        return self._context_window
+
+    @property
+    def list_models(self) -> List[str]:
+        """Return the models known to the registry (local `models.json` and the cached API list).
+
+        Returns:
+            List[str]: A list of model IDs.
+        """
+        return self.registry.models
 
     @property
     def list_assistants(self) -> List[str]:
-        """Dynamically load available assistants from a JSON file.
+        """Return the names of the assistants of `assistants.json`.
 
         Returns:
             List[str]: A list of assistant names.
         """
-        try:
-            self.assistants = j_loads_ns(gs.path.src / 'ai' / 'openai' / 'model' / 'assistants' / 'assistants.json')
-            assistant_list = [assistant.name for assistant in self.assistants]
-            logger.info(f"Loaded assistants: {assistant_list}")
-            return assistant_list
-        except Exception as ex:
-            logger.error("An error occurred while loading assistants:", ex)
-            return []
+        self.assistants = self.registry.assistants
+        return [assistant.name for assistant in self.assistants]
 
     def set_assistant(self, assistant_id: str):
         """Set the assistant using the provided assistant ID.
@@ -90,14 +207,18 @@ class OpenAIModel:
         """
         try:
             self.assistant_id = assistant_id
-            self.assistant = self.client.beta.assistants.retrieve(assistant_id)
+            self._assistant = self._load_assistant(assistant_id)
             logger.info(f"Assistant set successfully: {assistant_id}")
         except Exception as ex:
             logger.error("An error occurred while setting the assistant:", ex)
 
-    def _save_dialogue(self):
-        """Save the entire dialogue to the JSON file."""
-        j_dumps(self.dialogue, self.dialogue_log_path)
+    def _save_dialogue(self, messages: List[Dict[str, str]]):
+        """Append the messages of the last turn to the dialogue log.
+
+        Args:
+            messages (List[Dict[str, str]]): Messages of the turn.
+        """
+        self.dialogue_log.append(messages, model=self.model)
 
 
     def determine_sentiment(self, message: str) -> str:
@@ -124,65 +245,290 @@ class OpenAIModel:
         else:
             return "neutral"
 
-    def ask(self, message: str, system_instruction: str = None, attempts: int = 3) -> str:
+    def _build_messages(self, message: str, system_instruction: str = None) -> List[Dict[str, str]]:
+        """Build the list of messages sent to the chat completion API.
+
+        Args:
+            message (str): The user message.
+            system_instruction (str, optional): System instruction overriding `self.system_instruction`.
+
+        Returns:
+            List[Dict[str, str]]: Messages with the system instruction (if any), the last `history_window`
+                messages of the conversation that fit the token budget and the user message.
+        """
+        head = []
+        if self.system_instruction or system_instruction:
+            system_instruction_escaped = (system_instruction or self.system_instruction).replace('"', r'\"')
+            head.append({"role": "system", "content": system_instruction_escaped})
+
+        message_escaped = message.replace('"', r'\"')
+        tail = [{"role": "user", "content": message_escaped}]
+
+        history = self._history() if self.history_window > 0 else []
+        return self.context_window.fit(head, history, tail)
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Count the prompt tokens of `messages` for the rate limiter. Counts of repeated texts are cached."""
+        return self.token_counter.count_messages(messages)
+
+    def _record_usage(self, prompt_tokens: int | None, completion_tokens: int | None):
+        """Store the token usage reported by the API in `last_usage` and add it to `usage`."""
+        self.last_usage = TokenUsage(prompt_tokens or 0, completion_tokens or 0, 1)
+        self.usage.add(self.last_usage)
+
+    def _load_context(self):
+        """Load the prior conversation from `conversation_path` into the dialogue memory (once per instance)."""
+        if self._context_loaded:
+            return
+        self._context_loaded = True
+        try:
+            previous_messages = j_loads(self.conversation_path)
+            if previous_messages:
+                self.dialogue.extend(previous_messages)
+                logger.info(f"Loaded {len(previous_messages)} messages of conversation context")
+        except Exception as ex:
+            logger.error(f"Error loading conversation context {self.conversation_path}", ex)
+
+    def _history(self) -> List[Turn]:
+        """Return the last `history_window` user/assistant turns of the dialogue with their cached token counts."""
+        self._load_context()
+        history = [turn for turn in self.dialogue if turn.role in ("user", "assistant") and turn.content]
+        return history[-self.history_window:]
+
+    def _cache_key(self, messages: List[Dict[str, str]]) -> str | None:
+        """Return the response cache key for `messages` or `None` if caching is off."""
+        if not self.response_cache:
+            return None
+        return make_cache_key('openai', self.model, None, messages, {"temperature": 0})
+
+    def _record_turn(self, messages: List[Dict[str, str]], reply: str, system_instruction: str = None):
+        """Add the turn with sentiment analysis to the dialogue memory and the dialogue log.
+
+        Args:
+            messages (List[Dict[str, str]]): Messages sent to the model (the user message is the last one).
+            reply (str): The model reply.
+            system_instruction (str, optional): System instruction used for the request.
+        """
+        # Анализ тональности
+        sentiment = self.determine_sentiment(reply)
+
+        # Добавление сообщений и тональности в диалог
+        turn = [
+            {"role": "system", "content": system_instruction or self.system_instruction},
+            {"role": "user", "content": messages[-1]["content"]},
+            {"role": "assistant", "content": reply, "sentiment": sentiment},
+        ]
+        self.dialogue.extend(turn)
+
+        # Сохранение диалога
+        self._save_dialogue(turn)
+
+    def _complete(self, messages: List[Dict[str, str]]) -> str:
+        """Send one chat completion request (no retries) and return the reply.
+
+        The conversation context is already part of `messages`, so every `ask()` is a single round trip.
+        """
+        # Отправка запроса к модели с учётом ограничений RPM/TPM
+        estimated_tokens = self._estimate_tokens(messages)
+        self.rate_limiter.acquire(estimated_tokens)
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0,
+        )
+        self.rate_limiter.adjust(estimated_tokens, getattr(response.usage, 'total_tokens', None))
+        self._record_usage(getattr(response.usage, 'prompt_tokens', None), getattr(response.usage, 'completion_tokens', None))
+        return response.choices[0].message.content.strip()
+
+    def complete(self, message: str, system_instruction: str = None, attempts: int = 3) -> str:
+        """Send a standalone prompt and return the reply.
+
+        Unlike `ask()`, the prompt is sent as is (no quote escaping, no conversation history) and
+        the turn is not added to the dialogue memory or the dialogue log. For batch jobs whose
+        prompts are independent of each other, e.g. `TranslationEngine`.
+
+        Args:
+            message (str): The prompt.
+            system_instruction (str, optional): System instruction overriding `self.system_instruction`.
+            attempts (int, optional): Number of retry attempts. Defaults to 3.
+
+        Returns:
+            str: The response from the model.
+
+        Raises:
+            Exception: The error of the last attempt (see `RetryPolicy.call`).
+        """
+        messages = []
+        if system_instruction or self.system_instruction:
+            messages.append({"role": "system", "content": system_instruction or self.system_instruction})
+        messages.append({"role": "user", "content": message})
+        return self.retry_policy.call(self.circuit_breaker.call, self._complete, messages, attempts=attempts + 1)
+
+    def ask(self, message: str, system_instruction: str = None, attempts: int = 3, use_cache: bool = True) -> str:
         """Send a message to the model and return the response, along with sentiment analysis.
 
         Args:
             message (str): The message to send to the model.
             system_instruction (str, optional): Optional system instruction.
             attempts (int, optional): Number of retry attempts. Defaults to 3.
+            use_cache (bool, optional): Look the reply up in `response_cache`. `False` - always call the API
+                (the new reply replaces the cached one, e.g. when the cached reply was rejected). Defaults to True.
 
         Returns:
             str: The response from the model.
         """
+        messages = self._build_messages(message, system_instruction)
+
+        # Повторный запрос с теми же параметрами отдаётся из кэша без обращения к API
+        cache_key = self._cache_key(messages)
+        reply = self.response_cache.get(cache_key) if cache_key and use_cache else None
+
+        if reply is None:
+            try:
+                # Повторы с экспоненциальной задержкой только для временных ошибок
+                reply = self.retry_policy.call(self.circuit_breaker.call, self._complete, messages, attempts=attempts + 1)
+            except Exception as ex:
+                logger.debug(f"An error occurred while sending the message: \n-----\n {pprint(messages)} \n-----\n", ex, True)
+                return ""
+            if cache_key:
+                self.response_cache.set(cache_key, reply)
+
+        self._record_turn(messages, reply, system_instruction)
+        return reply
+
+    def _open_stream(self, messages: List[Dict[str, str]]) -> Tuple[object, int]:
+        """Start a streamed chat completion (no retries). Returns the stream and the estimated prompt tokens."""
+        estimated_tokens = self._estimate_tokens(messages)
+        self.rate_limiter.acquire(estimated_tokens)
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        return stream, estimated_tokens
+
+    def _stream_chat(self, messages: List[Dict[str, str]], attempts: int) -> Iterator[str]:
+        """Yield the text deltas of a chat completion."""
+        # Повторяется только открытие потока: повтор после первых фрагментов продублировал бы текст
+        stream, estimated_tokens = self.retry_policy.call(self.circuit_breaker.call, self._open_stream, messages, attempts=attempts + 1)
+        usage = None
+        with stream:
+            try:
+                for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as ex:
+                # Обрыв потока - тоже отказ провайдера
+                self.circuit_breaker.failure(ex)
+                raise
+        self.rate_limiter.adjust(estimated_tokens, getattr(usage, 'total_tokens', None))
+        self._record_usage(getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+
+    def _open_run_stream(self, system_instruction: str, handler: EventHandler) -> Tuple[object, object]:
+        """Start a streamed assistant run on the thread (no retries). Returns the entered stream manager and the stream."""
+        manager = self.client.beta.threads.runs.stream(
+            thread_id=self.thread.id,
+            assistant_id=self.assistant_id,
+            instructions=system_instruction,
+            event_handler=handler,
+        )
+        return manager, manager.__enter__()
+
+    def _stream_run(self, message: str, system_instruction: str = None, attempts: int = 3) -> Iterator[str]:
+        """Add `message` to the thread, run the assistant and yield the text deltas of the run."""
+        self.retry_policy.call(
+            self.circuit_breaker.call, self.client.beta.threads.messages.create,
+            self.thread.id, role="user", content=message, attempts=attempts + 1,
+        )
+        deltas = deque()
+        handler = EventHandler(deltas.append, verbose=False)
+        self.rate_limiter.acquire(self.token_counter.count(message))
+        manager, stream = self.retry_policy.call(self.circuit_breaker.call, self._open_run_stream, system_instruction, handler, attempts=attempts + 1)
         try:
-            # Загрузка предыдущих сообщений
-            messages = j_loads(gs.path.data / 'AI' / 'conversation' / 'dailogue.json')
-            if messages:
-                # Отправка запроса к модели
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    assistant=self.assistant_id,  # Учитываем assistant_id
-                    messages=messages,
-                    temperature=0,
-                )
-                reply = response.choices[0].message.content.strip()
-                
-            messages = []
-            if self.system_instruction or system_instruction:
-                system_instruction_escaped = (system_instruction or self.system_instruction).replace('"', r'\"')
-                messages.append({"role": "system", "content": system_instruction_escaped})
-
-            message_escaped = message.replace('"', r'\"')
-            messages.append({"role": "user", "content": message_escaped})
-
-            # Отправка запроса к модели
-            response = self.client.chat.completions.create(
-                model=self.model,
-                assistant=self.assistant_id,  # Учитываем assistant_id
-                messages=messages,
-                temperature=0,
-            )
-            reply = response.choices[0].message.content.strip()
-
-            # Анализ тональности
-            sentiment = self.determine_sentiment(reply)
+            for _ in stream:
+                while deltas:
+                    yield deltas.popleft()
+        except Exception as ex:
+            self.circuit_breaker.failure(ex)
+            raise
+        finally:
+            manager.__exit__(None, None, None)
+        while deltas:
+            yield deltas.popleft()
+        usage = getattr(handler.current_run, 'usage', None)
+        self._record_usage(getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+
+    def ask_stream(self, message: str, system_instruction: str = None, assistant: bool = False,
+                   sink: Sink = None, attempts: int = 3) -> Iterator[str]:
+        """Send a message to the model and yield the reply as it is generated.
+
+        The complete reply is added to the dialogue like a reply of `ask()`. On an error the
+        stream ends early and the error is logged.
+
+        @code
+        for delta in model.ask_stream("Hello"):
+            print(delta, end="", flush=True)
+        @endcode
 
-            # Добавление сообщений и тональности в диалог
-            self.dialogue.append({"role": "system", "content": system_instruction or self.system_instruction})
-            self.dialogue.append({"role": "user", "content": message_escaped})
-            self.dialogue.append({"role": "assistant", "content": reply, "sentiment": sentiment})
+        Args:
+            message (str): The message to send to the model.
+            system_instruction (str, optional): Optional system instruction.
+            assistant (bool, optional): Run the assistant on the conversation thread instead of a chat completion. Defaults to False.
+            sink (Sink, optional): Also receives every delta (e.g. a bot message being edited progressively).
+            attempts (int, optional): Number of retry attempts to open the stream. Defaults to 3.
 
-            # Сохранение диалога
-            self._save_dialogue()
+        Yields:
+            str: Text deltas of the reply.
+        """
+        if assistant:
+            messages = [{"role": "user", "content": message}]
+            cache_key = cached = None
+            deltas = self._stream_run(message, system_instruction, attempts)
+        else:
+            messages = self._build_messages(message, system_instruction)
+            cache_key = self._cache_key(messages)
+            cached = self.response_cache.get(cache_key) if cache_key else None
+            # Ответ из кэша отдаётся одним фрагментом
+            deltas = iter([cached]) if cached is not None else self._stream_chat(messages, attempts)
 
-            return reply
+        parts = []
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                if sink:
+                    sink(delta)
+                yield delta
         except Exception as ex:
-            logger.debug(f"An error occurred while sending the message: \n-----\n {pprint(messages)} \n-----\n", ex, True)
-            time.sleep(3)  # Задержка перед повторной попыткой
-            if attempts > 0:
-                return self.ask(message, attempts - 1)
-            return ""
+            logger.error(f"An error occurred while streaming the reply: \n-----\n {pprint(messages)} \n-----\n", ex, True)
+            return
+
+        reply = "".join(parts).strip()
+        if not reply:
+            return
+        if cache_key and cached is None:
+            self.response_cache.set(cache_key, reply)
+        self._record_turn(messages, reply, system_instruction)
+
+    def ask_many(self, prompts: Iterable[str], concurrency: int = None, stream: bool = False, **kwargs) -> List[BatchResult] | Iterator[BatchResult]:
+        """Send many prompts in parallel.
+
+        Args:
+            prompts (Iterable[str]): Messages to send. May be a lazy generator.
+            concurrency (int, optional): Number of parallel requests, capped by `max_concurrency`. Defaults to `max_concurrency`.
+            stream (bool, optional): Yield results as they complete instead of returning them in input order. Defaults to False.
+            **kwargs: Extra arguments for `ask()` (`system_instruction`, `attempts`).
+
+        Returns:
+            List[BatchResult] | Iterator[BatchResult]: One result per prompt; a failed prompt carries its `error`.
+        """
+        concurrency = min(concurrency or self.max_concurrency, self.max_concurrency)
+        if stream:
+            return iter_ask_many(self.ask, prompts, concurrency, **kwargs)
+        return ask_many(self.ask, prompts, concurrency, **kwargs)
 
     def train(self, data: str = None, data_dir: Path | str = None, data_file: Path | str = None, positive: bool = True) -> str | None:
         """Train the model on the specified data or directory.
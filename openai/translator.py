@@ -1,11 +1,23 @@
-﻿"""! Переводчик 
+﻿"""! Переводчик
+
+Strings are translated in batches: the input is deduplicated, strings already in the
+translation memory (SQLite, exact match on `(source, src_lang, tgt_lang)`) are taken from
+it, and the rest are packed into JSON objects (`{"0": "...", "1": "..."}`) of up to
+`batch_size` strings / `batch_tokens` tokens, one request per object, sent concurrently.
+Strings missing from a reply are sent again in smaller batches, then one by one.
+
 @code
 # Пример использования функции
 source_text = "Привет, как дела?"
 source_language = "Russian"
 target_language = "English"
-translation = translate_text(source_text, source_language, target_language)
+translation = translate(source_text, source_language, target_language)
 print(f"Translated text: {translation}")
+
+# Каталог целиком
+engine = TranslationEngine()
+titles_en = engine.translate_many(product_titles, 'Russian', 'English')
+engine.stats()   # {'strings': 5000, 'unique': 3100, 'memory_hits': 2900, 'hit_rate': 0.58, 'strings_per_second': 410.0, ...}
 @endcode
 """
 
@@ -14,37 +26,238 @@ print(f"Translated text: {translation}")
 #! /usr/share/projects/hypotez/venv/scripts python
 
 
-import openai
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
 from src.settings import gs
 from src.logger import logger
+from src.ai.batch import ask_many
+from src.ai.chunking import parse_json
+from src.ai.dialogue_memory import estimate_tokens
 
-openai.api_key = gs.credentials.openai
+SYSTEM_INSTRUCTION: str = (
+    "You are a translator. Translate every value of the JSON object from {source_language} to "
+    "{target_language}. Reply with a JSON object with the same keys and the translations as values, "
+    "without comments."
+)
 
-def translate(text, source_language, target_language):
-    # Формируем запрос к OpenAI API
-    prompt = (
-        f"Translate the following text from {source_language} to {target_language}:\n\n"
-        f"{text}\n\n"
-        f"Translation:"
-    )
 
-    try:
-        # Отправляем запрос к OpenAI API
-        response = openai.Completion.create(
-            engine="text-davinci-003",  # Укажите нужную модель
-            prompt=prompt,
-            max_tokens=1000,
-            n=1,
-            stop=None,
-            temperature=0.3
+class TranslationMemory:
+    """Persistent translation memory: exact-match lookup of `(source, src_lang, tgt_lang)`."""
+
+    path: Path
+
+    def __init__(self, path: str | Path):
+        """
+        Args:
+            path (str | Path): SQLite file of the memory.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS tm ('
+            'source TEXT NOT NULL, src_lang TEXT NOT NULL, tgt_lang TEXT NOT NULL, text TEXT NOT NULL, '
+            'created REAL NOT NULL, PRIMARY KEY (source, src_lang, tgt_lang))'
         )
+        self._db.commit()
+
+    def lookup(self, sources: Iterable[str], src_lang: str, tgt_lang: str) -> Dict[str, str]:
+        """Return the known translations of `sources` by source text."""
+        sources = list(sources)
+        found: Dict[str, str] = {}
+        with self._lock:
+            # Ограничение SQLite на число параметров запроса
+            for start in range(0, len(sources), 500):
+                part = sources[start:start + 500]
+                rows = self._db.execute(
+                    f'SELECT source, text FROM tm WHERE src_lang = ? AND tgt_lang = ? '
+                    f'AND source IN ({",".join("?" * len(part))})',
+                    (src_lang, tgt_lang, *part),
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def store(self, translations: Dict[str, str], src_lang: str, tgt_lang: str) -> None:
+        """Save translations (source text -> translation)."""
+        if not translations:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO tm (source, src_lang, tgt_lang, text, created) VALUES (?, ?, ?, ?, ?)',
+                [(source, src_lang, tgt_lang, text, now) for source, text in translations.items()],
+            )
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM tm').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class TranslationEngine:
+    """Batched, cached and concurrent translation of many strings."""
+
+    memory_path: Path = gs.path.data / 'AI' / 'translator' / 'memory.sqlite'
+
+    def __init__(self, ask: Callable[..., Optional[str]] = None, memory: TranslationMemory | str | Path = None,
+                 batch_size: int = 40, batch_tokens: int = 1500, concurrency: int = 8, attempts: int = 3,
+                 count: Callable[[str], int] = estimate_tokens):
+        """
+        Args:
+            ask (Callable[..., Optional[str]], optional): `ask(prompt, system_instruction=...)` of a model.
+                Defaults to `OpenAIModel.complete` (no dialogue history, nothing recorded), created on first use.
+            memory (TranslationMemory | str | Path, optional): Translation memory or its SQLite file. Defaults to `memory_path`.
+            batch_size (int, optional): Max strings in one request. Defaults to 40.
+            batch_tokens (int, optional): Max source tokens in one request; the reply is about the same size. Defaults to 1500.
+            concurrency (int, optional): Requests in flight. Defaults to 8.
+            attempts (int, optional): Rounds of re-sending the strings missing from the replies. Defaults to 3.
+            count (Callable[[str], int], optional): Token counter. Defaults to `estimate_tokens`.
+        """
+        self._ask = ask
+        self.memory = memory if isinstance(memory, TranslationMemory) else TranslationMemory(memory or self.memory_path)
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.count = count
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(('strings', 'unique', 'memory_hits', 'translated', 'failed', 'requests'), 0)
+        self.seconds = 0.0
+
+    @property
+    def ask(self) -> Callable[..., Optional[str]]:
+        if self._ask is None:
+            from src.ai.openai.model import OpenAIModel
+            self._ask = OpenAIModel().complete
+        return self._ask
+
+    def _batches(self, sources: Sequence[str], batch_size: int) -> List[List[str]]:
+        """Group strings into batches of at most `batch_size` strings and `batch_tokens` tokens."""
+        batches: List[List[str]] = []
+        batch: List[str] = []
+        tokens = 0
+        for source in sources:
+            source_tokens = self.count(source) + 4  # + ключ и кавычки
+            if batch and (len(batch) >= batch_size or tokens + source_tokens > self.batch_tokens):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(source)
+            tokens += source_tokens
+        if batch:
+            batches.append(batch)
+        return batches
 
-        # Извлекаем перевод из ответа API
-        translation = response.choices[0].text.strip()
-        return translation
+    def _translate_batches(self, batches: List[List[str]], system_instruction: str) -> Dict[str, str]:
+        """Send the batches concurrently. Returns the translations found in the replies."""
+        prompts = [json.dumps({str(i): source for i, source in enumerate(batch)}, ensure_ascii=False) for batch in batches]
+        with self._lock:
+            self.counters['requests'] += len(prompts)
+        translations: Dict[str, str] = {}
+        for result, batch in zip(ask_many(self.ask, prompts, self.concurrency, system_instruction=system_instruction), batches):
+            if result.error is not None:
+                logger.warning(f"Translation request failed: {result.error}")
+                continue
+            reply = parse_json(result.response)
+            if not isinstance(reply, dict):
+                logger.warning(f"Translation reply is not a JSON object: {str(result.response)[:200]!r}")
+                continue
+            for i, source in enumerate(batch):
+                text = reply.get(str(i))
+                if isinstance(text, str) and text.strip():
+                    translations[source] = text.strip()
+        return translations
+
+    def translate_many(self, texts: Iterable[str], source_language: str, target_language: str) -> List[Optional[str]]:
+        """Translate many strings.
+
+        Args:
+            texts (Iterable[str]): Strings to translate. Duplicates are translated once.
+            source_language (str): Source language, e.g. `Russian`.
+            target_language (str): Target language, e.g. `English`.
+
+        Returns:
+            List[Optional[str]]: Translations in input order; `None` for a string that could not be translated.
+                Empty strings are returned as is.
+        """
+        started = time.monotonic()
+        texts = list(texts)
+        unique = list(dict.fromkeys(text for text in texts if text and text.strip()))
+        translations = self.memory.lookup(unique, source_language, target_language)
+        hits = len(translations)
+
+        system_instruction = SYSTEM_INSTRUCTION.format(source_language=source_language, target_language=target_language)
+        pending = [source for source in unique if source not in translations]
+        batch_size = self.batch_size
+        for attempt in range(max(1, self.attempts)):
+            if not pending:
+                break
+            if attempt:
+                logger.info(f"Translating {len(pending)} strings again, batch size {batch_size}")
+            new = self._translate_batches(self._batches(pending, batch_size), system_instruction)
+            self.memory.store(new, source_language, target_language)
+            translations.update(new)
+            pending = [source for source in pending if source not in translations]
+            # Строки, пропущенные в ответе, отправляются меньшими пачками, в последней попытке - по одной
+            batch_size = 1 if attempt + 2 >= self.attempts else max(1, batch_size // 4)
+
+        if pending:
+            logger.error(f"{len(pending)} strings were not translated from {source_language} to {target_language}")
+        with self._lock:
+            self.counters['strings'] += len(texts)
+            self.counters['unique'] += len(unique)
+            self.counters['memory_hits'] += hits
+            self.counters['translated'] += len(unique) - hits - len(pending)
+            self.counters['failed'] += len(pending)
+            self.seconds += time.monotonic() - started
+        return [translations.get(text) if text and text.strip() else text for text in texts]
+
+    def translate(self, text: str, source_language: str, target_language: str) -> Optional[str]:
+        """Translate one string. See `translate_many`."""
+        return self.translate_many([text], source_language, target_language)[0]
+
+    def stats(self) -> dict:
+        """Counters, memory hit rate (of the unique strings) and throughput (input strings per second)."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats['hit_rate'] = stats['memory_hits'] / stats['unique'] if stats['unique'] else 0.0
+            stats['strings_per_second'] = stats['strings'] / self.seconds if self.seconds else 0.0
+            stats['seconds'] = self.seconds
+        return stats
+
+
+_engine: Optional[TranslationEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_translation_engine() -> TranslationEngine:
+    """Return the process-wide translation engine."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TranslationEngine()
+        return _engine
+
+
+def translate(text, source_language, target_language):
+    """Translate `text` through the process-wide `TranslationEngine` (translation memory, retries).
+
+    Returns:
+        Optional[str]: The translation or `None` on error.
+    """
+    try:
+        return get_translation_engine().translate(text, source_language, target_language)
     except Exception as ex:
         # Логируем ошибку
         logger.error("Error during translation", ex)
         return None
-
-
@@ -0,0 +1,241 @@
+## \file ../src/ai/pipeline.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Resumable campaign processing pipeline.
+
+Every `(input file, provider)` pair is a work item recorded in a SQLite ledger with the
+SHA-256 of the input, its status, the provider and the output path. A run skips the items
+that are done for an unchanged input, so a crashed or interrupted run resumes where it
+stopped and an edited input is processed again.
+
+Outputs are written to a temporary file and moved into place with `os.replace` before the
+item is marked done: an output file is either absent or complete. An item interrupted
+between the write and the ledger update is recognized on the next run by the output
+written after the item started, and is marked done without a new API call.
+
+@code
+pipeline = CampaignPipeline(
+    {'openai': openai.ask, 'gemini': gemini.ask},
+    gs.path.data / 'AI' / 'pipeline' / 'aliexpress.sqlite',
+    workers=8,
+)
+pipeline.run(product_titles_files)   # {'done': 120, 'skipped': 880, 'failed': 0}
+@endcode
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from src.logger import logger
+from src.ai.batch import iter_ask_many
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+def file_hash(path: str | Path) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomic(path: str | Path, data: str) -> None:
+    """Write `data` to `path` via a temporary file in the same directory and `os.replace`."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class WorkLedger:
+    """SQLite ledger of work items keyed by `(input, provider)`."""
+
+    path: Path
+
+    def __init__(self, path: str | Path):
+        """
+        Args:
+            path (str | Path): SQLite file of the ledger.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS work ('
+            'input TEXT NOT NULL, provider TEXT NOT NULL, input_hash TEXT NOT NULL, status TEXT NOT NULL, '
+            'output_path TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, '
+            'started REAL, updated REAL NOT NULL, PRIMARY KEY (input, provider))'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS work_status ON work(status)')
+        self._db.commit()
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+            self._db.commit()
+            return rows
+
+    def get(self, input: str, provider: str) -> Optional[dict]:
+        """Return the ledger record of an item or `None`."""
+        rows = self._execute(
+            'SELECT input_hash, status, output_path, attempts, error, started FROM work WHERE input = ? AND provider = ?',
+            (input, provider),
+        )
+        if not rows:
+            return None
+        return dict(zip(('input_hash', 'status', 'output_path', 'attempts', 'error', 'started'), rows[0]))
+
+    def is_done(self, input: str, provider: str, input_hash: str) -> bool:
+        """`True` if the item is done for this exact input and its output exists."""
+        record = self.get(input, provider)
+        return bool(
+            record and record['status'] == DONE and record['input_hash'] == input_hash
+            and record['output_path'] and Path(record['output_path']).exists()
+        )
+
+    def start(self, input: str, provider: str, input_hash: str, output_path: str | Path) -> None:
+        now = time.time()
+        self._execute(
+            'INSERT INTO work (input, provider, input_hash, status, output_path, attempts, error, started, updated) '
+            'VALUES (?, ?, ?, ?, ?, 1, NULL, ?, ?) '
+            'ON CONFLICT (input, provider) DO UPDATE SET input_hash = excluded.input_hash, status = excluded.status, '
+            'output_path = excluded.output_path, attempts = work.attempts + 1, error = NULL, '
+            'started = excluded.started, updated = excluded.updated',
+            (input, provider, input_hash, RUNNING, str(output_path), now, now),
+        )
+
+    def finish(self, input: str, provider: str) -> None:
+        self._execute('UPDATE work SET status = ?, updated = ? WHERE input = ? AND provider = ?',
+                      (DONE, time.time(), input, provider))
+
+    def fail(self, input: str, provider: str, error: BaseException | str) -> None:
+        self._execute('UPDATE work SET status = ?, error = ?, updated = ? WHERE input = ? AND provider = ?',
+                      (FAILED, str(error)[:2000], time.time(), input, provider))
+
+    def recover(self) -> int:
+        """Settle the items left `running` by an interrupted run.
+
+        An item whose output was written after it started is marked done, the others return to pending.
+
+        Returns:
+            int: Number of items recovered as done.
+        """
+        recovered = 0
+        for input, provider, output_path, started in self._execute(
+            'SELECT input, provider, output_path, started FROM work WHERE status = ?', (RUNNING,)
+        ):
+            output = Path(output_path) if output_path else None
+            if output and output.exists() and started and output.stat().st_mtime >= started:
+                self.finish(input, provider)
+                recovered += 1
+            else:
+                self._execute('UPDATE work SET status = ?, updated = ? WHERE input = ? AND provider = ?',
+                              (PENDING, time.time(), input, provider))
+        return recovered
+
+    def stats(self) -> Dict[str, int]:
+        """Number of items by status."""
+        return dict(self._execute('SELECT status, COUNT(*) FROM work GROUP BY status'))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def default_output_path(input_path: Path, provider: str) -> Path:
+    """`<dir>/<name>.<provider>.json` next to the input file."""
+    return input_path.with_name(f'{input_path.stem}.{provider}.json')
+
+
+class CampaignPipeline:
+    """Runs every provider over every input file with N workers, recording progress in a `WorkLedger`."""
+
+    workers: int
+
+    def __init__(self, providers: Dict[str, Callable[[str], Any]], ledger: WorkLedger | str | Path, workers: int = 4,
+                 output_path: Callable[[Path, str], Path] = default_output_path):
+        """
+        Args:
+            providers (Dict[str, Callable[[str], Any]]): Provider name -> function processing the text of an input
+                (`model.ask`, or a chunked call). A string reply is written as is, other values as JSON.
+            ledger (WorkLedger | str | Path): The ledger or the path of its SQLite file.
+            workers (int, optional): Number of parallel work items. Defaults to 4.
+            output_path (Callable[[Path, str], Path], optional): Output file of `(input, provider)`.
+                Defaults to `default_output_path`.
+        """
+        self.providers = providers
+        self.ledger = ledger if isinstance(ledger, WorkLedger) else WorkLedger(ledger)
+        self.workers = workers
+        self.output_path = output_path
+
+    def _jobs(self, inputs: Iterable[str | Path], counters: Dict[str, int]) -> Iterator[tuple]:
+        """Yield `(input, provider, hash)` of the items to process, skipping the done ones."""
+        for input_path in inputs:
+            input_path = Path(input_path)
+            try:
+                input_hash = file_hash(input_path)
+            except OSError as ex:
+                logger.error(f"Error reading {input_path}", ex)
+                counters['failed'] += len(self.providers)
+                continue
+            for provider in self.providers:
+                if self.ledger.is_done(str(input_path), provider, input_hash):
+                    counters['skipped'] += 1
+                    continue
+                yield input_path, provider, input_hash
+
+    def _process(self, job: tuple) -> Path:
+        input_path, provider, input_hash = job
+        output = self.output_path(input_path, provider)
+        self.ledger.start(str(input_path), provider, input_hash, output)
+        text = input_path.read_text(encoding='utf-8')
+        if file_hash(input_path) != input_hash:
+            raise RuntimeError(f"{input_path} changed while being processed")
+        response = self.providers[provider](text)
+        if not response:
+            raise RuntimeError(f"Empty response of {provider}")
+        data = response if isinstance(response, str) else json.dumps(response, ensure_ascii=False, indent=2)
+        write_atomic(output, data)
+        self.ledger.finish(str(input_path), provider)
+        return output
+
+    def run(self, inputs: Iterable[str | Path]) -> Dict[str, int]:
+        """Process the inputs that are new, changed or not done yet.
+
+        Args:
+            inputs (Iterable[str | Path]): Input files. May be a lazy generator.
+
+        Returns:
+            Dict[str, int]: Counters of the run: `done`, `skipped`, `failed`, `recovered`.
+        """
+        counters = {'done': 0, 'skipped': 0, 'failed': 0, 'recovered': self.ledger.recover()}
+        for result in iter_ask_many(self._process, self._jobs(inputs, counters), self.workers):
+            input_path, provider, _ = result.prompt
+            if result.error:
+                logger.error(f"Campaign {input_path} ({provider}) failed", result.error, False)
+                self.ledger.fail(str(input_path), provider, result.error)
+                counters['failed'] += 1
+            else:
+                counters['done'] += 1
+        logger.info(f"Campaign pipeline: {counters}")
+        return counters
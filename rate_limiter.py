@@ -0,0 +1,148 @@
+## \file ../src/ai/rate_limiter.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Token bucket rate limiter shared by the model classes.
+
+Every provider/model pair gets one process-wide `RateLimiter` with a bucket for
+requests per minute (`rpm`) and a bucket for tokens per minute (`tpm`). The limits
+come from the model registry (`src.ai.registry`), i.e. the provider `models.json`:
+
+@code
+{
+  "gpt-4o": {"rpm": 500, "tpm": 30000}
+}
+@endcode
+
+Capacity is reserved under a `threading.Lock`, so the same limiter paces threads
+(`acquire()`) and asyncio tasks (`await acquire_async()`) together.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from src.logger import logger
+from src.ai.registry import ModelInfo
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate_per_minute`."""
+
+    rate: float
+    capacity: float
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute (float): Refill rate.
+            capacity (Optional[float], optional): Max burst. Defaults to one minute of refill.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Take `amount` tokens and return how many seconds the caller must wait before using them.
+
+        The balance may go negative: later callers then wait for the debt to be refilled,
+        which keeps the order of reservations fair between threads and tasks.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def give_back(self, amount: float) -> None:
+        """Return unused tokens (or take more when `amount` is negative) after the real usage is known."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits of one provider model."""
+
+    name: str
+    requests: Optional[TokenBucket]
+    tokens: Optional[TokenBucket]
+
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        """
+        Args:
+            name (str): Name used in logs (`provider/model`).
+            rpm (Optional[float], optional): Requests per minute. `None` - unlimited.
+            tpm (Optional[float], optional): Tokens per minute. `None` - unlimited.
+        """
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.waited = 0.0
+        self.acquired = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests:
+            delay = self.requests.reserve(1)
+        if self.tokens and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        with self._lock:
+            self.acquired += 1
+            self.waited += delay
+        if delay:
+            logger.debug(f"Rate limit {self.name}: waiting {delay:.2f}s")
+        return delay
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block the calling thread until a request of `tokens` tokens may be sent.
+
+        Returns:
+            float: Seconds waited.
+        """
+        delay = self._reserve(tokens)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """Coroutine variant of `acquire()`."""
+        delay = self._reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def adjust(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token bucket when the real usage of a request differs from the estimate."""
+        if self.tokens and actual is not None:
+            self.tokens.give_back(estimated - actual)
+
+    @property
+    def stats(self) -> dict:
+        """Number of acquired requests and total seconds spent waiting."""
+        return {'acquired': self.acquired, 'waited': self.waited}
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str, info: Optional[ModelInfo] = None) -> RateLimiter:
+    """Return the process-wide rate limiter of a provider model.
+
+    Args:
+        provider (str): Provider name (`openai`, `gemini`).
+        model (str): Model name.
+        info (Optional[ModelInfo], optional): The model in the registry of the provider, with its `rpm`/`tpm`.
+            Without it the limiter is unlimited.
+    """
+    key = (provider, model)
+    with _lock:
+        limiter = _limiters.get(key)
+        if not limiter:
+            limiter = _limiters[key] = RateLimiter(f"{provider}/{model}", info.rpm if info else None, info.tpm if info else None)
+        return limiter
@@ -0,0 +1,232 @@
+## \file ../src/ai/registry.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! In-process registry of models and assistants.
+
+The registry is built once per provider from the local `models.json` (per-model limits),
+an optional `assistants.json` and the model ids of the last remote refresh cached on disk.
+Lookups by model id, assistant id or assistant name are dict lookups. The remote list is
+refreshed in a background thread, so building the registry never waits for the API.
+
+@code
+registry = get_model_registry('openai', models_path, assistants_path, cache_path,
+                              remote=lambda: [m.id for m in client.models.list()])
+registry.get_model('gpt-4o').context_window
+registry.get_assistant('developer for hypo code').id
+@endcode
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.logger import logger
+from src.utils import j_loads, j_dumps
+
+
+class ModelInfo:
+    """Model id and its limits."""
+
+    __slots__ = ('id', 'context_window', 'max_output_tokens', 'rpm', 'tpm', 'local')
+
+    def __init__(self, id: str, context_window: Optional[int] = None, max_output_tokens: Optional[int] = None,
+                 rpm: Optional[int] = None, tpm: Optional[int] = None, local: bool = True):
+        self.id = id
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.rpm = rpm
+        self.tpm = tpm
+        self.local = local  # described in `models.json`, not only listed by the API
+
+    @property
+    def prompt_budget(self) -> Optional[int]:
+        """Max prompt tokens: the context window minus the reserved output. `None` if unknown or not positive."""
+        if not self.context_window:
+            return None
+        budget = self.context_window - (self.max_output_tokens or 0)
+        if budget <= 0:
+            logger.warning(f"Model {self.id}: max_output_tokens {self.max_output_tokens} leaves no room "
+                           f"for the prompt in a context window of {self.context_window}, the budget is not enforced")
+            return None
+        return budget
+
+    def __repr__(self) -> str:
+        return f"ModelInfo({self.id!r}, context_window={self.context_window}, rpm={self.rpm}, tpm={self.tpm})"
+
+
+class AssistantInfo:
+    """Assistant record of `assistants.json`."""
+
+    __slots__ = ('id', 'name', 'title', 'description', 'instructions')
+
+    def __init__(self, id: str, name: str = '', title: str = '', description: str = '', instructions: Optional[dict] = None):
+        self.id = id
+        self.name = name
+        self.title = title
+        self.description = description
+        self.instructions = instructions or {}
+
+    def __repr__(self) -> str:
+        return f"AssistantInfo({self.id!r}, {self.name!r})"
+
+
+class ModelRegistry:
+    """Models and assistants of one provider, indexed by id and name."""
+
+    provider: str
+    refresh_interval: float
+    retry_interval: float
+
+    def __init__(self, provider: str, models_path: Optional[str | Path] = None, assistants_path: Optional[str | Path] = None,
+                 cache_path: Optional[str | Path] = None, remote: Optional[Callable[[], Iterable[str]]] = None,
+                 refresh_interval: float = 24 * 60 * 60, retry_interval: float = 15 * 60):
+        """
+        Args:
+            provider (str): Provider name.
+            models_path (Optional[str | Path], optional): `models.json` - `{model_id: {"context_window": ..., "rpm": ..., "tpm": ...}}`.
+            assistants_path (Optional[str | Path], optional): `assistants.json` - `{assistant_id: {"name": ..., ...}}`.
+            cache_path (Optional[str | Path], optional): File keeping the model ids of the last remote refresh.
+            remote (Optional[Callable[[], Iterable[str]]], optional): Returns the model ids available via the API.
+            refresh_interval (float, optional): Seconds after which the remote list is refreshed. Defaults to one day.
+            retry_interval (float, optional): Seconds between background refresh attempts while they fail
+                (e.g. the network is down). Defaults to 15 minutes.
+        """
+        self.provider = provider
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.remote = remote
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.refreshed: float = 0
+        self.attempted: float = 0  # time of the last refresh attempt, successful or not
+        self._models: Dict[str, ModelInfo] = {}
+        self._assistants: Dict[str, AssistantInfo] = {}
+        self._assistants_by_name: Dict[str, AssistantInfo] = {}
+        self._lock = threading.Lock()
+        self._refreshing: Optional[threading.Thread] = None
+
+        if models_path:
+            self._load_models(Path(models_path))
+        if assistants_path:
+            self._load_assistants(Path(assistants_path))
+        self._load_cache()
+
+    def _load_models(self, path: Path) -> None:
+        try:
+            for model_id, limits in (j_loads(path) or {}).items():
+                limits = limits or {}
+                self._models[model_id] = ModelInfo(
+                    model_id, limits.get('context_window'), limits.get('max_output_tokens'),
+                    limits.get('rpm'), limits.get('tpm'),
+                )
+        except Exception as ex:
+            logger.error(f"Error loading models from {path}", ex)
+
+    def _load_assistants(self, path: Path) -> None:
+        try:
+            # `assistants.json` is a dict keyed by assistant id
+            for assistant_id, data in (j_loads(path) or {}).items():
+                data = data or {}
+                assistant = AssistantInfo(
+                    assistant_id, data.get('name', ''), data.get('title', ''),
+                    data.get('description', ''), data.get('instructions'),
+                )
+                self._assistants[assistant_id] = assistant
+                if assistant.name:
+                    self._assistants_by_name[assistant.name] = assistant
+        except Exception as ex:
+            logger.error(f"Error loading assistants from {path}", ex)
+
+    def _load_cache(self) -> None:
+        if not self.cache_path or not self.cache_path.exists():
+            return
+        try:
+            cache = j_loads(self.cache_path) or {}
+            self._add_remote(cache.get('models', []))
+            self.refreshed = cache.get('refreshed', 0)
+        except Exception as ex:
+            logger.error(f"Error loading registry cache {self.cache_path}", ex)
+
+    def _add_remote(self, model_ids: Iterable[str]) -> None:
+        for model_id in model_ids:
+            if model_id not in self._models:
+                self._models[model_id] = ModelInfo(model_id, local=False)
+
+    def get_model(self, model_id: str) -> Optional[ModelInfo]:
+        """Return the model by id or `None`."""
+        return self._models.get(model_id)
+
+    def get_assistant(self, key: str) -> Optional[AssistantInfo]:
+        """Return the assistant by id or by name, or `None`."""
+        return self._assistants.get(key) or self._assistants_by_name.get(key)
+
+    @property
+    def models(self) -> List[str]:
+        """Ids of every known model."""
+        return list(self._models)
+
+    @property
+    def assistants(self) -> List[AssistantInfo]:
+        """Every assistant of `assistants.json`."""
+        return list(self._assistants.values())
+
+    @property
+    def stale(self) -> bool:
+        """`True` if the remote list was never refreshed or is older than `refresh_interval`."""
+        return time.time() - self.refreshed > self.refresh_interval
+
+    def refresh(self) -> bool:
+        """Fetch the model ids from the API and cache them on disk. Blocks the caller.
+
+        Returns:
+            bool: `True` on success.
+        """
+        if not self.remote:
+            return False
+        self.attempted = time.time()
+        try:
+            model_ids = list(self.remote())
+        except Exception as ex:
+            logger.error(f"Error refreshing {self.provider} models", ex)
+            return False
+        with self._lock:
+            self._add_remote(model_ids)
+            self.refreshed = time.time()
+        if self.cache_path:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            j_dumps({'refreshed': self.refreshed, 'models': model_ids}, self.cache_path)
+        logger.info(f"Refreshed {self.provider} models: {len(model_ids)}")
+        return True
+
+    def refresh_in_background(self, force: bool = False) -> Optional[threading.Thread]:
+        """Start `refresh()` in a daemon thread if the data is stale (or `force`) and no refresh is running.
+
+        After a failed attempt the next one starts only after `retry_interval`, not on every lookup.
+        """
+        if not self.remote or not (force or (self.stale and time.time() - self.attempted > self.retry_interval)):
+            return None
+        with self._lock:
+            if self._refreshing and self._refreshing.is_alive():
+                return self._refreshing
+            self._refreshing = threading.Thread(target=self.refresh, name=f"{self.provider}-registry", daemon=True)
+            self._refreshing.start()
+            return self._refreshing
+
+
+_registries: Dict[str, ModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_model_registry(provider: str, *args, **kwargs) -> ModelRegistry:
+    """Return the process-wide registry of `provider`, building it on the first call.
+
+    The arguments are those of `ModelRegistry` and are used only on the first call.
+    A background refresh is started when the cached remote list is stale.
+    """
+    with _registries_lock:
+        registry = _registries.get(provider)
+        if not registry:
+            registry = _registries[provider] = ModelRegistry(provider, *args, **kwargs)
+    registry.refresh_in_background()
+    return registry
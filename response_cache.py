@@ -0,0 +1,194 @@
+## \file ../src/ai/response_cache.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Content-addressed cache of model responses.
+
+The key is a SHA-256 hash of `(provider, model, system instruction, messages, generation config)`.
+Lookups go to an in-memory LRU tier first and then to an optional SQLite tier on disk.
+Both tiers support TTL and size based eviction.
+
+@code
+cache = ResponseCache(gs.path.data / 'AI' / 'cache' / 'responses.sqlite', ttl=7 * 24 * 3600)
+model = OpenAIModel(system_instruction=system_instruction, response_cache=cache)
+model.ask(product_titles)   # API call
+model.ask(product_titles)   # served from the cache
+cache.stats                 # {'hits': 1, 'misses': 1, ...}
+@endcode
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+from src.logger import logger
+
+
+def make_cache_key(provider: str, model: str, system_instruction: Optional[str], messages: Any, config: Optional[dict] = None) -> str:
+    """Return the content hash identifying a request.
+
+    Args:
+        provider (str): Provider name (`openai`, `gemini`).
+        model (str): Model name.
+        system_instruction (Optional[str]): System instruction sent with the request.
+        messages (Any): Prompt or list of messages. Must be JSON serializable.
+        config (Optional[dict], optional): Generation config (temperature, mime type...).
+
+    Returns:
+        str: Hex digest of the request.
+    """
+    payload = json.dumps(
+        [provider, model, system_instruction, messages, config or {}],
+        ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Two tier (memory LRU + SQLite) response cache."""
+
+    path: Optional[Path]
+    max_entries: int
+    max_disk_entries: int
+    ttl: Optional[float]
+
+    def __init__(self, path: Optional[str | Path] = None, max_entries: int = 1024,
+                 max_disk_entries: int = 100_000, ttl: Optional[float] = None):
+        """
+        Args:
+            path (Optional[str | Path], optional): SQLite file of the persistent tier. `None` - memory only.
+            max_entries (int, optional): Max number of responses in the memory tier. Defaults to 1024.
+            max_disk_entries (int, optional): Max number of responses in the disk tier. Defaults to 100000.
+            ttl (Optional[float], optional): Lifetime of an entry in seconds. `None` - entries never expire.
+        """
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.RLock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        if self.path:
+            self._open()
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)')
+        self._db.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for `key` or `None`."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db:
+                try:
+                    row = self._db.execute('SELECT value, created FROM responses WHERE key = ?', (key,)).fetchone()
+                    if row:
+                        value, created = row
+                        if not self._expired(created, now):
+                            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                            self._db.commit()
+                            self._remember(key, created, value)
+                            self.hits += 1
+                            self.disk_hits += 1
+                            return value
+                        self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                        self._db.commit()
+                except sqlite3.Error as ex:
+                    logger.error(f"Response cache read error {self.path}", ex)
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response. Empty responses are not cached."""
+        if not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db:
+                try:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                        (key, value, now, now),
+                    )
+                    self._writes += 1
+                    if self._writes % 100 == 0:
+                        self._evict_disk(now)
+                    self._db.commit()
+                except sqlite3.Error as ex:
+                    logger.error(f"Response cache write error {self.path}", ex)
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> None:
+        """Drop expired entries and the least recently used ones over `max_disk_entries`."""
+        if self.ttl is not None:
+            self._db.execute('DELETE FROM responses WHERE created < ?', (now - self.ttl,))
+        self._db.execute(
+            'DELETE FROM responses WHERE key IN ('
+            'SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.max_disk_entries,),
+        )
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db:
+                self._db.execute('DELETE FROM responses')
+                self._db.commit()
+
+    def close(self) -> None:
+        """Close the SQLite connection."""
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+    @property
+    def stats(self) -> dict:
+        """Hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'hit_rate': self.hits / total if total else 0.0,
+            'memory_entries': len(self._memory),
+        }
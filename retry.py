@@ -0,0 +1,211 @@
+## \file ../src/ai/retry.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Retry policy for provider calls.
+
+Errors are classified as retryable (rate limits, timeouts, 5xx, connection errors)
+or fatal (bad request, authentication...). Retryable errors are retried with
+exponential backoff and full jitter, `Retry-After` is honored, and the whole call
+is bounded by a deadline. Every retry is counted in `RetryStats`.
+
+@code
+policy = RetryPolicy('openai', max_attempts=4, deadline=60)
+reply = policy.call(send_request, messages)
+policy.stats.as_dict()   # {'calls': 1, 'retries': 0, 'waited': 0.0, ...}
+@endcode
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.logger import logger
+
+# HTTP statuses after which a request is worth retrying
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Names of the retryable exception classes of openai / google.api_core / requests
+RETRYABLE_ERRORS = {
+    'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError',
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'TooManyRequests',
+    'BadGateway', 'GatewayTimeout', 'Aborted',
+    'ConnectionError', 'Timeout', 'TimeoutError', 'ConnectTimeout', 'ReadTimeout',
+}
+
+
+def error_status(ex: BaseException) -> Optional[int]:
+    """Return the HTTP status carried by a provider exception, if any."""
+    for attr in ('status_code', 'code', 'status'):
+        value = getattr(ex, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return None
+
+
+def is_retryable(ex: BaseException) -> bool:
+    """Classify an exception: `True` - retryable, `False` - fatal."""
+    status = error_status(ex)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(ex).__mro__)
+
+
+def retry_after(ex: BaseException) -> Optional[float]:
+    """Return the delay requested by the provider (`Retry-After` / `retry-after-ms` headers) in seconds."""
+    response = getattr(ex, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        # HTTP-date format is not used by the providers
+        return None
+    return None
+
+
+class RetryError(Exception):
+    """Raised when the attempts or the deadline are exhausted. `__cause__` holds the last error."""
+
+
+class RetryStats:
+    """Thread-safe retry counters of one policy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.waited = 0.0
+        self.fatal = 0
+        self.exhausted = 0
+        self.errors: Counter = Counter()
+
+    def _add(self, **values) -> None:
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _error(self, ex: BaseException) -> None:
+        with self._lock:
+            self.errors[type(ex).__name__] += 1
+
+    def as_dict(self) -> dict:
+        """Counters as a dict: calls, retries, seconds spent waiting, fatal and exhausted calls, errors by type."""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'waited': self.waited,
+                'fatal': self.fatal,
+                'exhausted': self.exhausted,
+                'errors': dict(self.errors),
+            }
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, `Retry-After` and an overall deadline."""
+
+    name: str
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    deadline: Optional[float]
+    stats: RetryStats
+
+    def __init__(self, name: str, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 deadline: Optional[float] = 120.0, classify: Callable[[BaseException], bool] = is_retryable):
+        """
+        Args:
+            name (str): Name of the policy in logs and in `get_retry_stats()`.
+            max_attempts (int, optional): Total number of attempts including the first one. Defaults to 4.
+            base_delay (float, optional): Backoff base in seconds. Defaults to 1.0.
+            max_delay (float, optional): Max backoff in seconds. Defaults to 30.0.
+            deadline (Optional[float], optional): Max seconds for the whole call with retries. `None` - no deadline.
+            classify (Callable[[BaseException], bool], optional): Returns `True` for retryable errors. Defaults to `is_retryable`.
+        """
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.classify = classify
+        self.stats = _stats.setdefault(name, RetryStats())
+
+    def backoff(self, attempt: int, ex: BaseException) -> float:
+        """Delay before the retry following failed `attempt` (0-based)."""
+        requested = retry_after(ex)
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _next_delay(self, attempt: int, attempts: int, ex: BaseException, started: float) -> Optional[float]:
+        """Return the delay before the next attempt or `None` if the call must fail now."""
+        self.stats._error(ex)
+        if not self.classify(ex):
+            self.stats._add(fatal=1)
+            return None
+        if attempt + 1 >= attempts:
+            self.stats._add(exhausted=1)
+            return None
+        delay = self.backoff(attempt, ex)
+        if self.deadline is not None and time.monotonic() - started + delay > self.deadline:
+            self.stats._add(exhausted=1)
+            return None
+        self.stats._add(retries=1, waited=delay)
+        logger.info(f"Retry {self.name} #{attempt + 1} in {delay:.2f}s after {type(ex).__name__}: {ex}")
+        return delay
+
+    def call(self, fn: Callable[..., Any], *args, attempts: Optional[int] = None, **kwargs) -> Any:
+        """Call `fn(*args, **kwargs)` retrying retryable errors.
+
+        Args:
+            fn (Callable[..., Any]): Function to call.
+            attempts (Optional[int], optional): Overrides `max_attempts` for this call.
+
+        Raises:
+            Exception: The fatal error, or `RetryError` when attempts or deadline are exhausted.
+        """
+        attempts = attempts or self.max_attempts
+        started = time.monotonic()
+        self.stats._add(calls=1)
+        for attempt in range(attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as ex:
+                delay = self._next_delay(attempt, attempts, ex, started)
+                if delay is None:
+                    if not self.classify(ex):
+                        raise
+                    raise RetryError(f"{self.name}: gave up after {attempt + 1} attempts") from ex
+                time.sleep(delay)
+
+    async def call_async(self, fn: Callable[..., Awaitable[Any]], *args, attempts: Optional[int] = None, **kwargs) -> Any:
+        """Coroutine variant of `call()`. `asyncio.CancelledError` is never retried."""
+        attempts = attempts or self.max_attempts
+        started = time.monotonic()
+        self.stats._add(calls=1)
+        for attempt in range(attempts):
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as ex:
+                delay = self._next_delay(attempt, attempts, ex, started)
+                if delay is None:
+                    if not self.classify(ex):
+                        raise
+                    raise RetryError(f"{self.name}: gave up after {attempt + 1} attempts") from ex
+                await asyncio.sleep(delay)
+
+
+_stats: Dict[str, RetryStats] = {}
+
+
+def get_retry_stats() -> Dict[str, dict]:
+    """Return the retry counters of every policy by name."""
+    return {name: stats.as_dict() for name, stats in _stats.items()}
@@ -0,0 +1,227 @@
+## \file ../src/ai/router.py
+# -*- coding: utf-8 -*-
+#! /usr/share/projects/hypotez/venv/scripts python
+
+"""! Multi-provider router with latency-based selection and hedged requests.
+
+`ProviderRouter` puts several models (`OpenAIModel`, `GoogleGenerativeAI` or anything with
+an `ask(prompt)` method) behind one `ask()`. For every provider it keeps a rolling window
+of latencies and errors and sends each prompt to the fastest healthy one (lowest p50).
+With `hedge=True`, if the first provider has not answered after its latency percentile,
+the prompt is also sent to the next provider and the first answer wins.
+
+A provider that raises or returns an empty reply counts as an error; the prompt then goes
+to the next provider in order.
+
+@code
+router = ProviderRouter([OpenAIModel(system_instruction=si), GoogleGenerativeAI(system_instruction=si)], hedge=True)
+reply = router.ask(product_titles)
+router.stats()   # {'gpt-4o': {'p50': 2.1, 'p99': 7.9, 'error_rate': 0.0, ...}, 'gemini-1.5-flash': {...}}
+@endcode
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from src.logger import logger
+from src.ai.batch import BatchResult, ask_many, iter_ask_many
+
+
+class LatencyStats:
+    """Rolling window of the latencies and outcomes of one provider."""
+
+    def __init__(self, window: int = 100):
+        self._samples: deque = deque(maxlen=window)  # (seconds, ok)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0  # requests sent to this provider as hedges
+        self.wins = 0  # replies returned to the caller
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((seconds, ok))
+            self.calls += 1
+            self.errors += not ok
+
+    def count(self, **values) -> None:
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency percentile (`p` in 0..1) of the successful calls in the window, `None` without samples."""
+        with self._lock:
+            latencies = sorted(seconds for seconds, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    @property
+    def error_rate(self) -> float:
+        """Share of failed calls in the window."""
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(not ok for _, ok in self._samples) / len(self._samples)
+
+    def as_dict(self) -> dict:
+        return {
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'error_rate': self.error_rate,
+            'calls': self.calls,
+            'errors': self.errors,
+            'hedges': self.hedges,
+            'wins': self.wins,
+        }
+
+
+def provider_name(provider: Any) -> str:
+    """Name of a model instance: its model name (`gpt-4o`, `gemini-1.5-flash`) or class name."""
+    name = getattr(provider, 'model_name', None) or getattr(provider, 'model', None)
+    return name if isinstance(name, str) else type(provider).__name__
+
+
+class ProviderRouter:
+    """One `ask()` over several providers, routed by rolling latency and error rate."""
+
+    max_concurrency: int = 8  # Max parallel prompts of `ask_many()`
+
+    def __init__(self, providers: Dict[str, Any] | Iterable[Any], window: int = 100, min_samples: int = 5,
+                 max_error_rate: float = 0.5, hedge: bool = False, hedge_percentile: float = 0.95,
+                 hedge_delay: Optional[float] = None):
+        """
+        Args:
+            providers (Dict[str, Any] | Iterable[Any]): Models by name, or a list of models named by `provider_name()`.
+                Every model needs an `ask(prompt, **kwargs)` method.
+            window (int, optional): Number of recent calls kept per provider. Defaults to 100.
+            min_samples (int, optional): Providers with fewer samples are tried first, so each one gets measured. Defaults to 5.
+            max_error_rate (float, optional): Providers above this error rate are used only as the last resort. Defaults to 0.5.
+            hedge (bool, optional): Send a second request when the first one is slow. Defaults to False.
+            hedge_percentile (float, optional): Latency percentile of the first provider after which the hedge is sent. Defaults to 0.95.
+            hedge_delay (Optional[float], optional): Fixed hedge delay in seconds, used until the provider has `min_samples`
+                samples, or always if `hedge_percentile` is `None`.
+        """
+        if not isinstance(providers, dict):
+            providers = {provider_name(p): p for p in providers}
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers: Dict[str, Any] = providers
+        self.stats_by_provider: Dict[str, LatencyStats] = {name: LatencyStats(window) for name in providers}
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        # The losing hedge is not cancelled: it finishes in the pool and is counted in the stats
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(providers) * self.max_concurrency,
+                                            thread_name_prefix='router')
+
+    def available(self, name: str) -> bool:
+        """`True` if the provider may receive traffic: its circuit breaker (if any) is not open."""
+        breaker = getattr(self.providers[name], 'circuit_breaker', None)
+        return breaker is None or breaker.available
+
+    def ranked(self) -> List[str]:
+        """Provider names in the order they are tried: unmeasured, then healthy by p50, then unhealthy."""
+        def key(name: str) -> tuple:
+            stats = self.stats_by_provider[name]
+            if len(stats) < self.min_samples:
+                return (0, len(stats), 0.0)
+            if stats.error_rate > self.max_error_rate:
+                return (2, stats.error_rate, 0.0)
+            return (1, 0, stats.percentile(0.5) or float('inf'))
+        names = [name for name in self.providers if self.available(name)]
+        return sorted(names, key=key)
+
+    def _hedge_after(self, name: str) -> Optional[float]:
+        stats = self.stats_by_provider[name]
+        if self.hedge_percentile is not None and len(stats) >= self.min_samples:
+            delay = stats.percentile(self.hedge_percentile)
+            if delay is not None:
+                return delay
+        return self.hedge_delay
+
+    def _call(self, name: str, prompt: Any, kwargs: dict) -> Any:
+        """Call one provider and record its latency. An empty reply is an error."""
+        started = time.monotonic()
+        try:
+            reply = self.providers[name].ask(prompt, **kwargs)
+        except Exception:
+            self.stats_by_provider[name].record(time.monotonic() - started, False)
+            raise
+        ok = bool(reply)
+        self.stats_by_provider[name].record(time.monotonic() - started, ok)
+        if not ok:
+            raise RuntimeError(f"Empty reply of {name}")
+        return reply
+
+    def ask_routed(self, prompt: Any, **kwargs) -> tuple[Optional[str], Any]:
+        """Send `prompt` to the best provider (hedging if enabled) and fall back to the others on errors.
+
+        Args:
+            prompt (Any): The prompt.
+            **kwargs: Extra arguments for the `ask()` of the providers (`attempts`).
+
+        Returns:
+            tuple[Optional[str], Any]: Name of the provider that answered and its reply, `(None, None)` if all failed.
+        """
+        queue = self.ranked()
+        running: Dict[Future, str] = {}
+
+        def submit(hedge: bool = False) -> None:
+            name = queue.pop(0)
+            if hedge:
+                self.stats_by_provider[name].count(hedges=1)
+            running[self._executor.submit(self._call, name, prompt, kwargs)] = name
+
+        if queue:
+            submit()
+        while running:
+            # A hedge is sent if the first provider takes longer than its percentile
+            timeout = self._hedge_after(next(iter(running.values()))) if self.hedge and queue and len(running) == 1 else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                submit(hedge=True)
+                continue
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is None:
+                    self.stats_by_provider[name].count(wins=1)
+                    return name, future.result()
+                logger.warning(f"Provider {name} failed: {future.exception()}")
+            if not running and queue:
+                submit()
+        logger.error(f"No provider available or every provider failed for prompt {str(prompt)[:200]!r}")
+        return None, None
+
+    def ask(self, prompt: Any, **kwargs) -> Optional[str]:
+        """Send `prompt` through the router and return the first good reply or `None`. See `ask_routed`."""
+        return self.ask_routed(prompt, **kwargs)[1]
+
+    def ask_many(self, prompts: Iterable[Any], concurrency: Optional[int] = None, stream: bool = False, **kwargs) -> List[BatchResult] | Iterator[BatchResult]:
+        """Send many prompts in parallel through the router. See `OpenAIModel.ask_many`."""
+        concurrency = min(concurrency or self.max_concurrency, self.max_concurrency)
+        if stream:
+            return iter_ask_many(self.ask, prompts, concurrency, **kwargs)
+        return ask_many(self.ask, prompts, concurrency, **kwargs)
+
+    def stats(self) -> Dict[str, dict]:
+        """Rolling p50/p99 latency (seconds), error rate, counters and circuit state of every provider."""
+        stats = {}
+        for name, provider_stats in self.stats_by_provider.items():
+            stats[name] = provider_stats.as_dict()
+            breaker = getattr(self.providers[name], 'circuit_breaker', None)
+            stats[name]['circuit'] = breaker.state if breaker else None
+        return stats
+
+    def close(self) -> None:
+        """Stop the worker pool without waiting for the losing hedged requests."""
+        self._executor.shutdown(wait=False)